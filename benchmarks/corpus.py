@@ -0,0 +1,64 @@
+import argparse
+import os
+import random
+import string
+from itertools import accumulate
+from typing import List
+
+
+def make_vocabulary(size: int, rng: random.Random, min_length: int = 2, max_length: int = 10) -> List[str]:
+    """
+    function to draw distinct random words, shorter words first so the most frequent words are short.
+    """
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(min_length, max_length))))
+    return sorted(words, key=lambda word: (len(word), word))
+
+
+def generate_corpus(dir_path: str, files: int = 20, sentences: int = 2000, vocabulary: int = 20000,
+                    zipf: float = 1.1, min_words: int = 3, max_words: int = 15, seed: int = 0) -> List[str]:
+    """
+    function to write a synthetic corpus whose word frequencies follow Zipf's law.
+    the same arguments always write the same files.
+    :param dir_path: the directory to write the text files to (created if needed).
+    :param files: the number of files.
+    :param sentences: the number of sentences (lines) per file.
+    :param vocabulary: the number of distinct words.
+    :param zipf: the skew of the frequencies: the word of rank r is drawn with a weight of 1 / r ** zipf.
+    :param min_words: the fewest words of a sentence.
+    :param max_words: the most words of a sentence.
+    :param seed: the seed of the generator.
+    :return: the paths of the written files.
+    """
+    rng = random.Random(seed)
+    words = make_vocabulary(vocabulary, rng)
+    cum_weights = list(accumulate(1 / rank ** zipf for rank in range(1, vocabulary + 1)))
+    os.makedirs(dir_path, exist_ok=True)
+    paths = []
+    for file_id in range(files):
+        path = os.path.join(dir_path, f"{file_id:05d}.txt")
+        with open(path, 'w', encoding='utf-8') as file:
+            for _ in range(sentences):
+                sentence = rng.choices(words, cum_weights=cum_weights, k=rng.randint(min_words, max_words))
+                # capitals and punctuation, like real text, for the cleaning step to remove
+                file.write(sentence[0].capitalize() + ' ' + ' '.join(sentence[1:]) + rng.choice('..,!?') + '\n')
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic corpus with Zipf-distributed words.")
+    parser.add_argument("path", help="directory to write the text files to")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--sentences", type=int, default=2000, help="sentences per file")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="number of distinct words")
+    parser.add_argument("--zipf", type=float, default=1.1, help="skew of the word frequencies")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = generate_corpus(args.path, args.files, args.sentences, args.vocabulary, args.zipf, seed=args.seed)
+    print(f"Wrote {len(paths)} files to {args.path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import json
+import random
+import statistics
+import string
+import time
+import tracemalloc
+from typing import Dict, List
+
+from read_to_trie import read_files
+from search.search_completions import correction_candidates
+from symspell import SymSpellIndex
+from trie import Trie
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    """
+    function to apply one random letter change, addition or removal to a word.
+    """
+    position = rng.randrange(len(word))
+    letter = rng.choice(string.ascii_lowercase)
+    kind = rng.choice(('change', 'add', 'remove') if len(word) > 1 else ('change', 'add'))
+    if kind == 'change':
+        return word[:position] + letter + word[position + 1:]
+    if kind == 'add':
+        return word[:position] + letter + word[position:]
+    return word[:position] + word[position + 1:]
+
+
+def time_engine(corrector, queries: List[str], max_distance: int) -> Dict[str, float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        correction_candidates(query, corrector, max_distance)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {'mean_us': statistics.mean(latencies) * 1e6,
+            'p50_us': latencies[len(latencies) // 2] * 1e6,
+            'p99_us': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6}
+
+
+def run(trie_tree: Trie, queries: int = 2000, max_distance: int = 1, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """
+    function to compare the trie walk and the symmetric-delete index on the same misspelled words.
+    :param trie_tree: the trie of the corpus.
+    :param queries: the number of misspelled words.
+    :param max_distance: the number of edits the engines look for.
+    :param seed: the seed of the misspellings.
+    :return: build time, memory and latency of each engine.
+    """
+    rng = random.Random(seed)
+    vocabulary = list(trie_tree.words())
+    sample = [misspell(rng.choice(vocabulary), rng) for _ in range(queries)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    symspell = SymSpellIndex.from_trie(trie_tree, max_distance)
+    build_seconds = time.perf_counter() - start
+    _, symspell_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results = {
+        'trie': {'build_s': 0.0, 'memory_mb': 0.0, **time_engine(trie_tree, sample, max_distance)},
+        'symspell': {'build_s': build_seconds, 'memory_mb': symspell_peak / 2 ** 20,
+                     **time_engine(symspell, sample, max_distance)},
+    }
+    results['symspell']['variants'] = len(symspell.deletes)
+    results['trie']['words'] = results['symspell']['words'] = len(vocabulary)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the trie and SymSpell spelling correction engines.")
+    parser.add_argument("path", help="directory of the text files")
+    parser.add_argument("--queries", type=int, default=2000, help="number of misspelled words")
+    parser.add_argument("--max-distance", type=int, default=1, choices=[1, 2])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    trie_tree = Trie()
+    read_files(trie_tree, args.path, [], 0)
+    results = run(trie_tree, args.queries, args.max_distance, args.seed)
+    for engine, numbers in results.items():
+        print(engine.ljust(10), '  '.join(f"{name}={value:.2f}" if isinstance(value, float) else f"{name}={value}"
+                                          for name, value in numbers.items()))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from typing import Dict, List
+from urllib.parse import quote, urlsplit
+
+from read_to_trie import PartialIndex, iter_text_files, store_file_data
+
+
+def sample_prefixes(dir_path: str, count: int, seed: int = 0, max_files: int = 200) -> List[str]:
+    """
+    function to build queries like the ones users type: the first one to three words of a sentence of
+    the corpus, the last one cut short.
+    """
+    rng = random.Random(seed)
+    sentences = []
+    for file_path in sorted(iter_text_files(dir_path))[:max_files]:
+        sentences.extend(store_file_data(PartialIndex(), file_path, 0))
+    prefixes = []
+    for _ in range(count):
+        words = rng.choice(sentences)
+        start = rng.randrange(len(words))
+        words = words[start:start + rng.randint(1, 3)]
+        words[-1] = words[-1][:rng.randint(1, len(words[-1]))]
+        prefixes.append(' '.join(words))
+    return prefixes
+
+
+async def client(host: str, port: int, queries: asyncio.Queue, k: int, latencies: List[float],
+                 statuses: Counter) -> None:
+    # one keep-alive connection sending a request as soon as the previous answer arrived
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while not queries.empty():
+            prefix = queries.get_nowait()
+            start = time.perf_counter()
+            writer.write(f"GET /complete?q={quote(prefix)}&k={k} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+    finally:
+        writer.close()
+
+
+async def run(url: str, prefixes: List[str], concurrency: int = 32, k: int = 5) -> Dict[str, float]:
+    """
+    function to send every prefix to the server from concurrent connections and measure the latency.
+    :param url: the address of the server, like http://127.0.0.1:8080.
+    :param prefixes: the queries, each sent once.
+    :param concurrency: the number of connections.
+    :param k: the number of completions asked for.
+    :return: the throughput, the latency percentiles (in milliseconds) and the count of every status code.
+    """
+    address = urlsplit(url)
+    queries = asyncio.Queue()
+    for prefix in prefixes:
+        queries.put_nowait(prefix)
+    latencies, statuses = [], Counter()
+    start = time.perf_counter()
+    await asyncio.gather(*(client(address.hostname, address.port or 80, queries, k, latencies, statuses)
+                           for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(fraction: float) -> float:
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1e3
+
+    return {'requests': len(latencies), 'seconds': seconds, 'throughput_rps': len(latencies) / seconds,
+            'p50_ms': percentile(0.5), 'p90_ms': percentile(0.9), 'p99_ms': percentile(0.99),
+            'max_ms': latencies[-1] * 1e3, 'statuses': {str(status): count for status, count in statuses.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the completion server and report its latency and throughput.")
+    parser.add_argument("path", help="directory of the text files the queries are sampled from")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--requests", type=int, default=5000, help="number of queries")
+    parser.add_argument("--concurrency", type=int, default=32, help="number of connections")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    prefixes = sample_prefixes(args.path, args.requests, args.seed)
+    results = asyncio.run(run(args.url, prefixes, args.concurrency, args.k))
+    print('  '.join(f"{name}={value:.2f}" if isinstance(value, float) else f"{name}={value}"
+                    for name, value in results.items()))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
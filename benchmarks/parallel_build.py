@@ -0,0 +1,70 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Sequence
+
+from benchmarks.corpus import generate_corpus
+from compact_trie import TRIE_BACKENDS
+from read_to_trie import read_files, read_files_parallel
+from sentence_store import TokenSentenceStore
+
+
+def time_build(dir_path: str, backend: str, workers: int) -> Dict[str, float]:
+    """
+    function to time one build of a corpus, sequential when workers is 0.
+    the CPU seconds are the ones of this process only: with workers, the serial merge of their batches.
+    """
+    trie_tree, data_list = TRIE_BACKENDS[backend](), TokenSentenceStore()
+    start, start_cpu = time.perf_counter(), time.process_time()
+    if workers:
+        read_files_parallel(trie_tree, dir_path, data_list, workers, 0)
+    else:
+        read_files(trie_tree, dir_path, data_list, 0)
+    return {'build_s': time.perf_counter() - start, 'parent_cpu_s': time.process_time() - start_cpu}
+
+
+def run(dir_path: str, backend: str = 'nodes', workers: Sequence[int] = (1, 2, 4, 8)) -> Dict[str, Dict[str, float]]:
+    """
+    function to compare the sequential build of a corpus with builds by several numbers of workers.
+    :param dir_path: the directory of the text files.
+    :param backend: the trie implementation, one of TRIE_BACKENDS.
+    :param workers: the numbers of worker processes.
+    :return: the build time of every run, its speedup over the sequential build and the share of the
+     sequential build time the parent process spent merging, which bounds the speedup.
+    """
+    sequential = time_build(dir_path, backend, 0)
+    results = {'sequential': sequential}
+    for count in workers:
+        result = time_build(dir_path, backend, count)
+        result['speedup'] = sequential['build_s'] / result['build_s']
+        result['serial_share'] = result['parent_cpu_s'] / sequential['parent_cpu_s']
+        results[f'workers={count}'] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how the build scales with --workers.")
+    parser.add_argument("--corpus", help="directory of text files to use instead of a generated corpus")
+    parser.add_argument("--files", type=int, default=64)
+    parser.add_argument("--sentences", type=int, default=4000, help="sentences per file")
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument("--trie", choices=sorted(TRIE_BACKENDS), default="nodes")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir_path = args.corpus or temp_dir
+        if not args.corpus:
+            generate_corpus(dir_path, files=args.files, sentences=args.sentences)
+        results = run(dir_path, args.trie, args.workers)
+    print(f"{os.cpu_count()} CPUs")
+    for name, metrics in results.items():
+        print(name.ljust(12), '  '.join(f"{metric}={value:.2f}" for metric, value in metrics.items()))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Sequence
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.correction_benchmark import misspell
+from benchmarks.load_test import sample_prefixes
+from compact_trie import TRIE_BACKENDS
+from read_to_trie import read_files
+from search.search_completions import (compare_indexes, filter_by_indexes, find_error_correction,
+                                       get_best_k_completion)
+from sentence_store import TokenSentenceStore
+
+# the metrics compared with a baseline: lower is better for all of them
+COMPARED_METRICS = ('build_s', 'peak_mb', 'mean_us', 'p50_us')
+
+
+def measure(function: Callable, inputs: Sequence) -> Dict[str, float]:
+    """
+    function to time a function on every input.
+    :param function: the function, called with each input unpacked as its arguments.
+    :param inputs: the argument tuples.
+    :return: the number of calls and the mean, median and 99th percentile latency in microseconds.
+    """
+    latencies = []
+    gc.collect()  # not in the middle of the calls, for the garbage of the previous benchmark
+    for arguments in inputs:
+        start = time.perf_counter()
+        function(*arguments)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {'ops': len(latencies), 'mean_us': statistics.mean(latencies) * 1e6,
+            'p50_us': latencies[len(latencies) // 2] * 1e6,
+            'p99_us': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6}
+
+
+def build(dir_path: str, backend: str, memory: bool = False) -> Dict:
+    """
+    function to read a corpus into a new trie, timed or (much slower) with its peak memory traced.
+    """
+    trie_tree, data_list = TRIE_BACKENDS[backend](), TokenSentenceStore()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    read_files(trie_tree, dir_path, data_list, 0)
+    seconds = time.perf_counter() - start
+    result = {'trie': trie_tree, 'data_list': data_list, 'build_s': seconds}
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result.update(index_mb=current / 2 ** 20, peak_mb=peak / 2 ** 20)
+    return result
+
+
+def run(dir_path: str, backend: str = 'nodes', queries: int = 1000, seed: int = 0, memory: bool = True) -> Dict:
+    """
+    function to run every benchmark on a corpus.
+    :param dir_path: the directory of the text files.
+    :param backend: the trie implementation, one of TRIE_BACKENDS.
+    :param queries: the number of queries of each benchmark.
+    :param seed: the seed of the queries.
+    :param memory: also build the index under tracemalloc to report its memory.
+    :return: the results of each benchmark.
+    """
+    rng = random.Random(seed)
+    built = build(dir_path, backend)
+    trie_tree, data_list = built['trie'], built['data_list']
+    results = {'build': {'build_s': built['build_s'], 'files': len(data_list),
+                         'sentences': sum(map(len, data_list)), 'words': sum(1 for _ in trie_tree.words())}}
+    if memory:
+        traced = build(dir_path, backend, memory=True)
+        results['build'].update(index_mb=traced['index_mb'], peak_mb=traced['peak_mb'])
+
+    sentences = [sentence for file_lines in data_list for sentence in file_lines]
+    # words drawn from the text, so they follow the word frequencies of the corpus
+    words = [rng.choice(rng.choice(sentences)) for _ in range(queries)]
+    phrases = []
+    while len(phrases) < queries:
+        sentence = rng.choice(sentences)
+        length = rng.randint(2, 3)
+        if len(sentence) >= length:
+            start = rng.randrange(len(sentence) - length + 1)
+            phrases.append([trie_tree.search(word) for word in sentence[start:start + length]])
+
+    fresh = TRIE_BACKENDS[backend]()
+    results['insert'] = measure(fresh.insert, [(word, 0, index, 0) for index, word in enumerate(words)])
+    results['search'] = measure(trie_tree.search, [(word,) for word in words])
+    results['compare_indexes'] = measure(compare_indexes, [phrase[:2] for phrase in phrases])
+    results['filter_by_indexes'] = measure(filter_by_indexes, [(phrase,) for phrase in phrases])
+    results['find_error_correction'] = measure(
+        find_error_correction, [(misspell(word, rng), [], trie_tree, 5) for word in words if len(word) > 1])
+    prefixes = sample_prefixes(dir_path, queries, seed)
+    results['get_best_k_completion'] = measure(get_best_k_completion,
+                                               [(prefix, trie_tree, data_list, 5) for prefix in prefixes])
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = 0.2) -> List[str]:
+    """
+    function to find the metrics that got worse than a baseline.
+    :param results: the results of run.
+    :param baseline: earlier results of run, on the same corpus and machine.
+    :param tolerance: the relative increase tolerated (0.2 is 20% slower or bigger).
+    :return: a description of every regression.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric in COMPARED_METRICS:
+            old = baseline.get(name, {}).get(metric)
+            new = metrics.get(metric)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {old:.2f} -> {new:.2f} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the index on a synthetic corpus.")
+    parser.add_argument("--corpus", help="directory of text files to use instead of a generated corpus")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--sentences", type=int, default=2000, help="sentences per file")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="number of distinct words")
+    parser.add_argument("--zipf", type=float, default=1.1, help="skew of the word frequencies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=1000, help="queries of each benchmark")
+    parser.add_argument("--trie", choices=sorted(TRIE_BACKENDS), default="nodes")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) traced build")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="results file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    corpus = {'files': args.files, 'sentences': args.sentences, 'vocabulary': args.vocabulary, 'zipf': args.zipf,
+              'seed': args.seed}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        dir_path = args.corpus or temp_dir
+        if not args.corpus:
+            generate_corpus(dir_path, **corpus)
+        results = run(dir_path, args.trie, args.queries, args.seed, not args.no_memory)
+    for name, metrics in results.items():
+        print(name.ljust(22), '  '.join(f"{metric}={value:.2f}" if isinstance(value, float) else f"{metric}={value}"
+                                        for metric, value in metrics.items()))
+    report = {'python': sys.version.split()[0], 'platform': platform.platform(), 'trie': args.trie,
+              'queries': args.queries, 'corpus': args.corpus or corpus, 'results': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file)['results'], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
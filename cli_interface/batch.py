@@ -0,0 +1,154 @@
+import argparse
+import json
+import multiprocessing
+import re
+import sys
+import time
+from itertools import islice
+from typing import Iterable, Iterator, List, TextIO
+
+import dotenv
+from cli_interface.cli import PATTERN, init
+from compact_trie import TRIE_BACKENDS
+from search.worker_pool import complete_prefix, init_worker
+from sentence_store import SENTENCE_STORES
+from symspell import SymSpellIndex
+from trie import Trie
+
+# queries handed to the pool at a time: the output stays in order and the input is never read far ahead
+WINDOW_PER_WORKER = 1024
+
+# the number of completions of the batch a worker process is answering
+_batch_k = 5
+
+
+def complete_line(line: str, k: int = 5) -> str:
+    """
+    function to answer one query line of a batch with the index of this process.
+    :param line: the query, as the user typed it.
+    :param k: number of the completions.
+    :return: the JSON line of the answer (an empty query gets no completions).
+    """
+    query = line.rstrip('\n')
+    prefix = re.sub(PATTERN, '', query).lower().strip()
+    completions = complete_prefix(prefix, k) if prefix else []
+    return json.dumps({'query': query, 'prefix': prefix, 'completions': completions})
+
+
+def _complete_chunk(chunk: List[str]) -> List[str]:
+    return [complete_line(line, _batch_k) for line in chunk]
+
+
+def _init_batch_worker(trie_tree: Trie, data_list: List, corrector, k: int) -> None:
+    global _batch_k
+    init_worker(trie_tree, data_list, corrector)
+    _batch_k = k
+
+
+def run_batch(queries: Iterable[str], output: TextIO, trie_tree: Trie, data_list: List, k: int = 5,
+              workers: int = 1, corrector=None, chunk_size: int = 64, progress: TextIO = None,
+              progress_interval: float = 5.0) -> int:
+    """
+    function to answer a stream of queries, writing one JSON line per query in the order of the queries.
+    the queries are answered by a pool of processes forked after the index was loaded, so the trie and the
+    sentences are shared with the workers copy-on-write instead of being pickled to each of them.
+    :param queries: the query lines (a file or stdin), read as they are needed.
+    :param output: where the JSON lines are written.
+    :param trie_tree: the trie tree of the database.
+    :param data_list: list of the sentences.
+    :param k: number of the completions of each query.
+    :param workers: the number of processes (0 answers the queries in this process).
+    :param corrector: the engine that finds spelling corrections. default: the trie tree itself.
+    :param chunk_size: the number of queries sent to a worker at a time.
+    :param progress: where the progress and the throughput are reported (default: not reported).
+    :param progress_interval: the number of seconds between two progress reports.
+    :return: the number of queries answered.
+    """
+    start = last_report = time.perf_counter()
+    answered = 0
+    queries = iter(queries)
+    if workers > 0:
+        pool = multiprocessing.get_context('fork').Pool(workers, _init_batch_worker,
+                                                        (trie_tree, data_list, corrector, k))
+        window_size = workers * WINDOW_PER_WORKER
+        chunk_map = pool.imap
+    else:
+        pool = None
+        _init_batch_worker(trie_tree, data_list, corrector, k)
+        window_size = chunk_size
+        chunk_map = map
+    try:
+        for window in _windows(queries, window_size, chunk_size):
+            for answer in (line for lines in chunk_map(_complete_chunk, window) for line in lines):
+                output.write(answer)
+                output.write('\n')
+                answered += 1
+            now = time.perf_counter()
+            if progress is not None and now - last_report >= progress_interval:
+                last_report = now
+                print(f"{answered} queries, {answered / (now - start):.0f} queries/s", file=progress)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if progress is not None:
+        seconds = time.perf_counter() - start
+        print(f"Done: {answered} queries in {seconds:.1f} s, {answered / max(seconds, 1e-9):.0f} queries/s",
+              file=progress)
+    return answered
+
+
+def _windows(queries: Iterator[str], window_size: int, chunk_size: int) -> Iterator[List[List[str]]]:
+    # the next window_size queries, split in chunks of chunk_size
+    while True:
+        window = list(islice(queries, window_size))
+        if not window:
+            return
+        yield [window[index:index + chunk_size] for index in range(0, len(window), chunk_size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of queries, one JSON line per query.")
+    parser.add_argument("path", nargs="?", help="directory of the text files (default: PATH_TO_DATA from .env)")
+    parser.add_argument("--input", default="-", help="file of queries, one per line (default: stdin)")
+    parser.add_argument("--output", default="-", help="JSON lines file to write (default: stdout)")
+    parser.add_argument("-k", type=int, default=5, help="number of completions of each query")
+    parser.add_argument("--trie", choices=sorted(TRIE_BACKENDS), default="nodes",
+                        help="trie implementation used for the index")
+    parser.add_argument("--snapshot", help="index snapshot file to load, (re)built when missing or out of date")
+    parser.add_argument("--workers", type=int, default=1, metavar="N", help="number of processes reading the files")
+    parser.add_argument("--lookup-workers", type=int, default=multiprocessing.cpu_count(), metavar="N",
+                        help="number of processes answering the queries (0 answers them in this process)")
+    parser.add_argument("--chunk-size", type=int, default=64, metavar="N",
+                        help="number of queries sent to a lookup worker at a time")
+    parser.add_argument("--corrector", choices=["trie", "symspell"], default="trie",
+                        help="spelling correction engine: walk the trie, or look up a symmetric-delete index")
+    parser.add_argument("--top-k", type=int, default=0, metavar="K",
+                        help="precompute the best K completions of short prefixes")
+    parser.add_argument("--top-k-depth", type=int, default=4, metavar="D",
+                        help="longest prefix (in letters) whose completions are precomputed")
+    parser.add_argument("--store", choices=sorted(SENTENCE_STORES), default="tokens",
+                        help="keep the sentences as word ids in memory, or only their byte offsets in the source "
+                             "files, read back when they are shown")
+    args = parser.parse_args()
+    path = args.path or dotenv.get_key(dotenv.find_dotenv(), "PATH_TO_DATA")
+    # the banner goes to stderr with the progress, stdout may be the results
+    stdout, sys.stdout = sys.stdout, sys.stderr
+    trie_tree, data_list = init(path, args.trie, False, args.snapshot, args.workers, None, args.top_k,
+                                args.top_k_depth, args.store)
+    sys.stdout = stdout
+    corrector = SymSpellIndex.from_trie(trie_tree) if args.corrector == "symspell" else None
+    queries = sys.stdin if args.input == "-" else open(args.input, 'r', encoding='utf-8')
+    output = sys.stdout if args.output == "-" else open(args.output, 'w', encoding='utf-8')
+    try:
+        run_batch(queries, output, trie_tree, data_list, args.k, args.lookup_workers, corrector, args.chunk_size,
+                  sys.stderr)
+    finally:
+        if queries is not sys.stdin:
+            queries.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
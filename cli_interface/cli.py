@@ -1,12 +1,21 @@
 import argparse
 import re
-import sys
+import threading
+import time
 from typing import List, Union
 
 import dotenv
-from read_to_trie import read_files
+from compact_trie import TRIE_BACKENDS
+from index_updates import IndexUpdater, IndexWatcher
+from instrumentation import METRICS
+from read_to_trie import read_files, read_files_parallel
+from search.cache import CompletionCache
 from search.data_utils import AutoCompleteData
-from search.search_completions import get_best_k_completion
+from search.session import CompletionSession
+from search.shards import PARTITIONS, ShardedIndex
+from sentence_store import SENTENCE_STORES, OffsetSentenceStore, TokenSentenceStore
+from snapshot import SnapshotError, open_snapshot, source_fingerprint, write_snapshot
+from symspell import SymSpellIndex
 from trie import Trie
 
 PATTERN = r'[^a-zA-Z0-9\s]'
@@ -36,36 +45,159 @@ def user_input():
     return string
 
 
-def init_db ( path_to_data: str ) -> (Trie, List[str]):
+def init_db ( path_to_data: str, trie_backend: str = 'nodes', snapshot_path: str = None,
+              workers: int = 1, file_paths: List[str] = None, sentence_store: str = 'tokens',
+              compress_postings: bool = False ) -> (Trie, List[str]):
     """
     Initialize the database with the data from the files and return the trie and the data list
+    :param path_to_data: the directory of the text files.
+    :param trie_backend: the trie implementation to build, one of TRIE_BACKENDS ('nodes' or 'compact').
+    :param snapshot_path: a snapshot file to map instead of reading the files. If it is missing or
+     the files changed since it was written, the database is rebuilt and the snapshot rewritten.
+    :param workers: the number of processes reading the files.
+    :param file_paths: if given, filled with the path of every file id (not available from a snapshot).
+    :param sentence_store: how the sentences are kept, one of SENTENCE_STORES: 'tokens' (word ids in memory)
+     or 'offsets' (byte ranges read back from the source files).
+    :param compress_postings: write the posting lists of a rebuilt snapshot compressed.
     :return: trie tree of the words, data list of the files.
     """
-    trie_tree = Trie()
-    data_list = []
-    read_files(trie_tree, path_to_data, data_list, 0)
+    if snapshot_path:
+        try:
+            return open_snapshot(snapshot_path, path_to_data)
+        except SnapshotError as error:
+            print(f"Rebuilding the database: {error}")
+    # the files as they were before they are read: one changed while it is read makes the snapshot out of date
+    fingerprint = source_fingerprint(path_to_data) if snapshot_path else None
+    trie_tree = TRIE_BACKENDS[trie_backend]()
+    data_list = SENTENCE_STORES[sentence_store]()
+    if workers > 1:
+        read_files_parallel(trie_tree, path_to_data, data_list, workers, 0, file_paths)
+    else:
+        read_files(trie_tree, path_to_data, data_list, 0, file_paths)
+    if snapshot_path:
+        write_snapshot(trie_tree, data_list, snapshot_path, path_to_data, compress_postings, fingerprint)
     return trie_tree, data_list
 
 
-def init ( path_to_data: str ):
+def init ( path_to_data: str, trie_backend: str = 'nodes', memory_report: bool = False, snapshot_path: str = None,
+           workers: int = 1, watch_interval: float = None, top_k: int = 0, top_k_depth: int = 4,
+           sentence_store: str = 'tokens', bigrams: int = 0, compress_postings: bool = False,
+           update_lock: threading.RLock = None ):
     """
     Initialize the search engine and return the trie and the data list.
+    :param path_to_data: the directory of the text files.
+    :param trie_backend: the trie implementation to build.
+    :param memory_report: print the estimated memory used by the trie and the sentences.
+    :param snapshot_path: a snapshot file to load the database from (see init_db).
+    :param workers: the number of processes reading the files.
+    :param watch_interval: if given, poll the directory every that many seconds and update the database
+     with the files that were added, modified or deleted.
+    :param top_k: if given, precompute the best top_k completions of every prefix up to top_k_depth letters.
+    :param top_k_depth: the longest prefix whose completions are precomputed.
+    :param sentence_store: how the sentences are kept, one of SENTENCE_STORES.
+    :param bigrams: if given, index the locations of the pairs of adjacent words seen at least that many times.
+    :param compress_postings: keep the long posting lists in compressed blocks.
+    :param update_lock: the lock held while the watched changes are applied, for the queries to hold too.
     :return: trie tree of the words, data list of the files.
     """
     print("Welcome to the search engine!")
     print("Loading the database...")
-    trie_tree, data_list = init_db(path_to_data)
+    file_paths = []
+    start = time.perf_counter()
+    with METRICS.timer('build'):
+        trie_tree, data_list = init_db(path_to_data, trie_backend, snapshot_path, workers, file_paths,
+                                       sentence_store, compress_postings)
+    seconds = time.perf_counter() - start
+    if isinstance(data_list, TokenSentenceStore):
+        words = data_list.token_count()
+        print(f"Loaded {words} words in {seconds:.1f} s ({words / max(seconds, 1e-9):.0f} words/s).")
+    if top_k:
+        trie_tree.build_top_k(top_k, top_k_depth)
+    if bigrams:
+        trie_tree.build_bigrams(data_list, bigrams)
+    if compress_postings:
+        trie_tree.compress_postings()
+    if watch_interval:
+        # once the index is complete, as the updates change it from another thread
+        IndexWatcher(IndexUpdater(trie_tree, data_list, file_paths, update_lock), path_to_data,
+                     watch_interval).start()
+    if METRICS.enabled:
+        METRICS.set_gauges('index', trie_tree.index_stats())
+    if memory_report:
+        print(f"The {trie_backend} trie uses about {trie_tree.memory_usage() / 2 ** 20:.1f} MB.")
+        if isinstance(data_list, (TokenSentenceStore, OffsetSentenceStore)):
+            print(f"The sentences use about {data_list.memory_usage() / 2 ** 20:.1f} MB.")
+        if bigrams:
+            stats = trie_tree.bigram_stats()
+            print(f"The {stats['bigrams']} word pairs use about {stats['bigram_bytes'] / 2 ** 20:.1f} MB.")
     print("The search engine is ready to use!")
     return trie_tree, data_list
 
 
 def main():
     parser = argparse.ArgumentParser(description="CLI interface for the project.")
-    if len(sys.argv) > 1:
-        path = sys.argv[1]
+    parser.add_argument("path", nargs="?", help="directory of the text files (default: PATH_TO_DATA from .env)")
+    parser.add_argument("--trie", choices=sorted(TRIE_BACKENDS), default="nodes",
+                        help="trie implementation used for the index")
+    parser.add_argument("--memory-report", action="store_true", help="print the memory used by the trie")
+    parser.add_argument("--snapshot", help="index snapshot file to load, (re)built when missing or out of date")
+    parser.add_argument("--workers", type=int, default=1, metavar="N", help="number of processes reading the files")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="poll the directory and apply added, modified and deleted files to the database")
+    parser.add_argument("--cache-size", type=int, default=4096, metavar="N",
+                        help="number of query results kept in the LRU cache (0 disables it)")
+    parser.add_argument("--corrector", choices=["trie", "symspell"], default="trie",
+                        help="spelling correction engine: walk the trie, or look up a symmetric-delete index")
+    parser.add_argument("--top-k", type=int, default=0, metavar="K",
+                        help="precompute the best K completions of short prefixes")
+    parser.add_argument("--top-k-depth", type=int, default=4, metavar="D",
+                        help="longest prefix (in letters) whose completions are precomputed")
+    parser.add_argument("--bigrams", type=int, default=0, metavar="MIN_COUNT",
+                        help="index the locations of the pairs of adjacent words seen at least MIN_COUNT times")
+    parser.add_argument("--compress-postings", action="store_true",
+                        help="keep the long posting lists as compressed blocks, decoded as they are searched")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="record stage timings and counters and write them to FILE on exit "
+                             "(JSON if it ends with .json, Prometheus text otherwise)")
+    parser.add_argument("--shards", type=int, default=0, metavar="N",
+                        help="split the index by file between N processes and merge their completions")
+    parser.add_argument("--partition", choices=PARTITIONS, default="range",
+                        help="how the files are split between the shards: contiguous ranges or by hash")
+    parser.add_argument("--store", choices=sorted(SENTENCE_STORES), default="tokens",
+                        help="keep the sentences as word ids in memory, or only their byte offsets in the source "
+                             "files, read back when they are shown")
+    args = parser.parse_args()
+    if args.metrics:
+        METRICS.enable()
+    if args.watch and args.snapshot:
+        parser.error("--watch cannot update a database loaded from --snapshot")
+    if args.shards and (args.watch or args.snapshot):
+        parser.error("--shards cannot be combined with --watch or --snapshot")
+    if args.watch and args.store == "offsets":
+        parser.error("--watch cannot update the sentences located by --store offsets")
+    path = args.path or dotenv.get_key(dotenv.find_dotenv(), "PATH_TO_DATA")
+    if args.shards:
+        print("Welcome to the search engine!")
+        print(f"Loading the database in {args.shards} shards...")
+        sharded_index = ShardedIndex.start(path, args.shards, args.partition, args.trie, args.corrector, args.top_k,
+                                           args.top_k_depth, args.store, args.bigrams,
+                                           args.compress_postings)
+        complete = sharded_index.complete
     else:
-        path = dotenv.get_key(dotenv.find_dotenv(), "PATH_TO_DATA")
-    trie_tree, data_list = init(path)
+        sharded_index = None
+        update_lock = threading.RLock()
+        trie_tree, data_list = init(path, args.trie, args.memory_report, args.snapshot, args.workers, args.watch,
+                                    args.top_k, args.top_k_depth, args.store, args.bigrams, args.compress_postings,
+                                    update_lock)
+        cache = CompletionCache(args.cache_size)
+        corrector = SymSpellIndex.from_trie(trie_tree) if args.corrector == "symspell" else None
+        # a text that continues the previous one (or deletes its end) reuses the trie walk of their common part
+        session = CompletionSession(trie_tree, data_list, corrector, cache)
+
+        def complete(prefix: str, k: int) -> List[AutoCompleteData]:
+            with update_lock:
+                session.set_text(prefix)
+                return session.complete(k)
     print("This is a search engine for auto complete sentences.")
     print("Enter your text and get the best 5 auto complete sentences.")
     print("don't worry about spelling mistakes or lower/upper case, we will take care of it.")
@@ -78,11 +210,15 @@ def main():
         if string == "exit":
             break
         else:
-            res: List[AutoCompleteData] = get_best_k_completion(string, trie_tree, data_list, 5)
+            res: List[AutoCompleteData] = complete(string, 5)
             for index in range(len(res)):
                 print(
                     f"{index + 1}. {' '.join(res[index].completed_sentence)}. ({res[index].source_text},"
                     f" {res[index].offset})")
+    if sharded_index is not None:
+        sharded_index.close()
+    if args.metrics:
+        METRICS.dump(args.metrics)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+import sys
+from array import array
+from collections import deque
+from typing import Dict, Iterator, List, Tuple, Union
+
+from postings import PostingList
+from trie import NUM_OF_CHARS, Trie
+
+FREE = -1
+ROOT = 0
+MAX_BASE_TRIALS = 16
+
+
+class CompactTrie(Trie):
+    """
+    CompactTrie is a double-array trie with the same interface as Trie.
+
+    Nodes are integer slots in two flat arrays: the child of node `s` for letter code `c` lives at
+    `base[s] + c` and is valid only if `check[base[s] + c] == s`. This replaces the 36-slot
+    children list of every TrieNode with two machine integers per slot.
+    """
+
+    def __init__(self, initial_size: int = 1024):
+        self.base = array('i', [0] * initial_size)
+        self.check = array('i', [FREE] * initial_size)
+        self.end = bytearray(initial_size)
+        self.used = bytearray(initial_size)
+        self.word_locations: Dict[int, PostingList] = {}
+        self.check[ROOT] = ROOT
+        self.used[ROOT] = 1
+        self.root = ROOT
+        self._free_hint = 1
+        self._search_start = 1
+
+    @classmethod
+    def from_trie(cls, trie: Trie) -> 'CompactTrie':
+        """
+        Builds a CompactTrie holding the same words and locations as the given trie.
+
+        Every node's children are placed with a single base search, so no relocation is needed.
+        """
+        compact = cls()
+        queue = deque([(trie.root, compact.root)])
+        while queue:
+            node, slot = queue.popleft()
+            if trie.is_word(node):
+                compact.end[slot] = 1
+                compact.word_locations[slot] = PostingList(array('Q', trie.locations(node).keys))
+            children = list(trie.children(node))
+            if children:
+                base = compact._find_base([index + 1 for index, _ in children])
+                compact.base[slot] = base
+                for index, child in children:
+                    compact._claim(base + index + 1, slot)
+                    queue.append((child, base + index + 1))
+        return compact
+
+    def child(self, node: int, index: int) -> Union[int, None]:
+        """
+        Returns the slot of the child of the given node at the given letter index, or None.
+        """
+        slot = self.base[node] + index + 1
+        if slot < len(self.check) and self.check[slot] == node:
+            return slot
+        return None
+
+    def children(self, node: int) -> Iterator[Tuple[int, int]]:
+        """
+        Iterates over the existing children of the given node as (letter index, slot) pairs.
+        """
+        base = self.base[node]
+        check = self.check
+        size = len(check)
+        for index in range(NUM_OF_CHARS):
+            slot = base + index + 1
+            if slot < size and check[slot] == node:
+                yield index, slot
+
+    def is_word(self, node: int) -> bool:
+        """
+        Returns True if the given slot marks the end of a word.
+        """
+        return bool(self.end[node])
+
+    def locations(self, node: int) -> PostingList:
+        """
+        Returns the word locations stored on the given slot.
+        """
+        locations = self.word_locations.get(node)
+        return locations if locations is not None else PostingList()
+
+    def _word_postings(self, key: str) -> PostingList:
+        """
+        Returns the posting list of the given word, creating its slots and marking its end if needed.
+        """
+        p_crawl = self.root
+        for level in key:
+            index = self.char_to_index(level)
+            slot = self.child(p_crawl, index)
+            if slot is None:
+                slot = self._add_child(p_crawl, index)
+            p_crawl = slot
+
+        # Mark the last slot as the end of the word
+        self.end[p_crawl] = 1
+        locations = self.word_locations.get(p_crawl)
+        if locations is None:
+            locations = self.word_locations[p_crawl] = PostingList()
+        return locations
+
+    def _unmark_word(self, node: int) -> None:
+        self.end[node] = 0
+        self.word_locations.pop(node, None)
+
+    def index_stats(self) -> Dict[str, int]:
+        """
+        Counts the nodes, words and stored locations of the CompactTrie and the bytes of each structure.
+
+        Returns:
+            Dict[str, int]: nodes, words and postings, base_bytes, check_bytes, flag_bytes (the end
+            and used flags) and posting_bytes (the posting lists and their dictionary).
+        """
+        posting_bytes = sys.getsizeof(self.word_locations)
+        postings = 0
+        for locations in self.word_locations.values():
+            posting_bytes += sys.getsizeof(locations) + sys.getsizeof(locations.keys)
+            postings += len(locations)
+        return {'nodes': self.used.count(1), 'words': len(self.word_locations), 'postings': postings,
+                'base_bytes': self.base.buffer_info()[1] * self.base.itemsize,
+                'check_bytes': self.check.buffer_info()[1] * self.check.itemsize,
+                'flag_bytes': len(self.end) + len(self.used), 'posting_bytes': posting_bytes}
+
+    def _add_child(self, node: int, index: int) -> int:
+        """
+        Creates the child of the given node for the given letter index, relocating the node's
+        existing children if the target slot is already taken.
+        """
+        code = index + 1
+        if self.base[node] == 0 and next(self.children(node), None) is None:
+            self.base[node] = self._find_base([code])
+        slot = self.base[node] + code
+        self._ensure_size(slot + 1)
+        if self.used[slot]:
+            self._relocate(node, code)
+            slot = self.base[node] + code
+        self._claim(slot, node)
+        return slot
+
+    def _relocate(self, node: int, new_code: int) -> None:
+        """
+        Moves all children of the given node to a new base that also has room for new_code.
+        """
+        old_base = self.base[node]
+        codes = [index + 1 for index, _ in self.children(node)]
+        new_base = self._find_base(codes + [new_code])
+        for code in codes:
+            old_slot = old_base + code
+            new_slot = new_base + code
+            self._claim(new_slot, node)
+            self.base[new_slot] = self.base[old_slot]
+            self.end[new_slot] = self.end[old_slot]
+            if old_slot in self.word_locations:
+                self.word_locations[new_slot] = self.word_locations.pop(old_slot)
+            # re-parent the grandchildren before freeing the old slot
+            for _, grandchild in self.children(old_slot):
+                self.check[grandchild] = new_slot
+            self._release(old_slot)
+        self.base[node] = new_base
+
+    def _find_base(self, codes: List[int]) -> int:
+        """
+        Finds a base for which every slot base + code is free.
+
+        Single children fill the lowest free slot. Larger sibling sets start from a moving search
+        position that skips past regions where too many free slots failed to fit, so holes that
+        are too small are not rescanned on every relocation.
+        """
+        first = min(codes)
+        last = max(codes)
+        start = self._free_hint if len(codes) == 1 else max(self._free_hint, self._search_start)
+        slot = max(start, first)
+        trials = deque(maxlen=MAX_BASE_TRIALS)
+        while True:
+            # jump straight to the next free slot for the smallest code, then verify the others
+            slot = self.used.find(0, slot)
+            if slot == -1:
+                slot = len(self.used)
+                self._ensure_size(slot + 1)
+            base = slot - first
+            self._ensure_size(base + last + 1)
+            if all(not self.used[base + code] for code in codes):
+                if len(trials) == MAX_BASE_TRIALS:
+                    self._search_start = trials[0]
+                return base
+            trials.append(slot)
+            slot += 1
+
+    def _claim(self, slot: int, parent: int) -> None:
+        self._ensure_size(slot + 1)
+        self.check[slot] = parent
+        self.base[slot] = 0
+        self.end[slot] = 0
+        self.used[slot] = 1
+        if slot == self._free_hint:
+            self._free_hint = self.used.find(0, slot)
+            if self._free_hint == -1:
+                self._free_hint = len(self.used)
+
+    def _release(self, slot: int) -> None:
+        self.check[slot] = FREE
+        self.base[slot] = 0
+        self.end[slot] = 0
+        self.used[slot] = 0
+        self._free_hint = min(self._free_hint, slot)
+
+    def _ensure_size(self, size: int) -> None:
+        current = len(self.check)
+        if size <= current:
+            return
+        grow = max(size, current * 2) - current
+        self.base.extend([0] * grow)
+        self.check.extend([FREE] * grow)
+        self.end.extend(bytes(grow))
+        self.used.extend(bytes(grow))
+
+
+TRIE_BACKENDS = {
+    'nodes': Trie,
+    'compact': CompactTrie,
+}
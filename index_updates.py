@@ -0,0 +1,189 @@
+import os
+import threading
+import warnings
+from typing import Dict, Iterable, List, Tuple, Union
+
+from postings import file_key_range
+from read_to_trie import PartialIndex, file_fits, iter_text_files, store_file_data
+from trie import Trie
+
+
+class IndexUpdater:
+    """
+    IndexUpdater applies file additions, modifications and deletions to a built index in place.
+
+    It works on the trie, the data list and the list of file paths filled by read_files. A file keeps
+    its id for as long as it exists: a modified file is re-read under the same id, a deleted file
+    leaves an empty slot in the data list, and a new file gets the next free id.
+
+    The sentences of a file are stored before the trie points to them and the trie stops pointing to them
+    before they are dropped, so a query never finds a location whose sentence is missing. The trie and the
+    data list are still changed in place, so the queries that run while updates are applied (like with an
+    IndexWatcher) should hold the lock of the updates too. It is only held while the index changes: the files
+    are read before. A top_k table built before is built again after the changes, with the same parameters,
+    once the lock is released, as the trie stops using it once it changed, and the indexed pairs of words are
+    updated for the changed files (see Trie.update_bigrams).
+    """
+
+    def __init__(self, trie: Trie, data_list: List, file_paths: List[Union[str, None]],
+                 lock: threading.RLock = None):
+        self.trie = trie
+        self.data_list = data_list
+        self.file_paths = file_paths
+        self.file_ids: Dict[str, int] = {_normalize(path): file_id for file_id, path in enumerate(file_paths)
+                                         if path is not None}
+        self.lock = lock if lock is not None else threading.RLock()
+        # the updates are applied one at a time, the lock of the queries is only held while the index changes
+        self._update_lock = threading.Lock()
+
+    def update(self, changed_paths: Iterable[str], failed: List[str] = None) -> Tuple[int, int, int]:
+        """
+        Brings the index up to date with the current content of the given files.
+
+        A file that cannot be read (removed while it is read, not UTF-8, ...) is left as it was indexed,
+        with a warning, and the other files are still updated.
+        :param changed_paths: paths of text files that were added, modified or deleted.
+        :param failed: a list the paths of the files that could not be read are appended to.
+        :return: the number of added, modified and deleted files.
+        """
+        added = modified = deleted = 0
+        with self._update_lock:
+            # the files are read before the lock of the queries is taken, so they are not held up meanwhile
+            loaded = {}
+            for path in sorted(set(map(_normalize, changed_paths))):
+                exists = os.path.isfile(path)
+                if path not in self.file_ids and not (exists and path.endswith(".txt")):
+                    continue
+                if not exists:
+                    loaded[path] = None
+                    continue
+                # a file that cannot be read changes nothing
+                try:
+                    loaded[path] = self._load_file(path)
+                except (OSError, ValueError) as error:
+                    warnings.warn(f"{path} is not updated: {error}")
+                    if failed is not None:
+                        failed.append(path)
+            changes = []
+            with self.lock:
+                # the pairs are only kept up to date while they are, not brought back after other changes
+                bigrams = self.trie.bigram_table is not None and self.trie.bigram_version == self.trie.version
+                for path, content in loaded.items():
+                    file_id = self.file_ids.get(path)
+                    if file_id is None:
+                        if self._add_file(path, *content):
+                            added += 1
+                            changes.append((self.file_ids[path], [], content[1]))
+                    elif content is not None:
+                        old_sentences = self.data_list[file_id]
+                        self._remove_file(file_id)
+                        self._store_file(file_id, *content)
+                        modified += 1
+                        changes.append((file_id, old_sentences, content[1]))
+                    else:
+                        old_sentences = self.data_list[file_id]
+                        self._remove_file(file_id)
+                        self.file_paths[file_id] = None
+                        del self.file_ids[path]
+                        deleted += 1
+                        changes.append((file_id, old_sentences, []))
+                if changes and bigrams:
+                    self.trie.update_bigrams(changes)
+            trie = self.trie
+            if changes and trie.top_k_table is not None:
+                # built while the queries run: they do not use the table of the old trie meanwhile (see Trie.top_k)
+                trie.build_top_k(trie.top_k_size, trie.top_k_depth, trie.top_k_min_fanout)
+        return added, modified, deleted
+
+    def _add_file(self, path: str, partial: PartialIndex, line_list: List) -> bool:
+        file_id = len(self.data_list)
+        # like read_files, an empty file does not take an id
+        if not line_list or not file_fits(path, file_id):
+            return False
+        self.data_list.append([])
+        self.file_paths.append(path)
+        self._store_file(file_id, partial, line_list)
+        self.file_ids[path] = file_id
+        return True
+
+    @staticmethod
+    def _load_file(path: str) -> Tuple[PartialIndex, List]:
+        partial = PartialIndex()
+        return partial, store_file_data(partial, path, 0)
+
+    def _store_file(self, file_id: int, partial: PartialIndex, line_list: List) -> None:
+        # the sentences first: a location is only published once its sentence can be read
+        self.data_list[file_id] = line_list
+        partial.merge_into(self.trie, file_id)
+
+    def _remove_file(self, file_id: int) -> None:
+        start, stop = file_key_range(file_id)
+        # the locations first: a sentence is only dropped once no location points to it
+        for word in set(word for words in self.data_list[file_id] for word in words):
+            self.trie.remove_postings(word, start, stop)
+        self.data_list[file_id] = []
+
+
+class IndexWatcher:
+    """
+    IndexWatcher polls a directory in a background thread and feeds the files that changed to an IndexUpdater.
+    """
+
+    def __init__(self, updater: IndexUpdater, dir_path: str, interval: float = 5.0):
+        self.updater = updater
+        self.dir_path = dir_path
+        self.interval = interval
+        self._state = _scan(dir_path)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+
+    def start(self) -> 'IndexWatcher':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def poll(self) -> Tuple[int, int, int]:
+        """
+        Compares the directory with the last scan and updates the index with the differences.
+        :return: the number of added, modified and deleted files.
+        """
+        state = _scan(self.dir_path)
+        changed = [path for path in state.keys() | self._state.keys() if state.get(path) != self._state.get(path)]
+        if not changed:
+            return 0, 0, 0
+        failed = []
+        counts = self.updater.update(changed, failed)
+        # a file that could not be read keeps its last applied state, so it is tried again at the next poll
+        for path in failed:
+            if path in self._state:
+                state[path] = self._state[path]
+            else:
+                state.pop(path, None)
+        self._state = state
+        return counts
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            # the thread keeps polling after an error, the files whose update failed are tried again
+            try:
+                self.poll()
+            except Exception as error:
+                warnings.warn(f"polling {self.dir_path} failed: {error!r}")
+
+
+def _scan(dir_path: str) -> Dict[str, Tuple[int, int]]:
+    state = {}
+    for path in iter_text_files(dir_path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        state[_normalize(path)] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def _normalize(path: str) -> str:
+    return os.path.normpath(os.path.abspath(path))
@@ -0,0 +1,194 @@
+import json
+import re
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterator, List, Union
+
+Number = Union[int, float]
+
+_NULL_TIMER = nullcontext()
+
+
+class Metrics:
+    """
+    Metrics collects per-stage timers, counters and gauges of the search engine.
+
+    It is disabled by default and then costs one attribute check per instrumented stage: timer()
+    returns a shared no-op context manager, timed_iter() returns the iterator unchanged, and the
+    callers only compute the values they record behind `if METRICS.enabled`.
+
+    - A counter only goes up (e.g. the correction candidates tried).
+    - A summary records the count, sum and maximum of observed values: the seconds of a timer, or the
+      sizes of the posting lists read.
+    - A gauge is a current value (e.g. the number of trie nodes).
+
+    Every recorded value is also passed to the callbacks as (kind, name, value), so it can be forwarded
+    to another monitoring system.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.counters: Dict[str, Number] = {}
+        self.summaries: Dict[str, List[Number]] = {}
+        self.gauges: Dict[str, Number] = {}
+        self.callbacks: List[Callable[[str, str, Number], None]] = []
+        self._lock = threading.Lock()
+
+    def enable(self, callback: Callable[[str, str, Number], None] = None) -> 'Metrics':
+        if callback is not None:
+            self.callbacks.append(callback)
+        self.enabled = True
+        return self
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters.clear()
+            self.summaries.clear()
+            self.gauges.clear()
+
+    def inc(self, name: str, value: Number = 1) -> None:
+        """
+        Adds a value to a counter.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._notify('counter', name, value)
+
+    def observe(self, name: str, value: Number) -> None:
+        """
+        Records one value of a summary.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            summary = self.summaries.get(name)
+            if summary is None:
+                self.summaries[name] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                if value > summary[2]:
+                    summary[2] = value
+        self._notify('summary', name, value)
+
+    def set_gauge(self, name: str, value: Number) -> None:
+        """
+        Sets the current value of a gauge.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[name] = value
+        self._notify('gauge', name, value)
+
+    def set_gauges(self, prefix: str, values: Dict[str, Number]) -> None:
+        """
+        Sets a gauge `prefix.name` for every name and value of a dictionary.
+        """
+        for name, value in values.items():
+            self.set_gauge(f"{prefix}.{name}", value)
+
+    def timer(self, name: str):
+        """
+        Returns a context manager that records the seconds spent in its block in the summary `name.seconds`.
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name + '.seconds')
+
+    def timed_iter(self, name: str, iterator: Iterator) -> Iterator:
+        """
+        Returns an iterator over the same items that records the seconds spent producing them, which is
+        how the work of a lazy stage is attributed to it, in the summary `name.seconds`.
+        """
+        if not self.enabled:
+            return iterator
+        return self._timed_iter(name + '.seconds', iterator)
+
+    def _timed_iter(self, name: str, iterator: Iterator) -> Iterator:
+        iterator = iter(iterator)
+        total = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    total += time.perf_counter() - start
+                    return
+                total += time.perf_counter() - start
+                yield item
+        finally:
+            # also when the consumer stops early, like after the first k results
+            self.observe(name, total)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Returns a copy of every metric, summaries as {count, sum, max}.
+        """
+        with self._lock:
+            return {'counters': dict(self.counters),
+                    'summaries': {name: {'count': count, 'sum': total, 'max': maximum}
+                                  for name, (count, total, maximum) in self.summaries.items()},
+                    'gauges': dict(self.gauges)}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, namespace: str = 'autocomplete') -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = _metric_name(namespace, name) + '_total'
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, summary in sorted(snapshot['summaries'].items()):
+            metric = _metric_name(namespace, name)
+            lines += [f"# TYPE {metric} summary", f"{metric}_count {summary['count']}",
+                      f"{metric}_sum {summary['sum']}", f"# TYPE {metric}_max gauge", f"{metric}_max {summary['max']}"]
+        for name, value in sorted(snapshot['gauges'].items()):
+            metric = _metric_name(namespace, name)
+            lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str) -> None:
+        """
+        Writes the metrics to a file: JSON if its name ends with .json, the Prometheus text format otherwise.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(self.to_json() if path.endswith('.json') else self.to_prometheus())
+
+    def _notify(self, kind: str, name: str, value: Number) -> None:
+        for callback in self.callbacks:
+            callback(kind, name, value)
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics: Metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self) -> '_Timer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+def _metric_name(namespace: str, name: str) -> str:
+    return f"{namespace}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+
+# the metrics of this process, disabled until enable() is called
+METRICS = Metrics()
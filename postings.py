@@ -0,0 +1,462 @@
+import sys
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+from collections import namedtuple
+from itertools import chain, compress, repeat
+from operator import add
+from typing import Iterable, Iterator, Sequence, Tuple, Union
+
+SentenceIndex = namedtuple('SentenceIndex', ['file_id', 'sentence_id', 'position'])
+
+# A SentenceIndex is packed into one unsigned 64-bit key: | file_id | sentence_id | position |.
+# Sorting the keys sorts the locations by (file_id, sentence_id, position), and the location `shift`
+# words further in the same sentence is simply `key + shift`.
+POSITION_BITS = 18
+SENTENCE_BITS = 26
+FILE_BITS = 20
+
+POSITION_MASK = (1 << POSITION_BITS) - 1
+SENTENCE_MASK = (1 << SENTENCE_BITS) - 1
+FILE_SHIFT = SENTENCE_BITS + POSITION_BITS
+
+# galloping pays off while a posting list has this many times more keys than there are candidates
+GALLOP_RATIO = 8
+
+# keys per block of a CompressedKeys (a power of two)
+BLOCK_BITS = 7
+BLOCK_SIZE = 1 << BLOCK_BITS
+
+# for every lane mask of a block: the bytes of the keys stored as lanes, and the bits of the other bytes
+_LANES = [tuple(byte for byte in range(8) if mask >> byte & 1) for mask in range(256)]
+_SHARED_BITS = [int.from_bytes(bytes(0 if mask >> byte & 1 else 255 for byte in range(8)), sys.byteorder)
+                for mask in range(256)]
+
+
+def encode(file_id: int, sentence_id: int, position: int) -> int:
+    """
+    Packs a word location into a single 64-bit key.
+
+    Args:
+        file_id (int): The file id.
+        sentence_id (int): The sentence number in the file.
+        position (int): The word index in the sentence.
+
+    Returns:
+        int: The packed key.
+    """
+    if file_id >> FILE_BITS or sentence_id >> SENTENCE_BITS or position >> POSITION_BITS:
+        raise ValueError(f"location ({file_id}, {sentence_id}, {position}) does not fit in a posting key")
+    return (file_id << FILE_SHIFT) | (sentence_id << POSITION_BITS) | position
+
+
+def file_key_range(file_id: int) -> Tuple[int, int]:
+    """
+    Returns the [start, stop) range of the keys of all the locations in the given file.
+    """
+    return file_id << FILE_SHIFT, (file_id + 1) << FILE_SHIFT
+
+
+def decode(key: int) -> SentenceIndex:
+    """
+    Unpacks a 64-bit key into a SentenceIndex.
+    """
+    return SentenceIndex(key >> FILE_SHIFT, (key >> POSITION_BITS) & SENTENCE_MASK, key & POSITION_MASK)
+
+
+class PostingList:
+    """
+    PostingList is a sorted sequence of word locations stored as packed integer keys.
+
+    It behaves like a read-only list of SentenceIndex named-tuples, decoding a key only when it is
+    accessed, while the intersection code works directly on `keys`.
+    """
+
+    __slots__ = ('keys',)
+
+    def __init__(self, keys: Union[array, None] = None):
+        self.keys = keys if keys is not None else array('Q')
+
+    @classmethod
+    def from_indexes(cls, indexes: Iterable[SentenceIndex]) -> 'PostingList':
+        """
+        Builds a PostingList from SentenceIndex named-tuples (in any order).
+        """
+        return cls(array('Q', sorted(encode(*index) for index in indexes)))
+
+    def add(self, key: int) -> None:
+        """
+        Adds a packed key, keeping the keys sorted. Appending in ascending order is O(1).
+        """
+        keys = self._writable_keys()
+        if not keys or key >= keys[-1]:
+            keys.append(key)
+        else:
+            insort(keys, key)
+
+    def extend(self, keys: Sequence[int]) -> None:
+        """
+        Adds sorted packed keys, keeping the keys sorted. Keys that all follow the current ones are appended.
+        """
+        if not len(keys):
+            return
+        self._writable_keys()
+        if not self.keys or keys[0] >= self.keys[-1]:
+            self.keys.extend(keys)
+        else:
+            self.keys = array('Q', merge(self.keys, keys))
+
+    def remove_range(self, start: int, stop: int) -> None:
+        """
+        Removes the keys in [start, stop).
+        """
+        self._writable_keys()
+        del self.keys[bisect_left(self.keys, start):bisect_left(self.keys, stop)]
+
+    def compress(self) -> None:
+        """
+        Stores the keys in compressed blocks (see CompressedKeys). Changing the list decompresses it.
+        """
+        if not isinstance(self.keys, CompressedKeys):
+            self.keys = CompressedKeys.from_keys(self.keys)
+
+    def _writable_keys(self) -> array:
+        if isinstance(self.keys, CompressedKeys):
+            self.keys = array('Q', self.keys)
+        return self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __iter__(self) -> Iterator[SentenceIndex]:
+        return map(decode, self.keys)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return PostingList(self.keys[item])
+        return decode(self.keys[item])
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PostingList):
+            return self.keys == other.keys
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"PostingList({list(self)!r})"
+
+
+class CompressedKeys:
+    """
+    CompressedKeys is a read-only sorted sequence of packed keys stored in compressed blocks.
+
+    The keys are cut in blocks of BLOCK_SIZE. Close keys share their high bytes: in a block of the keys
+    of a common word, the bytes of the file id and of the high bits of the sentence id are the same
+    for every key, and so is the high byte of the position. A block keeps the bytes its keys differ in
+    as lanes of one byte per key, and the bytes they share are those of its first key, so most keys
+    take 3 bytes instead of 8. Decoding a block repeats its first key and copies its lanes into the
+    bytes of an array (in C, with no work per key), and gives the keys themselves, searched and merged
+    like an array.
+
+    The first key and the byte offset of every block are kept as skip headers, so a search finds its
+    block by a binary search of the first keys and decodes that block only. The last decoded block is
+    kept for the next access, which is how a gallop from candidate to candidate decodes each block it
+    crosses once.
+
+    It is used as the `keys` of a PostingList: it has the len, indexing, slicing and iteration of the
+    array it replaces.
+    """
+
+    __slots__ = ('length', 'firsts', 'offsets', 'data', '_cached')
+
+    def __init__(self, length: int, firsts: Sequence[int], offsets: Sequence[int], data: Union[bytes, memoryview]):
+        """
+        Args:
+            length (int): The number of keys.
+            firsts (Sequence[int]): The first key of every block.
+            offsets (Sequence[int]): The start of every block in data, and the end of the last one.
+            data (Union[bytes, memoryview]): The blocks, each a mask of its lanes (bit j is set when byte j
+                of the keys, in native order, differs between them) and its lanes. They may be part of a
+                larger buffer, like a snapshot.
+        """
+        self.length = length
+        self.firsts = firsts
+        self.offsets = offsets
+        self.data = data
+        self._cached = (-1, None)
+
+    @classmethod
+    def from_keys(cls, keys: Sequence[int]) -> 'CompressedKeys':
+        """
+        Compresses sorted packed keys.
+        """
+        firsts = array('Q')
+        offsets = array('Q', [0])
+        data = bytearray()
+        for start in range(0, len(keys), BLOCK_SIZE):
+            block = array('Q', keys[start:start + BLOCK_SIZE])
+            firsts.append(block[0])
+            raw = block.tobytes()
+            mask = sum(1 << byte for byte in range(8) if raw[byte::8].count(raw[byte]) != len(block))
+            data.append(mask)
+            for byte in _LANES[mask]:
+                data += raw[byte::8]
+            offsets.append(len(data))
+        return cls(len(keys), firsts, offsets, bytes(data))
+
+    @classmethod
+    def from_blocks(cls, firsts: Sequence[int], offsets: Sequence[int], data: Union[bytes, memoryview]) -> 'CompressedKeys':
+        """
+        Returns the keys of blocks made by from_keys, counting the keys of the last block from its lanes.
+        """
+        if not len(firsts):
+            return cls(0, firsts, offsets, data)
+        start = offsets[-2]
+        lanes = len(_LANES[data[start]])
+        # a block without lanes is a single key
+        last = (offsets[-1] - start - 1) // lanes if lanes else 1
+        return cls(((len(firsts) - 1) << BLOCK_BITS) + last, firsts, offsets, data)
+
+    def _decode(self, block: int) -> array:
+        size = min(BLOCK_SIZE, self.length - (block << BLOCK_BITS))
+        data = self.data
+        start = self.offsets[block]
+        mask = data[start]
+        start += 1
+        raw = bytearray((self.firsts[block] & _SHARED_BITS[mask]).to_bytes(8, sys.byteorder)) * size
+        for byte in _LANES[mask]:
+            raw[byte::8] = data[start:start + size]
+            start += size
+        keys = array('Q')
+        keys.frombytes(raw)
+        return keys
+
+    def _block(self, block: int) -> array:
+        cached = self._cached
+        if cached[0] != block:
+            cached = self._cached = (block, self._decode(block))
+        return cached[1]
+
+    def seek(self, target: int, lo: int = 0) -> Tuple[int, bool]:
+        """
+        Returns the index of the first key >= target, searching forward from lo (see postings.gallop), and
+        whether that key is the target. Only the block that holds the answer is decoded.
+        """
+        if lo >= self.length:
+            return self.length, False
+        block = lo >> BLOCK_BITS
+        firsts = self.firsts
+        if block + 1 < len(firsts) and firsts[block + 1] <= target:
+            block = bisect_right(firsts, target, block + 1) - 1
+            lo = block << BLOCK_BITS
+        start = block << BLOCK_BITS
+        first = firsts[block]
+        if target <= first:
+            return (lo, False) if lo > start else (start, target == first)
+        keys = self._block(block)
+        index = bisect_left(keys, target, lo - start)
+        return start + index, index < len(keys) and keys[index] == target
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self) -> Iterator[int]:
+        return chain.from_iterable(map(self._decode, range(len(self.firsts))))
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.length)
+            if step != 1 or start >= stop:
+                return array('Q', self)[item]
+            first = start >> BLOCK_BITS
+            keys = array('Q')
+            for block in range(first, ((stop - 1) >> BLOCK_BITS) + 1):
+                keys.extend(self._decode(block))
+            return keys[start - (first << BLOCK_BITS):stop - (first << BLOCK_BITS)]
+        cached = self._cached
+        if cached[0] == item >> BLOCK_BITS and item >= 0:
+            # the key just found by gallop
+            return cached[1][item & (BLOCK_SIZE - 1)]
+        if item < 0:
+            item += self.length
+        if not 0 <= item < self.length:
+            raise IndexError(item)
+        return self._block(item >> BLOCK_BITS)[item & (BLOCK_SIZE - 1)]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (CompressedKeys, array, memoryview)):
+            return len(self) == len(other) and all(map(int.__eq__, self, other))
+        return NotImplemented
+
+    def __sizeof__(self) -> int:
+        return object.__sizeof__(self) + sum(map(sys.getsizeof, (self.firsts, self.offsets, self.data)))
+
+
+def as_posting_list(indexes: Iterable[SentenceIndex]) -> PostingList:
+    """
+    Returns the given locations as a PostingList, converting a plain list of SentenceIndex if needed.
+    """
+    if isinstance(indexes, PostingList):
+        return indexes
+    return PostingList.from_indexes(indexes)
+
+
+def gallop(keys: Sequence[int], target: int, lo: int = 0) -> int:
+    """
+    Returns the index of the first key >= target, searching forward from lo.
+
+    The search probes lo+1, lo+2, lo+4, ... before a binary search of the last step, so a sorted
+    run of targets costs O(log gap) per target instead of O(log len(keys)).
+    """
+    if type(keys) is CompressedKeys:
+        return keys.seek(target, lo)[0]
+    size = len(keys)
+    step = 1
+    hi = lo
+    while hi < size and keys[hi] < target:
+        lo = hi + 1
+        hi += step
+        step *= 2
+    return bisect_left(keys, target, lo, min(hi, size))
+
+
+def intersect_at_offsets(lists: Sequence[PostingList], offsets: Sequence[int]) -> PostingList:
+    """
+    Returns the locations of the first word of a phrase whose other words are at the given offsets.
+
+    A location is kept when, for every list i, the key `location + offsets[i]` is in lists[i]
+    (offsets[0] is 0). The lists are intersected from the shortest to the longest, so the candidates
+    start from the rarest word and only shrink, and the work stops as soon as none are left. A long
+    list is probed by galloping from candidate to candidate; when the candidates are about as many
+    as its keys it is hashed instead.
+
+    Args:
+        lists (Sequence[PostingList]): The sorted locations of each word of the phrase.
+        offsets (Sequence[int]): The position of each word relative to the first one.
+
+    Returns:
+        PostingList: The sorted locations of the first word of every match.
+    """
+    order = sorted(range(len(lists)), key=lambda i: len(lists[i]))
+    rarest = order[0]
+    offset = offsets[rarest]
+    last = offset + _last_first_position(offsets)
+    keys = lists[rarest].keys
+    if offset or last < POSITION_MASK:
+        # a word at position p < offset cannot be `offset` words after the first word, and the first
+        # word must leave room in its sentence for the word furthest from it
+        candidates = [key - offset for key in keys if offset <= key & POSITION_MASK <= last]
+    else:
+        candidates = keys
+    for i in order[1:]:
+        if not len(candidates):
+            break
+        keys = lists[i].keys
+        offset = offsets[i]
+        if len(candidates) * GALLOP_RATIO < len(keys):
+            kept = []
+            lo = 0
+            size = len(keys)
+            for candidate in candidates:
+                target = candidate + offset
+                lo = gallop(keys, target, lo)
+                if lo == size:
+                    break
+                if keys[lo] == target:
+                    kept.append(candidate)
+            candidates = kept
+        else:
+            targets = set(keys)
+            candidates = list(compress(candidates, map(targets.__contains__, map(add, candidates, repeat(offset)))))
+    if isinstance(candidates, array):
+        return PostingList(candidates)
+    return PostingList(array('Q', candidates))
+
+
+def first_per_sentence(keys: Iterable[int]) -> Iterator[int]:
+    """
+    Yields the first of the sorted keys of every sentence, skipping the other locations in the same sentence.
+    """
+    sentence = -1
+    for key in keys:
+        if key >> POSITION_BITS != sentence:
+            sentence = key >> POSITION_BITS
+            yield key
+
+
+def iter_phrase_matches(groups: Sequence[Sequence[PostingList]], offsets: Sequence[int]) -> Iterator[int]:
+    """
+    Lazily yields, in order, the locations of the first word of a phrase whose other words are at the given offsets.
+
+    Each word of the phrase is a group of posting lists and its locations are their union, so the
+    unfinished last word of a query can stand for all the words it is the beginning of. The candidates
+    are drawn lazily from the group with the fewest keys and each one is checked against the other
+    groups by galloping forward from the previous probe. Nothing is computed ahead of the consumer: stopping
+    after k matches skips the rest of the work.
+
+    Args:
+        groups (Sequence[Sequence[PostingList]]): The posting lists of each word of the phrase.
+        offsets (Sequence[int]): The position of each word relative to the first one.
+
+    Returns:
+        Iterator[int]: The packed keys of the first word of every match.
+    """
+    sizes = [sum(map(len, group)) for group in groups]
+    driver = min(range(len(groups)), key=sizes.__getitem__)
+    if not sizes[driver]:
+        return
+    offset = offsets[driver]
+    last = offset + _last_first_position(offsets)
+    lists = groups[driver]
+    keys = lists[0].keys if len(lists) == 1 else merge(*(postings.keys for postings in lists))
+    # the smaller groups reject a candidate sooner. a group probed for every candidate is merged once
+    # (in C) rather than galloped list by list, unless it has many more keys than there are candidates
+    # (e.g. the words of a short prefix after a rare pair), when each of its lists is galloped instead
+    probes = [(offsets[i], _probed_lists(groups[i], sizes[i], sizes[driver]))
+              for i in sorted(range(len(groups)), key=sizes.__getitem__) if i != driver]
+    for key in keys:
+        if not offset <= key & POSITION_MASK <= last:
+            continue
+        candidate = key - offset
+        for probe_offset, probed in probes:
+            target = candidate + probe_offset
+            for probe in probed:
+                probe_keys = probe[0]
+                if probe[2]:
+                    # one call instead of a gallop and a lookup of the key found
+                    probe[1], found = probe_keys.seek(target, probe[1])
+                    if found:
+                        break
+                    continue
+                probe[1] = lo = gallop(probe_keys, target, probe[1])
+                if lo < len(probe_keys) and probe_keys[lo] == target:
+                    break
+            else:
+                break
+        else:
+            yield candidate
+
+
+def _last_first_position(offsets: Sequence[int]) -> int:
+    """
+    Returns the last position of the first word of a phrase from which `key + offset` stays in the same sentence
+    for every offset, so that a shift never carries into the sentence number.
+    """
+    if min(offsets) < 0 or max(offsets) > POSITION_MASK:
+        raise ValueError(f"phrase offsets {list(offsets)} do not fit in a sentence")
+    return POSITION_MASK - max(offsets)
+
+
+def _probed_lists(lists: Sequence[PostingList], size: int, candidates: int) -> list:
+    if len(lists) > 1 and candidates * len(lists) < size:
+        probed = [postings.keys for postings in lists]
+    else:
+        probed = [_merged_keys(lists)]
+    return [[keys, 0, type(keys) is CompressedKeys] for keys in probed]
+
+
+def _merged_keys(lists: Sequence[PostingList]) -> Sequence[int]:
+    if len(lists) == 1:
+        return lists[0].keys
+    return array('Q', sorted(chain.from_iterable(postings.keys for postings in lists)))
@@ -1,65 +1,410 @@
+from array import array
+from multiprocessing import Pool
+from instrumentation import METRICS
+from postings import FILE_BITS, FILE_SHIFT, POSITION_BITS, SENTENCE_BITS, encode
+from sentence_store import OffsetFile, OffsetSentenceStore, TokenFile, TokenSentenceStore, Vocabulary
+from text_cleaning import clean_text
 from trie import Trie
-from typing import List
-import sys
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union
 import os
-import re
+import warnings
 
-pattern = r'[^a-zA-Z0-9\s]'
+# batches of files of every worker of read_files_parallel
+BATCHES_PER_WORKER = 2
+# bytes read from a file at a time
+CHUNK_SIZE = 1 << 20
+# words whose locations are collected before they are inserted into the trie
+FLUSH_TOKENS = 1 << 20
+
+
+class PartialIndex:
+    """
+    PartialIndex collects the packed locations of the words of one file, for merging into a Trie later.
+
+    It has the `insert` and `insert_postings` methods of a Trie, so `store_file_data` and `stream_file_data`
+    tokenize into it unchanged.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, array] = {}
+
+    def insert(self, key: str, file_id: int, row_number: int, word_index: int) -> None:
+        keys = self.postings.get(key)
+        if keys is None:
+            keys = self.postings[key] = array('Q')
+        keys.append(encode(file_id, row_number, word_index))
+
+    def insert_postings(self, key: str, keys: Sequence[int]) -> None:
+        postings = self.postings.get(key)
+        if postings is None:
+            self.postings[key] = array('Q', keys)
+        else:
+            postings.extend(keys)
+
+    def merge_into(self, trie: Trie, file_id: int) -> None:
+        """
+        Inserts the collected locations into the trie, moving them from file 0 to the given file id.
+        """
+        offset = file_id << FILE_SHIFT
+        for word, keys in self.postings.items():
+            trie.insert_postings(word, array('Q', [key + offset for key in keys]) if offset else keys)
+
+
+def iter_file_sentences(file_path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[List[str]]:
+    """
+    Yields the words of every non-empty line of a text file, reading it chunk_size bytes at a time.
+    """
+    return (words for _, _, words in iter_file_lines(file_path, chunk_size))
+
+
+def iter_file_lines(file_path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[int, int, List[str]]]:
+    """
+    Yields the byte offset, the length in bytes and the words of every non-empty line of a text file,
+    reading it chunk_size bytes at a time. A line ends at '\\n', '\\r\\n' or '\\r', like in text mode.
+    """
+    with open(file_path, 'rb') as file:
+        offset = 0
+        rest = b''
+        while True:
+            chunk = file.read(chunk_size)
+            data = rest + chunk
+            if not data:
+                return
+            if chunk:
+                # the last line may go on in the next chunk, and so may a '\r' at the end (the start of a '\r\n')
+                cut = max(data.rfind(b'\n'), data.rfind(b'\r', 0, len(data) - 1)) + 1
+            else:
+                cut = len(data)
+            complete, rest = data[:cut], data[cut:]
+            # cleaning keeps the line breaks, so the cleaned lines are the raw lines in the same order
+            lines = clean_text(complete.decode('utf-8')).replace('\r\n', '\n').replace('\r', '\n').split('\n')
+            for raw_line, line in zip(complete.splitlines(True), lines):
+                words = line.split()
+                if words:
+                    yield offset, len(raw_line), words
+                offset += len(raw_line)
+
+
+def file_fits(file_path: str, file_index: int) -> bool:
+    """
+    Tells whether a file id fits in a posting key (see postings.encode), warning that the file is not indexed if not.
+    """
+    if file_index >> FILE_BITS:
+        warnings.warn(f"{file_path} is not indexed: the index holds at most {1 << FILE_BITS} files")
+        return False
+    return True
+
+
+def indexed_words(file_path: str, line_number: int, words: List[str]) -> Union[List[str], None]:
+    """
+    Returns the words of a sentence whose locations fit in a posting key (see postings.encode): None when the
+    sentence number does not fit, and only the first words of a longer sentence, with a warning.
+    """
+    if line_number >> SENTENCE_BITS:
+        warnings.warn(f"{file_path}: the sentences after the first {1 << SENTENCE_BITS} are not indexed")
+        return None
+    if len(words) >> POSITION_BITS:
+        warnings.warn(f"{file_path}: the words of sentence {line_number} after the first {1 << POSITION_BITS} "
+                      f"are not indexed")
+        return words[:1 << POSITION_BITS]
+    return words
 
 
 def store_file_data(trie: Trie, file_path: str, file_index: int):
-    with open(file_path, 'r', encoding='utf-8') as file:
-        line_list = []
-        line_number = 0
-        for line in file:
-            clean_line = re.sub(pattern, '', line).lower().strip()
-            words_list = []
-            if clean_line == '' or clean_line == '\n' or clean_line == ' ':
-                continue
-            for word_number, word in enumerate(clean_line.split(), start=0):
-                trie.insert(word, file_index, line_number, word_number)
-                words_list.append(word)
-            if len(words_list) > 0:
-                line_list.append(words_list)
-                line_number += 1
-        return line_list
-
-
-def read_files(trie: Trie, dir_path: str, arr: List, file_index: int = 0) -> int:
+    line_list = []
+    for line_number, words_list in enumerate(iter_file_sentences(file_path)):
+        indexed = indexed_words(file_path, line_number, words_list)
+        if indexed is None:
+            break
+        for word_number, word in enumerate(indexed):
+            trie.insert(word, file_index, line_number, word_number)
+        line_list.append(words_list)
+    return line_list
+
+
+def stream_file_data(trie: Trie, file_path: str, file_index: int, sentences, chunk_size: int = CHUNK_SIZE,
+                     flush_tokens: int = FLUSH_TOKENS) -> int:
+    """
+    Reads a text file into the trie with bounded memory.
+
+    The file is read and cleaned chunk_size characters at a time. The locations of its words are collected
+    per word and inserted into the trie every flush_tokens words, one posting list per distinct word
+    instead of one trie walk per word.
+
+    Args:
+        trie (Trie): The Trie data structure to insert words into.
+        file_path (str): The text file.
+        file_index (int): The id of the file.
+        sentences: Where the sentences are appended: a TokenFile or a list (as lists of words), or an
+            OffsetFile (by the byte range of their line, see sentence_store).
+        chunk_size (int, optional): The number of characters read at a time.
+        flush_tokens (int, optional): The number of words collected before they are inserted.
+
+    Returns:
+        int: The number of words read.
+    """
+    add_line = add_sentence = None
+    if isinstance(sentences, OffsetFile):
+        add_line = sentences.append_line
+    else:
+        add_sentence = sentences.append_sentence if isinstance(sentences, TokenFile) else sentences.append
+    partial = PartialIndex()
+    postings = partial.postings
+    pending = tokens = 0
+    for line_number, (offset, length, words) in enumerate(iter_file_lines(file_path, chunk_size)):
+        indexed = indexed_words(file_path, line_number, words)
+        if indexed is None:
+            break
+        key = encode(0, line_number, 0)
+        for word in indexed:
+            keys = postings.get(word)
+            if keys is None:
+                keys = postings[word] = array('Q')
+            keys.append(key)
+            key += 1
+        if add_line is not None:
+            add_line(offset, length)
+        else:
+            add_sentence(words)
+        pending += len(words)
+        if pending >= flush_tokens:
+            partial.merge_into(trie, file_index)
+            partial = PartialIndex()
+            postings = partial.postings
+            tokens += pending
+            pending = 0
+    partial.merge_into(trie, file_index)
+    return tokens + pending
+
+
+def read_files(trie: Trie, dir_path: str, arr: List, file_index: int = 0, paths: List = None) -> int:
     """
     Recursively reads and processes text files in a directory, inserting words into a Trie.
 
     Args:
         trie (Trie): The Trie data structure to insert words into.
         dir_path (str): The path to the directory containing text files.
-        arr(List): A three-dimensional array for saving the words in the original location
+        arr(List): A three-dimensional array for saving the words in the original location, or a
+            TokenSentenceStore, which the files are streamed into without building their lists of words.
         file_index (int, optional): The current file index (used internally for recursion). Default is 0.
+        paths (List, optional): If given, the path of every stored file is appended to it, so that
+            paths[file_id] is the source of arr[file_id].
 
     Returns:
         int: The last file id
 
+    """
+    return read_file_list(trie, iter_text_files(dir_path), arr, file_index, paths)
+
+
+def read_file_list(trie: Trie, file_paths: Iterable[str], arr: List, file_index: int = 0, paths: List = None) -> int:
+    """
+    Reads and processes the given text files in order, like read_files does with the files of a directory.
+
+    Args:
+        trie (Trie): The Trie data structure to insert words into.
+        file_paths (Iterable[str]): The paths of the text files.
+        arr(List): A three-dimensional array for saving the words in the original location, or a
+            TokenSentenceStore or OffsetSentenceStore.
+        file_index (int, optional): The id of the first file. Default is 0.
+        paths (List, optional): If given, the path of every stored file is appended to it.
+
+    Returns:
+        int: The id after the last stored file (files without sentences get no id)
+    """
+    for file_path in file_paths:
+        if not file_fits(file_path, file_index):
+            break
+        line_list = new_file(arr, file_path)
+        with METRICS.timer('build.file'):
+            tokens = stream_file_data(trie, file_path, file_index, line_list)
+        if METRICS.enabled:
+            record_file_stats(len(line_list), tokens)
+        if len(line_list) > 0:
+            file_index += 1
+            arr.append(line_list)
+            if paths is not None:
+                paths.append(file_path)
+    return file_index
+
+
+def new_file(arr: List, file_path: str):
+    """
+    Returns the empty entry of the data list that the sentences of a file are streamed into.
+    """
+    if isinstance(arr, TokenSentenceStore):
+        return TokenFile(arr.vocabulary)
+    if isinstance(arr, OffsetSentenceStore):
+        return arr.new_file(file_path)
+    return []
+
+
+def record_file_stats(sentences: int, tokens: int) -> None:
+    """
+    Counts a file read into the index, with its sentences and words, in the build metrics.
+    """
+    METRICS.inc('build.files')
+    METRICS.inc('build.sentences', sentences)
+    METRICS.inc('build.tokens', tokens)
+
+
+def iter_text_files(dir_path: str) -> Iterator[str]:
+    """
+    Yields the paths of the text files under a directory, in the order read_files visits them.
     """
     for file_name in os.listdir(dir_path):
         file_path = os.path.join(dir_path, file_name)
         if os.path.isfile(file_path):
             if file_name.endswith(".txt"):
-                line_list = store_file_data(trie, file_path, file_index)
-                if len(line_list) > 0:
-                    file_index += 1
-                    arr.append(line_list)
+                yield file_path
         else:
-            file_index = read_files(trie, file_path, arr, file_index)
+            yield from iter_text_files(file_path)
+
+
+def tokenize_batch(file_paths: Sequence[str], file_index: int, kind: str
+                   ) -> Tuple[List[Tuple[object, int]], Union[List[str], None], List[str], array, array]:
+    """
+    Worker task: tokenizes a batch of consecutive files, their first one having the given id.
+
+    The files are read like read_file_list reads them, but into one partial index for the whole batch, so its
+    locations are already grouped by word and carry their file ids: the locations of words[i] are
+    keys[offsets[i]:offsets[i + 1]], a few arrays instead of one per word to pickle. A TokenFile of the batch
+    is returned as its tokens and offsets over the vocabulary of the batch. The batch stops before a file whose
+    id does not fit in a key, the caller reads the rest itself.
+
+    Args:
+        file_paths (Sequence[str]): The text files of the batch, in order.
+        file_index (int): The id of the first file (the files without sentences get no id).
+        kind (str): How the sentences are returned: 'tokens', 'offsets' (an OffsetFile) or 'lists' of words.
+
+    Returns:
+        The sentences and the number of words of every file read, the words of the batch vocabulary (or None),
+        and the words, keys and offsets of the locations.
+    """
+    vocabulary = Vocabulary() if kind == 'tokens' else None
+    partial = PartialIndex()
+    files = []
+    for file_path in file_paths:
+        if file_index >> FILE_BITS:
+            break
+        if kind == 'offsets':
+            sentences = OffsetFile(file_path)
+        else:
+            sentences = TokenFile(vocabulary) if vocabulary is not None else []
+        tokens = stream_file_data(partial, file_path, file_index, sentences)
+        if vocabulary is not None:
+            sentences = (sentences.tokens, sentences.offsets)
+            if len(sentences[1]) > 1:
+                file_index += 1
+        elif len(sentences) > 0:
+            file_index += 1
+        files.append((sentences, tokens))
+    keys, offsets = array('Q'), array('Q', [0])
+    for word_keys in partial.postings.values():
+        keys.extend(word_keys)
+        offsets.append(len(keys))
+    return files, vocabulary.words if vocabulary is not None else None, list(partial.postings), keys, offsets
+
+
+def split_batches(file_paths: List[str], count: int) -> List[List[str]]:
+    """
+    Splits the files into at most count batches of consecutive files with about the same number of bytes.
+    """
+    sizes = [_file_size(file_path) for file_path in file_paths]
+    total = sum(sizes) or 1
+    batches, batch, read = [], [], 0
+    for file_path, size in zip(file_paths, sizes):
+        batch.append(file_path)
+        read += size
+        if read * count >= total * (len(batches) + 1):
+            batches.append(batch)
+            batch = []
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _file_size(file_path: str) -> int:
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def read_files_parallel(trie: Trie, dir_path: str, arr: List, workers: int, file_index: int = 0,
+                        paths: List = None) -> int:
+    """
+    Reads and processes the text files of a directory like read_files, tokenizing them in worker processes.
+
+    The files are split into batches of consecutive files, and every worker returns its batch finished: the
+    sentences as arrays over the vocabulary of the batch, and the locations grouped by word with their file
+    ids. Merging a batch costs one pass over its tokens, to move them to the shared vocabulary, and one
+    array extension per distinct word of the batch; the trie is only walked for the words never seen before.
+    The batches are merged in file order, so the file ids, the Trie and the array are identical to a
+    sequential build.
+
+    The id of the first file of a batch is guessed before it is read, as if every file of the batches before
+    it that is not empty had sentences. A file of only blank lines makes the guesses of the next batches too
+    high: their locations are then moved back one by one, a slower merge.
+
+    Args:
+        trie (Trie): The Trie data structure to insert words into.
+        dir_path (str): The path to the directory containing text files.
+        arr(List): A three-dimensional array for saving the words in the original location, or a
+            TokenSentenceStore or OffsetSentenceStore.
+        workers (int): The number of worker processes.
+        file_index (int, optional): The id of the first file. Default is 0.
+        paths (List, optional): If given, the path of every stored file is appended to it.
+
+    Returns:
+        int: The last file id
+    """
+    if isinstance(arr, TokenSentenceStore):
+        kind = 'tokens'
+    else:
+        kind = 'offsets' if isinstance(arr, OffsetSentenceStore) else 'lists'
+    batches = split_batches(list(iter_text_files(dir_path)), workers * BATCHES_PER_WORKER)
+    tasks, guess = [], file_index
+    for batch in batches:
+        tasks.append((batch, guess, kind))
+        guess += sum(1 for file_path in batch if _file_size(file_path))
+    # the locations of every word merged, so the next batches extend them without walking the trie
+    word_postings = {}
+    with Pool(workers) as pool:
+        for (batch, guess, _), result in zip(tasks, pool.imap(_tokenize_task, tasks)):
+            files, words, posting_words, keys, key_offsets = result
+            with METRICS.timer('build.merge'):
+                first_index = file_index
+                remap = arr.vocabulary.intern(words) if words is not None else None
+                for file_path, (sentences, tokens) in zip(batch, files):
+                    if remap is not None:
+                        file_tokens, offsets = sentences
+                        sentences = TokenFile(arr.vocabulary, array('I', map(remap.__getitem__, file_tokens)),
+                                              offsets)
+                    if METRICS.enabled:
+                        record_file_stats(len(sentences), tokens)
+                    if len(sentences) > 0:
+                        # the sentences first, like read_file_list: the trie then points to stored sentences
+                        file_index += 1
+                        arr.append(sentences)
+                        if paths is not None:
+                            paths.append(file_path)
+                shift = (guess - first_index) << FILE_SHIFT
+                if shift:
+                    keys = array('Q', [key - shift for key in keys])
+                for index, word in enumerate(posting_words):
+                    word_keys = keys[key_offsets[index]:key_offsets[index + 1]]
+                    locations = word_postings.get(word)
+                    if locations is None:
+                        word_postings[word] = trie.insert_postings(word, word_keys)
+                    else:
+                        locations.extend(word_keys)
+            if len(files) < len(batch):
+                file_index = read_file_list(trie, batch[len(files):], arr, file_index, paths)
+                if file_index >> FILE_BITS:
+                    break
     return file_index
 
 
-# if __name__ == "__main__":
-#     if len(sys.argv) > 1:
-#         trie_s = Trie()
-#         data_list = []
-#         read_files(trie_s, sys.argv[1], data_list,  0)
-#         print(trie_s.search("python"))
-#         print(data_list[808][2755][1])
-#         print(trie_s.add_letter("pyhon", 2))
-#         print(trie_s.change_letter("pyxhon", 2))
-#         print(trie_s.change_letter("oython", 0))
-#         print(trie_s.add_letter("ython", 0))
+def _tokenize_task(task: Tuple[Sequence[str], int, str]):
+    return tokenize_batch(*task)
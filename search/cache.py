@@ -0,0 +1,92 @@
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Tuple, Union
+
+from search.data_utils import AutoCompleteData
+
+
+class CompletionCache:
+    """
+    Bounded LRU cache of completion results, keyed on the normalized prefix and k.
+
+    The cache remembers which trie (and which version of it) its entries were computed from and
+    empties itself as soon as it is used with a rebuilt or updated trie.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._trie_ref = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prefix: str, k: int) -> Tuple[str, int]:
+        """
+        function to build the cache key of a query.
+        :param prefix: string of words that user input.
+        :param k: number of the completions.
+        :return: the normalized prefix and k.
+        """
+        return ' '.join(prefix.lower().split()), k
+
+    def get(self, trie_tree, key: Hashable) -> Union[List[AutoCompleteData], None]:
+        """
+        function to get the cached completions of a query.
+        :param trie_tree: the trie the completions are computed from.
+        :param key: the key from make_key.
+        :return: the completions, or None on a miss.
+        """
+        with self._lock:
+            self._check_index(trie_tree)
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(value)
+
+    def put(self, trie_tree, key: Hashable, value: List[AutoCompleteData], version: int = None) -> None:
+        """
+        function to store the completions of a query, evicting the least recently used one if full.
+        :param trie_tree: the trie the completions were computed from.
+        :param key: the key from make_key.
+        :param value: the completions.
+        :param version: the version of the trie when the completions started to be computed. they are not
+         stored if the trie changed since, as they may be the completions of neither version.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if version is not None and version != trie_tree.version:
+                return
+            self._check_index(trie_tree)
+            self._entries[key] = list(value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        function to get the counters of the cache.
+        :return: the size, hits, misses and evictions of the cache.
+        """
+        return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    def _check_index(self, trie_tree) -> None:
+        # a different trie object or a bumped version means every entry may be wrong
+        if self._trie_ref is None or self._trie_ref() is not trie_tree or self._version != trie_tree.version:
+            self._entries.clear()
+            self._trie_ref = weakref.ref(trie_tree)
+            self._version = trie_tree.version
@@ -1,8 +1,6 @@
 from dataclasses import dataclass
-from collections import namedtuple
 
-
-SentenceIndex = namedtuple('SentenceIndex', ['file_id', 'sentence_id', 'position'])
+from postings import SentenceIndex
 
 
 @dataclass
@@ -12,9 +10,9 @@ class AutoCompleteData:
     offset: int
     score: int
 
-    def __init__(self, sentence_index: SentenceIndex, sentence:str , score):
+    def __init__(self, sentence_index: SentenceIndex, sentence:str , score, source_text: str = None):
         self.completed_sentence = sentence
-        self.source_text = get_file_name(sentence_index.file_id)
+        self.source_text = source_text if source_text is not None else get_file_name(sentence_index.file_id)
         self.offset = sentence_index.sentence_id
         self.score = score
 
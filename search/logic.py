@@ -1,5 +1,5 @@
 from search.data_utils import SentenceIndex
-from typing import List
+from typing import List, Union
 
 
 def find_sentence_by_indexes(indexes: SentenceIndex, data_list: List[str]) -> str:
@@ -12,6 +12,17 @@ def find_sentence_by_indexes(indexes: SentenceIndex, data_list: List[str]) -> st
     return data_list[indexes.file_id][indexes.sentence_id]
 
 
+def find_source_by_indexes(indexes: SentenceIndex, data_list: List[str]) -> Union[str, None]:
+    """
+    function to find the path of the file of a sentence, when the data list knows it.
+    :param indexes: list of indexes of: (file_id, sentence_id, position)
+    :param data_list: list of the sentences.
+    :return: the path of the file, or None.
+    """
+    source_path = getattr(data_list, 'source_path', None)
+    return source_path(indexes.file_id) if source_path is not None else None
+
+
 
 
 
@@ -1,31 +1,268 @@
-from typing import List, Tuple
+from heapq import heapify, heappop
+from itertools import chain, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
 
+from instrumentation import METRICS
+from postings import (POSITION_BITS, PostingList, as_posting_list, decode, intersect_at_offsets,
+                      iter_phrase_matches)
+from search.cache import CompletionCache
 from search.data_utils import AutoCompleteData, SentenceIndex
-from search.logic import find_sentence_by_indexes
-from trie import Trie
+from search.logic import find_sentence_by_indexes, find_source_by_indexes
+from trie import CHANGE, Edit, Trie
 from collections import defaultdict
 
+# the index of the corrected word in the rank of an exact match
+EXACT_MATCH = -1
 
-def get_best_k_completion ( prefix: str, trie_tree: Trie, data_list: List[str], k: int = 5 ) -> List[AutoCompleteData]:
+
+def get_best_k_completion ( prefix: str, trie_tree: Trie, data_list: List[str], k: int = 5,
+                            cache: CompletionCache = None, corrector=None ) -> List[AutoCompleteData]:
     """
     function to get the best k completions from the database.
     :param trie_tree:
     :param prefix: string of words that user input
     :param data_list: list of the sentences.
     :param k: number of the best completions to return.
+    :param cache: an optional cache of the results of previous queries.
+    :param corrector: the engine that finds spelling corrections (anything with edit_candidates, like
+     a SymSpellIndex). default: the trie tree itself.
     :return: a list of AutoCompleteData objects
     """
-    sentences_indexes = search(prefix, trie_tree)
-    if len(sentences_indexes) < k:  # find error correction
-        find_error_correction(prefix, sentences_indexes, trie_tree, k - len(sentences_indexes))
-    sentences_indexes = sentences_indexes[:k]
-    lst_of_auto_complete_data = [
-        AutoCompleteData(sentence_index, find_sentence_by_indexes(sentence_index, data_list), len(prefix)) for
-        sentence_index in sentences_indexes if sentence_index]
+    if cache is None:
+        return compute_best_k_completion(prefix, trie_tree, data_list, k, corrector)
+    key = cache.make_key(prefix, k)
+    lst_of_auto_complete_data = cache.get(trie_tree, key)
+    if lst_of_auto_complete_data is None:
+        version = trie_tree.version
+        lst_of_auto_complete_data = compute_best_k_completion(prefix, trie_tree, data_list, k, corrector)
+        cache.put(trie_tree, key, lst_of_auto_complete_data, version)
     return lst_of_auto_complete_data
 
 
-def search(user_input: str, trie_tree, shift: int = 1) -> List[SentenceIndex]:
+def compute_best_k_completion ( prefix: str, trie_tree: Trie, data_list: List[str], k: int = 5,
+                                corrector=None ) -> List[AutoCompleteData]:
+    """
+    function to compute the best k completions from the database, without a cache.
+    only the sentences of the returned completions are read from data_list.
+    :param trie_tree:
+    :param prefix: string of words that user input
+    :param data_list: list of the sentences.
+    :param k: number of the best completions to return.
+    :param corrector: the engine that finds spelling corrections. default: the trie tree itself.
+    :return: a list of AutoCompleteData objects
+    """
+    with METRICS.timer('completion'):
+        ranked = list(islice(iter_ranked_completions(prefix, trie_tree, k, corrector), k))
+        return materialize(ranked, data_list)
+
+
+def materialize(ranked: Iterable[Tuple[Tuple[int, ...], int]], data_list: List[str]) -> List[AutoCompleteData]:
+    """
+    function to read the sentences of ranked completions from the database.
+    :param ranked: the (rank, packed key) of the completions, best first (see iter_ranked_completions).
+    :param data_list: list of the sentences.
+    :return: a list of AutoCompleteData objects
+    """
+    with METRICS.timer('completion.materialize'):
+        lst_of_auto_complete_data = []
+        for rank, key in ranked:
+            sentence_index = decode(key)
+            lst_of_auto_complete_data.append(AutoCompleteData(
+                sentence_index, find_sentence_by_indexes(sentence_index, data_list), rank_score(rank),
+                find_source_by_indexes(sentence_index, data_list)))
+    return lst_of_auto_complete_data
+
+
+def iter_completions(prefix: str, trie_tree: Trie, k: int = 5, corrector=None,
+                     max_distance: int = 1) -> Iterator[SentenceIndex]:
+    """
+    generator of the completions of a prefix, best first and one per sentence.
+    the exact matches come first and the matches of the spelling corrections after them, from the highest
+    score down, so the corrections are only searched when the exact matches run out before the consumer stops.
+    :param prefix: string of words that user input
+    :param trie_tree: the trie tree of the database.
+    :param k: the number of completions the consumer is going to take (to use the precomputed ones).
+    :param corrector: the engine that finds spelling corrections. default: the trie tree itself.
+    :param max_distance: the maximum number of edits of a correction.
+    :return: an iterator of indexes of: (file_id, sentence_id, position)
+    """
+    return (decode(key) for _, key in iter_ranked_completions(prefix, trie_tree, k, corrector, max_distance))
+
+
+def iter_ranked_completions(prefix: str, trie_tree: Trie, k: int = 5, corrector=None, max_distance: int = 1,
+                            prefix_words: Sequence[str] = None) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    """
+    generator of the completions of iter_completions, as packed keys with their rank.
+    the rank is (-score, index of the corrected word), the index being EXACT_MATCH for an exact match (see
+    base_score and rank_score). the completions of one rank are in the order of their keys, so the completions
+    of indexes of different files (like the shards of a sharded index) sorted by (rank, key) are the
+    completions of one index of all the files.
+    :param prefix: string of words that user input
+    :param trie_tree: the trie tree of the database.
+    :param k: the number of completions the consumer is going to take (to use the precomputed ones).
+    :param corrector: the engine that finds spelling corrections. default: the trie tree itself.
+    :param max_distance: the maximum number of edits of a correction.
+    :param prefix_words: the words the last word stands for, when they were collected beforehand (see
+     last_word_group). default: the words of the trie that start with it.
+    :return: an iterator of (rank, packed key of: (file_id, sentence_id, position)), one per sentence.
+    """
+    return rank_matches(prefix, iter_matches(prefix, trie_tree, k, prefix_words=prefix_words), trie_tree, corrector,
+                        max_distance, prefix_words)
+
+
+def rank_matches(prefix: str, matches: Iterable[int], trie_tree: Trie, corrector=None, max_distance: int = 1,
+                 prefix_words: Sequence[str] = None) -> Iterator[Tuple[Tuple[int, ...], int]]:
+    """
+    generator of the completions of iter_ranked_completions from the exact matches of the prefix, found by the
+    caller (like iter_matches): the matches first, then the matches of the spelling corrections.
+    :param prefix: string of words that user input
+    :param matches: the packed keys of the exact matches of the prefix, in order.
+    :param trie_tree: the trie tree of the database.
+    :param corrector: the engine that finds spelling corrections. default: the trie tree itself.
+    :param max_distance: the maximum number of edits of a correction.
+    :param prefix_words: the words the last word stands for (see last_word_group).
+    :return: an iterator of (rank, packed key of: (file_id, sentence_id, position)), one per sentence.
+    """
+    score = base_score(prefix)
+    matches = (((-score, EXACT_MATCH), key) for key in matches)
+    corrections = (((penalty - score, index), key)
+                   for index, penalty, keys in iter_correction_stages(prefix, trie_tree, max_distance, corrector,
+                                                                      prefix_words)
+                   for key in keys)
+    seen = set()
+    for rank, key in chain(METRICS.timed_iter('completion.matches', matches),
+                           METRICS.timed_iter('completion.corrections', corrections)):
+        sentence = key >> POSITION_BITS
+        if sentence not in seen:
+            seen.add(sentence)
+            yield rank, key
+
+
+def base_score(prefix: str) -> int:
+    """
+    function to get the score of an exact match of a prefix: 2 points per letter of its words.
+    a match of a correction scores the same minus the penalty of the correction (see edit_penalty).
+    :param prefix: string of words that user input
+    :return: the score.
+    """
+    return 2 * sum(map(len, prefix.split()))
+
+
+def rank_score(rank: Tuple[int, int]) -> int:
+    """
+    function to get the score of a completion from its rank (see iter_ranked_completions).
+    """
+    return -rank[0]
+
+
+def iter_matches(user_input: str, trie_tree, k: int = 5, shift: int = 1,
+                 prefix_words: Sequence[str] = None) -> Iterator[int]:
+    """
+    generator of the exact matches of the user input, the last word being the beginning of a word.
+    a single word is answered from the trie node when its best completions were precomputed.
+    :param user_input: string of words that user input, the last one possibly not finished.
+    :param trie_tree: the trie tree of the database.
+    :param k: the number of matches the consumer is going to take.
+    :param shift: the shift between the words. (for finding the words in a sentence with a gap between them)
+    :param prefix_words: the words the last word stands for (see last_word_group).
+    :return: an iterator of packed keys of: (file_id, sentence_id, position), in order.
+    """
+    words = user_input.split()
+    if not words:
+        return iter(())
+    with METRICS.timer('completion.lookup'):
+        if len(words) == 1:
+            best = trie_tree.top_k(words[0], k)
+            if best is not None:
+                METRICS.inc('completion.top_k_hits')
+                # one location per sentence: when there are fewer than k there are no other sentences
+                return iter(best.keys)
+        prefix_group = last_word_group(words[-1], trie_tree, prefix_words)
+        groups = [[as_posting_list(search_word(word, trie_tree))] for word in words[:-1]] + [prefix_group]
+        groups, offsets = with_bigrams(words[:-1] + [None], groups, phrase_offsets(len(words), shift), trie_tree)
+    if METRICS.enabled:
+        for group in groups:
+            METRICS.observe('postings.keys', sum(map(len, group)))
+        METRICS.observe('postings.prefix_words', len(prefix_group))
+    return iter_phrase_matches(groups, offsets)
+
+
+def last_word_group(prefix: str, trie_tree, prefix_words: Sequence[str] = None) -> List[PostingList]:
+    """
+    function to get the posting lists of the words the unfinished last word of a query stands for.
+    :param prefix: the last word.
+    :param trie_tree: the trie tree of the database.
+    :param prefix_words: the words to use instead of the words of the trie that start with the prefix, when they
+     were collected beforehand (like the words of every shard of a sharded index, see shards.merge_prefix_words).
+    :return: the locations of each word, for the words that are in the trie.
+    """
+    if prefix_words is None:
+        return trie_tree.prefix_postings(prefix)
+    return [postings for postings in map(trie_tree.search, prefix_words) if len(postings)]
+
+
+def iter_error_corrections(prefix: str, trie_tree: Trie, max_distance: int = 1, corrector=None) -> Iterator[int]:
+    """
+    generator of the matches of the prefix with one misspelled word corrected.
+    the corrections of all the words are tried from the lowest penalty up (the first word first for equal
+    penalties), and the matches of the corrections of a word with the same penalty are in order.
+    :param prefix: string of words that user input
+    :param trie_tree: the trie tree of the database.
+    :param max_distance: the maximum number of edits of a correction.
+    :param corrector: the engine that finds spelling corrections. default: the trie tree itself.
+    :return: an iterator of packed keys of: (file_id, sentence_id, position)
+    """
+    for _, _, keys in iter_correction_stages(prefix, trie_tree, max_distance, corrector):
+        yield from keys
+
+
+def iter_correction_stages(prefix: str, trie_tree: Trie, max_distance: int = 1, corrector=None,
+                           prefix_words: Sequence[str] = None) -> Iterator[Tuple[int, int, Iterator[int]]]:
+    """
+    generator of the matches of the corrections of iter_error_corrections, one stage per corrected word and
+    penalty, best first.
+    the stages of every word are kept in a priority queue by (penalty, word index), and the matches of a stage
+    are only computed when it is popped, so a consumer that stops after k completions never intersects the
+    posting lists of the worse corrections. only one word is corrected, so when a word is not in the index
+    only its corrections can match, and when two words are not in the index none can. the last word stands for
+    the words it is the beginning of, like in iter_matches, so it is only unknown when no word starts with it.
+    :param prefix: string of words that user input
+    :param trie_tree: the trie tree of the database.
+    :param max_distance: the maximum number of edits of a correction.
+    :param corrector: the engine that finds spelling corrections. default: the trie tree itself.
+    :param prefix_words: the words the last word stands for (see last_word_group).
+    :return: an iterator of (index of the corrected word, penalty, iterator of the packed keys of its matches)
+    """
+    if corrector is None:
+        corrector = trie_tree
+    words = prefix.split()
+    offsets = phrase_offsets(len(words))
+    groups = [[as_posting_list(search_word(word, trie_tree))] for word in words[:-1]]
+    if words:
+        groups.append(last_word_group(words[-1], trie_tree, prefix_words))
+    unknown = [index for index, group in enumerate(groups) if not any(map(len, group))]
+    if len(unknown) > 1:
+        return
+    stages = []
+    for index in unknown or range(len(words)):
+        with METRICS.timer('corrections.edit_candidates'):
+            candidates = correction_candidates(words[index], corrector, max_distance)
+        # (penalty, index) is unique, so the sets of corrections are never compared
+        stages.extend((penalty, index, corrections) for penalty, corrections in candidates.items())
+    heapify(stages)
+    while stages:
+        penalty, index, corrections = heappop(stages)
+        METRICS.inc('corrections.tried', len(corrections))
+        # the corrections of a stage are one group, the union of their locations, so the other words are
+        # intersected with them once instead of once per correction
+        optional_groups = list(groups)
+        optional_groups[index] = [as_posting_list(search_word(optional_word, trie_tree))
+                                  for optional_word in sorted(corrections)]
+        exact_words = [None if other == index else word for other, word in enumerate(words[:-1])] + [None]
+        yield index, penalty, iter_phrase_matches(*with_bigrams(exact_words, optional_groups, offsets, trie_tree))
+
+
+def search(user_input: str, trie_tree, shift: int = 1) -> Sequence[SentenceIndex]:
     """
     function to search_test the autocomplete sentences from the database.
     :param user_input: string of words that user input
@@ -38,7 +275,23 @@ def search(user_input: str, trie_tree, shift: int = 1) -> List[SentenceIndex]:
     return indexes
 
 
-def search_word(word: str, trie_tree) -> List[SentenceIndex]:
+def search_with_prefix(user_input: str, trie_tree, shift: int = 1) -> PostingList:
+    """
+    function to search_test the autocomplete sentences, treating the last word as the beginning of a word.
+    :param user_input: string of words that user input, the last one possibly not finished.
+    :param trie_tree: the trie tree of the database.
+    :param shift: the shift between the words. (for finding the words in a sentence with a gap between them)
+    :return: a list of sentences that match the user input.
+    """
+    words = user_input.split()
+    if not words:
+        return PostingList()
+    indexes = [search_word(word, trie_tree) for word in words[:-1]]
+    indexes.append(trie_tree.search_prefix(words[-1]))
+    return filter_by_indexes(indexes, shift)
+
+
+def search_word(word: str, trie_tree) -> Sequence[SentenceIndex]:
     """
     function to search_test the autocomplete sentences from the database.
     :param trie_tree:
@@ -48,7 +301,7 @@ def search_word(word: str, trie_tree) -> List[SentenceIndex]:
     return trie_tree.search(word)
 
 
-def search_words(words: List[str], trie_tree, shift: int = 1) -> List[SentenceIndex]:
+def search_words(words: List[str], trie_tree, shift: int = 1) -> PostingList:
     """
     function to search_test the autocomplete sentences from the database.
     :param trie_tree:
@@ -60,127 +313,122 @@ def search_words(words: List[str], trie_tree, shift: int = 1) -> List[SentenceIn
     return filter_by_indexes(indexes, shift)
 
 
-def filter_by_indexes(indexes: List[List[SentenceIndex]], shift: int = 1) -> List[SentenceIndex]:
+def filter_by_indexes(indexes: List[Sequence[SentenceIndex]], shift: int = 1) -> PostingList:
     """
     function to filter the autocomplete sentences by indexes.
-    :param indexes: list of lists of indexes of: (file_id, sentence_id, position)
+    the words are intersected rarest first (see postings.intersect_at_offsets), whatever their order in the query.
+    :param indexes: list of posting lists (or lists of SentenceIndex) of: (file_id, sentence_id, position)
     :param shift: the shift between the words. (for finding the words in a sentence with a gap between them)
-    :return: a list of tuples of indexes of: (file_id, sentence_id, position)
+    :return: a sorted posting list of indexes of the first word: (file_id, sentence_id, position)
     """
-    res = indexes[0]
+    res = as_posting_list(indexes[0])
     if len(indexes) == 1:
         return res
-    for i in range(1, len(indexes)):
-        res = compare_indexes(res, indexes[i], shift + i - 1)
-    return res
+    with METRICS.timer('intersection'):
+        return intersect_at_offsets([res] + [as_posting_list(index) for index in indexes[1:]],
+                                    phrase_offsets(len(indexes), shift))
 
 
-def compare_indexes(indexes_of_first_word: List[SentenceIndex],
-                    indexes_of_second_word: List[SentenceIndex], shift: int = 1) -> List[SentenceIndex]:
+def with_bigrams(words: Sequence[Optional[str]], groups: List[List[PostingList]], offsets: List[int],
+                 trie_tree: Trie) -> Tuple[List[List[PostingList]], List[int]]:
+    """
+    function to replace the posting lists of adjacent words of a phrase by the locations of the pair, for the
+    pairs that are indexed (see Trie.build_bigrams).
+    a word of a pair is checked by the pair, so its own longer list is dropped.
+    :param words: the word of each group, or None when the group is not one exact word (a prefix, corrections).
+    :param groups: the posting lists of each word of the phrase.
+    :param offsets: the position of each word relative to the first one.
+    :param trie_tree: the trie tree of the database.
+    :return: the groups and their offsets.
+    """
+    pairs, pair_offsets, covered = [], [], set()
+    for i in range(len(words) - 1):
+        if words[i] is None or words[i + 1] is None or offsets[i + 1] != offsets[i] + 1:
+            continue
+        postings = trie_tree.bigram_postings(words[i], words[i + 1])
+        if postings is not None:
+            pairs.append([postings])
+            pair_offsets.append(offsets[i])
+            covered.update((i, i + 1))
+    if not pairs:
+        return groups, offsets
+    kept = [i for i in range(len(groups)) if i not in covered]
+    return [groups[i] for i in kept] + pairs, [offsets[i] for i in kept] + pair_offsets
+
+
+def phrase_offsets(count: int, shift: int = 1) -> List[int]:
+    """
+    function to get the position of every word of a phrase relative to the first word.
+    :param count: the number of words.
+    :param shift: the shift between the first and second words (the next words follow each other).
+    :return: the offsets, starting with 0.
+    """
+    return [0] + [shift + i - 1 for i in range(1, count)]
+
+
+def compare_indexes(indexes_of_first_word: Sequence[SentenceIndex],
+                    indexes_of_second_word: Sequence[SentenceIndex], shift: int = 1) -> PostingList:
     """
     function to compare the indexes of two words.
     :param indexes_of_first_word: list of indexes of the first word.
     :param indexes_of_second_word: list of indexes of the second word.
     :param shift: the shift between the words. (for finding the words in a sentence with a gap between them)
-    :return: a list of tuples of indexes of: (file_id, sentence_id, position)
+    :return: a sorted posting list of indexes of: (file_id, sentence_id, position)
+    """
+    return intersect_at_offsets([as_posting_list(indexes_of_first_word), as_posting_list(indexes_of_second_word)],
+                                [0, shift])
+
+
+def edit_penalty(edit: Edit) -> int:
+    """
+    function to get the score penalty of one edit of a misspelled word.
+    a changed letter costs 5 at the first letter, 4 at the second, down to 1 from the fifth letter on,
+    and an added or removed letter costs twice as much.
+    :param edit: the kind and position of the edit.
+    :return: the penalty.
+    """
+    penalty = max(1, 5 - edit.position)
+    return penalty if edit.kind == CHANGE else 2 * penalty
+
+
+def correction_candidates(word: str, corrector, max_distance: int = 1) -> Dict[int, Set[str]]:
+    """
+    function to find all the corrections of a word, grouped by penalty.
+    :param word: the misspelled word.
+    :param corrector: the trie tree (one walk of the trie) or a SymSpellIndex (dictionary lookups).
+    :param max_distance: the maximum number of edits of a correction.
+    :return: a dictionary from penalty to the corrections with that (lowest) penalty.
+    """
+    best_penalty = {}
+    for candidate, edits in corrector.edit_candidates(word, max_distance):
+        penalty = sum(map(edit_penalty, edits))
+        if penalty < best_penalty.get(candidate, penalty + 1):
+            best_penalty[candidate] = penalty
+    by_penalty = defaultdict(set)
+    for candidate, penalty in best_penalty.items():
+        by_penalty[penalty].add(candidate)
+    return by_penalty
+
+
+def find_closest_correction(word: str, score: int, trie_tree: Trie) -> Set[str]:
+    """
+    function to find the corrections of a word with the given penalty.
+    :param word: the misspelled word.
+    :param score: the penalty of the corrections (see edit_penalty).
+    :param trie_tree: the trie tree of the database.
+    :return: the corrections.
+    """
+    return correction_candidates(word, trie_tree).get(score, set())
+
+
+def find_error_correction(prefix, sentences_indexes, trie_tree, k, max_distance: int = 1, corrector=None):
+    """
+    function to add up to k locations of corrections of the prefix to a list.
+    :param prefix: string of words that user input
+    :param sentences_indexes: the list to extend.
+    :param trie_tree: the trie tree of the database.
+    :param k: the number of locations to add.
+    :param max_distance: the maximum number of edits of a correction.
+    :param corrector: the engine that finds spelling corrections. default: the trie tree itself.
     """
-    # this is a refactor of the code to improve the run time.
-    # by using a dictionary to group the indexes by the file_id and sentence_id. of the second word.
-    grouped_indexes = defaultdict(list)
-    for index in indexes_of_second_word:
-        grouped_indexes[(index.file_id, index.sentence_id)].append(index.position)
-
-    res = []
-    # now i only need to iterate over the indexes of the first word.
-    # (the first word is the one that has less indexes because it is usally already was comaperaed to all the other
-    # words above it in the sentence)
-    for index in indexes_of_first_word:
-        if (index.file_id, index.sentence_id) in grouped_indexes:
-            second_word_positions = grouped_indexes[(index.file_id, index.sentence_id)]
-            for position in second_word_positions:
-                second_word_position = position - shift
-                if index.position == second_word_position:
-                    res.append(index)
-                elif index.position < second_word_position:
-                    break
-
-    return res
-
-
-def find_closest_correction(word: str, score: int, trie_tree: Trie):
-    # word_indexes = []
-    optional_words = []
-    if score == 1:
-        if len(word) >= 5:
-            for index in range(4, len(word)):
-                optional = trie_tree.change_letter(word, index)
-                if optional:
-                    optional_words.append(optional)
-    elif score == 2:
-        if len(word) >= 5:
-            for index in range(4, len(word)):
-                optional = trie_tree.remove_letter(word, index)
-                if optional:
-                    optional_words.append(optional)
-                optional = trie_tree.add_letter(word, index)
-                if optional:
-                    optional_words.append(optional)
-        if len(word) >= 4:
-            optional = trie_tree.change_letter(word, 3)
-            if optional:
-                optional_words.append(optional)
-    elif score == 3:
-        if len(word) >= 3:
-            optional = trie_tree.change_letter(word, 2)
-            if optional:
-                optional_words.append(optional)
-    elif score == 4:
-        if len(word) >= 4:
-            optional_words.append(trie_tree.remove_letter(word, 3))
-            optional_words.append(trie_tree.add_letter(word, 3))
-        if len(word) >= 2:
-            optional_words.append(trie_tree.change_letter(word, 1))
-    elif score == 5:
-        optional_words.append(trie_tree.change_letter(word, 0))
-    elif score == 6:
-        if len(word) >= 3:
-            optional_words.append(trie_tree.remove_letter(word, 2))
-            optional_words.append(trie_tree.add_letter(word, 2))
-    elif score == 8:
-        if len(word) >= 2:
-            optional_words.append(trie_tree.remove_letter(word, 1))
-            optional_words.append(trie_tree.add_letter(word, 1))
-    elif score == 10:
-        optional_words.append(trie_tree.remove_letter(word, 0))
-        optional_words.append(trie_tree.add_letter(word, 0))
-
-    # for optional_word in optional_words:
-    #    word_indexes.append(search(optional_word, trie_tree))
-    # return word_indexes
-    uniq_words = set()
-    for optional_word in optional_words:
-        uniq_words = uniq_words.union(set(optional_word))
-    return uniq_words
-
-
-def find_error_correction(prefix, sentences_indexes, trie_tree, k):
-    split_prefix = prefix.split(" ")
-    if len(split_prefix) == 1:
-        for score in range(1, 11):
-            optional_words = find_closest_correction(prefix, score, trie_tree)
-            for optional_word in optional_words:
-                sentences_indexes += (search(optional_word, trie_tree))
-            if len(sentences_indexes) >= k:
-                return
-    else:
-        correction_result = []
-        for index in range(len(split_prefix)):
-            optional_error_word = split_prefix[index]
-            for score in range(1, 11):
-                optional_words = find_closest_correction(optional_error_word, score, trie_tree)
-                for optional_word in optional_words:
-                    optional_sentence = split_prefix
-                    optional_sentence[index] = optional_word
-                    sentences_indexes += (search_words(optional_sentence, trie_tree))
-                    if len(sentences_indexes) >= k:
-                        return
+    sentences_indexes.extend(map(decode, islice(iter_error_corrections(prefix, trie_tree, max_distance, corrector), k)))
@@ -0,0 +1,218 @@
+from array import array
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from instrumentation import METRICS
+from postings import PostingList, intersect_at_offsets, iter_phrase_matches
+from search.cache import CompletionCache
+from search.data_utils import AutoCompleteData
+from search.search_completions import materialize, rank_matches
+from trie import Edit, Trie
+
+# words whose corrections a session remembers before it forgets them all
+MAX_CORRECTED_WORDS = 256
+
+
+class _State:
+    """
+    The state of a session after one character of its text.
+
+    node is the trie node of the unfinished last word (None when no word starts with it), phrase the locations of
+    the first word of the finished words before it (None when it is the first word) and count their number.
+    matches holds every exact match of the text once they were all found, and results the completions
+    answered, by k.
+    """
+
+    __slots__ = ('node', 'word', 'phrase', 'count', 'previous', 'matches', 'results')
+
+    def __init__(self, node, word: str, phrase: Optional[PostingList], count: int, previous: '_State' = None):
+        self.node = node
+        self.word = word
+        self.phrase = phrase
+        self.count = count
+        self.previous = previous
+        self.matches: Optional[List[int]] = None
+        self.results: Dict[int, List[AutoCompleteData]] = {}
+
+
+class _CorrectionMemo:
+    """
+    The spelling corrector of a session: it remembers the corrections of the words, which the finished words
+    of the text ask for again on every keystroke.
+    """
+
+    def __init__(self, corrector):
+        self.corrector = corrector
+        self.candidates: Dict[Tuple[str, int], List[Tuple[str, Tuple[Edit, ...]]]] = {}
+
+    def edit_candidates(self, key: str, max_distance: int = 1) -> List[Tuple[str, Tuple[Edit, ...]]]:
+        candidates = self.candidates.get((key, max_distance))
+        if candidates is None:
+            if len(self.candidates) >= MAX_CORRECTED_WORDS:
+                self.candidates.clear()
+            candidates = self.candidates[key, max_distance] = self.corrector.edit_candidates(key, max_distance)
+        return candidates
+
+
+class CompletionSession:
+    """
+    CompletionSession answers the queries of one client that sends its whole text on every keystroke.
+
+    It keeps a state per character of the text: the trie node of the unfinished last word, the locations of
+    the finished words before it, and the completions already answered. A letter goes one step down the trie
+    from the node of the previous one, the finished words are intersected once (when the next word starts),
+    and deleting characters pops their states, with their answers. When the exact matches of a text ran out
+    before k completions they are all known, and a longer last word only looks for its matches among them. The
+    spelling corrections of the words are remembered, as the finished words are corrected again and again.
+
+    The completions are the ones of get_best_k_completion. The session starts over when the trie is updated.
+    """
+
+    def __init__(self, trie_tree: Trie, data_list: List, corrector=None, cache: CompletionCache = None,
+                 max_distance: int = 1):
+        self.trie_tree = trie_tree
+        self.data_list = data_list
+        self.corrector = corrector
+        self.cache = cache
+        self._corrections = _CorrectionMemo(corrector if corrector is not None else trie_tree)
+        self.max_distance = max_distance
+        self.text = ''
+        self._states = [_State(None, '', None, 0)]
+        self._version = trie_tree.version
+
+    def append(self, chars: str) -> None:
+        """
+        function to add characters at the end of the text.
+        :param chars: the characters typed.
+        """
+        self._check_index()
+        for char in chars:
+            self._push(char)
+
+    def backspace(self, count: int = 1) -> None:
+        """
+        function to delete characters from the end of the text.
+        :param count: the number of characters deleted.
+        """
+        count = min(count, len(self.text))
+        if count > 0:
+            del self._states[-count:]
+            self.text = self.text[:-count]
+
+    def set_text(self, text: str) -> None:
+        """
+        function to change the text to a new one, keeping the states of the beginning they share.
+        :param text: the whole text of the client.
+        """
+        self._check_index()
+        common = 0
+        for old, new in zip(self.text, text):
+            if old != new:
+                break
+            common += 1
+        self.backspace(len(self.text) - common)
+        self.append(text[common:])
+
+    def complete(self, k: int = 5) -> List[AutoCompleteData]:
+        """
+        function to get the best k completions of the text.
+        :param k: number of the best completions to return.
+        :return: a list of AutoCompleteData objects
+        """
+        self._check_index()
+        state = self._states[-1]
+        results = state.results.get(k)
+        if results is None:
+            key = self.cache.make_key(self.text, k) if self.cache is not None else None
+            if key is not None:
+                results = self.cache.get(self.trie_tree, key)
+            if results is None:
+                results = self._compute(state, k)
+                if key is not None:
+                    self.cache.put(self.trie_tree, key, results, self._version)
+            state.results[k] = results
+        else:
+            METRICS.inc('session.hits')
+        return list(results)
+
+    def _check_index(self) -> None:
+        if self._version != self.trie_tree.version:
+            text = self.text
+            self.text = ''
+            self._states = [_State(None, '', None, 0)]
+            self._version = self.trie_tree.version
+            self._corrections.candidates.clear()
+            self.append(text)
+
+    def _push(self, char: str) -> None:
+        top = self._states[-1]
+        if char.isspace():
+            # a text ending with spaces has the completions of the text without them
+            state = top
+        elif not self.text or self.text[-1].isspace():
+            if top.word:
+                phrase, count = self._finished_phrase(top), top.count + 1
+            else:
+                phrase, count = None, 0
+            state = _State(self.trie_tree.search_from(self.trie_tree.root, char), char, phrase, count)
+        else:
+            node = None if top.node is None else self.trie_tree.search_from(top.node, char)
+            state = _State(node, top.word + char, top.phrase, top.count, top)
+        self._states.append(state)
+        self.text += char
+
+    def _finished_phrase(self, state: _State) -> PostingList:
+        """
+        function to get the locations of the first word of the words of a state, its last word being finished.
+        """
+        if state.node is None or not self.trie_tree.is_word(state.node):
+            return PostingList()
+        postings = self.trie_tree.locations(state.node)
+        if state.phrase is None:
+            return postings
+        with METRICS.timer('session.intersection'):
+            return intersect_at_offsets([state.phrase, postings], [0, state.count])
+
+    def _compute(self, state: _State, k: int) -> List[AutoCompleteData]:
+        if not state.word:
+            return []
+        with METRICS.timer('completion'):
+            ranked = list(islice(rank_matches(self.text, self._iter_matches(state, k), self.trie_tree,
+                                              self._corrections, self.max_distance), k))
+            return materialize(ranked, self.data_list)
+
+    def _iter_matches(self, state: _State, k: int) -> Iterator[int]:
+        """
+        generator of the exact matches of the text of a state, like search_completions.iter_matches.
+        the matches are remembered in the state when the consumer reads them all.
+        """
+        if state.node is None or (state.phrase is not None and not len(state.phrase)):
+            state.matches = []
+            return
+        if state.count == 0:
+            best = self.trie_tree.top_k(state.word, k)
+            if best is not None:
+                METRICS.inc('completion.top_k_hits')
+                yield from best.keys
+                return
+        previous = state.previous
+        if previous is not None and previous.matches is not None and not previous.matches:
+            # the words of a longer prefix are among the words of the shorter one
+            state.matches = []
+            return
+        with METRICS.timer('completion.lookup'):
+            prefix_group, complete = self.trie_tree.postings_below(state.node)
+        if previous is not None and previous.matches is not None:
+            METRICS.inc('session.narrowed')
+            groups, offsets = [[PostingList(array('Q', previous.matches))], prefix_group], [0, state.count]
+        elif state.phrase is not None:
+            groups, offsets = [[state.phrase], prefix_group], [0, state.count]
+        else:
+            groups, offsets = [prefix_group], [0]
+        found = []
+        for key in iter_phrase_matches(groups, offsets):
+            found.append(key)
+            yield key
+        if complete:
+            # when only some words of the prefix were collected, the longer prefixes may collect others
+            state.matches = found
@@ -0,0 +1,348 @@
+import argparse
+import heapq
+import multiprocessing
+import secrets
+import threading
+import zlib
+from itertools import chain
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from compact_trie import TRIE_BACKENDS
+from instrumentation import METRICS
+from postings import FILE_SHIFT, decode
+from read_to_trie import iter_text_files, read_file_list
+from search.data_utils import AutoCompleteData
+from search.logic import find_source_by_indexes
+from search.search_completions import iter_ranked_completions, rank_score
+from sentence_store import SENTENCE_STORES
+from symspell import SymSpellIndex
+from trie import PREFIX_MAX_WORDS, Trie
+
+PARTITIONS = ('range', 'hash')
+
+# the bits of a packed key below the file id: (sentence_id, position)
+_LOCAL_KEY_MASK = (1 << FILE_SHIFT) - 1
+
+
+class ShardError(Exception):
+    """
+    Raised when a shard failed to build its index or to answer a query.
+    """
+
+
+def partition_files(file_paths: Sequence[str], shards: int, partition: str = 'range') -> List[List[Tuple[int, str]]]:
+    """
+    function to split the text files of a directory between the shards.
+    :param file_paths: the paths of the files, in the order read_files visits them.
+    :param shards: the number of shards.
+    :param partition: 'range' gives every shard a contiguous run of files, 'hash' spreads the files by a hash
+     of their path (a file stays in its shard when other files are added).
+    :return: the files of every shard, as (position in file_paths, path), in order.
+    """
+    if partition not in PARTITIONS:
+        raise ValueError(f"unknown partition {partition!r}, expected one of {PARTITIONS}")
+    assigned = [[] for _ in range(shards)]
+    per_shard = -(-len(file_paths) // shards)
+    for position, path in enumerate(file_paths):
+        if partition == 'range':
+            shard = position // per_shard
+        else:
+            shard = zlib.crc32(path.encode()) % shards
+        assigned[shard].append((position, path))
+    return assigned
+
+
+def merge_prefix_words(word_lists: Sequence[Sequence[str]], max_words: int = PREFIX_MAX_WORDS) -> List[str]:
+    """
+    function to merge the words every shard found below the last word of a query (see Trie.prefix_words).
+    a shard collects its first max_words words in breadth first order, so the first max_words words of all the
+    shards in that order are the words one index of all the files collects, whatever the files of each shard.
+    (the bound of the nodes visited is still checked by every shard in its own trie.)
+    :param word_lists: the words of every shard, in breadth first order.
+    :param max_words: the maximum number of words of a prefix search.
+    :return: the words of the prefix search of one index of all the files.
+    """
+    return sorted(set(chain.from_iterable(word_lists)), key=Trie.breadth_first_key)[:max_words]
+
+
+class Shard:
+    """
+    Shard is the index of some of the files: its own trie, sentence store and spelling corrector.
+    The sentence store is one of SENTENCE_STORES ('tokens' or 'offsets').
+
+    Its file ids are local (0 for its first file); positions holds the position of each of its files in
+    the whole corpus, which the coordinator turns into the global file ids.
+    """
+
+    def __init__(self, files: Sequence[Tuple[int, str]], trie_backend: str = 'nodes', corrector: str = 'trie',
+                 top_k: int = 0, top_k_depth: int = 4, sentence_store: str = 'tokens', bigrams: int = 0,
+                 compress_postings: bool = False):
+        self.trie_tree = TRIE_BACKENDS[trie_backend]()
+        self.data_list = SENTENCE_STORES[sentence_store]()
+        positions = dict((path, position) for position, path in files)
+        stored = []
+        read_file_list(self.trie_tree, [path for _, path in files], self.data_list, 0, stored)
+        # files without sentences get no file id, like with read_files
+        self.positions = [positions[path] for path in stored]
+        if top_k:
+            self.trie_tree.build_top_k(top_k, top_k_depth)
+        if bigrams:
+            self.trie_tree.build_bigrams(self.data_list, bigrams)
+        if compress_postings:
+            self.trie_tree.compress_postings()
+        self.corrector = SymSpellIndex.from_trie(self.trie_tree) if corrector == 'symspell' else None
+
+    def prefix_words(self, prefix: str) -> List[str]:
+        """
+        function to find the words of this shard that start with the last word of a query.
+        :param prefix: the last word.
+        :return: the words, in breadth first order (see Trie.prefix_words).
+        """
+        return self.trie_tree.prefix_words(prefix)
+
+    def complete(self, prefix: str, k: int,
+                 prefix_words: Sequence[str] = None) -> List[Tuple[Tuple[int, ...], int, List[str], Optional[str]]]:
+        """
+        function to compute the best k completions of the prefix in this shard.
+        :param prefix: the normalized prefix.
+        :param k: number of the completions.
+        :param prefix_words: the words the last word stands for, from all the shards (see merge_prefix_words).
+         default: the words of this shard that start with it.
+        :return: the completions as (rank, local packed key, words of the sentence, path of the file or None),
+         best first.
+        """
+        results = []
+        for rank, key in iter_ranked_completions(prefix, self.trie_tree, k, self.corrector,
+                                                 prefix_words=prefix_words):
+            index = decode(key)
+            results.append((rank, key, self.data_list[index.file_id][index.sentence_id],
+                            find_source_by_indexes(index, self.data_list)))
+            if len(results) == k:
+                break
+        return results
+
+
+def serve_shard(connection: Connection, shard: Shard) -> None:
+    """
+    function to answer the queries of a coordinator until it closes the connection.
+    the connection is one end of a Pipe (a local shard process) or a socket (see main).
+    :param connection: the connection to the coordinator.
+    :param shard: the index of this shard.
+    """
+    connection.send(('ready', shard.positions))
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message[0] == 'close':
+            return
+        try:
+            if message[0] == 'words':
+                connection.send(('ok', shard.prefix_words(*message[1:])))
+            else:
+                connection.send(('ok', shard.complete(*message[1:])))
+        except Exception as error:
+            connection.send(('error', repr(error)))
+
+
+def _run_shard(connection: Connection, files: Sequence[Tuple[int, str]], options: Dict) -> None:
+    try:
+        shard = Shard(files, **options)
+    except Exception as error:
+        connection.send(('error', repr(error)))
+        return
+    try:
+        serve_shard(connection, shard)
+    finally:
+        connection.close()
+
+
+class ShardedIndex:
+    """
+    ShardedIndex is the coordinator of an index split between shards by file.
+
+    A query is sent to every shard at once, so they compute their completions in parallel, and their best k
+    are merged by (rank, global key): the order of search_completions.iter_completions on one index of all
+    the files, so the completions are the same as without shards. The words the unfinished last word stands
+    for are collected from every shard first (see merge_prefix_words), so the shards complete it with the
+    words one index would, not with the first words of their own files. It can be shared by threads: their
+    queries take turns on the connections.
+    """
+
+    def __init__(self, connections: List[Connection], processes: Sequence[multiprocessing.Process] = ()):
+        self.connections = connections
+        self.processes = list(processes)
+        # the replies of a query are told apart by their order in the pipes, so one query is sent at a time
+        self._lock = threading.Lock()
+        try:
+            positions = [self._receive(connection) for connection in connections]
+        except ShardError:
+            self.close()
+            raise
+        # the global file ids are the ids read_files gives the files with sentences, in corpus order
+        global_ids = {position: file_id for file_id, position in enumerate(sorted(p for ps in positions for p in ps))}
+        self.file_ids = [[global_ids[position] for position in shard_positions] for shard_positions in positions]
+
+    @classmethod
+    def start(cls, dir_path: str, shards: int, partition: str = 'range', trie_backend: str = 'nodes',
+              corrector: str = 'trie', top_k: int = 0, top_k_depth: int = 4,
+              sentence_store: str = 'tokens', bigrams: int = 0,
+              compress_postings: bool = False) -> 'ShardedIndex':
+        """
+        function to run every shard of a directory in its own local process, which builds its index.
+        :param dir_path: the directory of the text files.
+        :param shards: the number of shards.
+        :param partition: how the files are split between the shards (see partition_files).
+        :param trie_backend: the trie implementation of the shards.
+        :param corrector: the spelling correction engine of the shards: 'trie' or 'symspell'.
+        :param top_k: if given, the shards precompute the best top_k completions of short prefixes.
+        :param top_k_depth: the longest prefix whose completions are precomputed.
+        :param sentence_store: how the shards keep the sentences, one of SENTENCE_STORES.
+        :param bigrams: if given, the shards index the pairs of adjacent words seen at least that many times in
+         their files.
+        :param compress_postings: the shards keep their long posting lists compressed.
+        :return: the coordinator, once every shard is ready.
+        """
+        context = multiprocessing.get_context('fork')
+        options = {'trie_backend': trie_backend, 'corrector': corrector, 'top_k': top_k, 'top_k_depth': top_k_depth,
+                   'sentence_store': sentence_store, 'bigrams': bigrams,
+                   'compress_postings': compress_postings}
+        connections, processes = [], []
+        for files in partition_files(list(iter_text_files(dir_path)), shards, partition):
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=_run_shard, args=(child_connection, files, options), daemon=True)
+            process.start()
+            child_connection.close()
+            connections.append(connection)
+            processes.append(process)
+        return cls(connections, processes)
+
+    @classmethod
+    def connect(cls, addresses: Sequence[Tuple[str, int]], authkey: bytes) -> 'ShardedIndex':
+        """
+        function to coordinate shards served on sockets (see main).
+        :param addresses: the (host, port) of every shard.
+        :param authkey: the key the shards were started with.
+        :return: the coordinator, once every shard is ready.
+        :raises ValueError: if the key is empty.
+        """
+        if not authkey:
+            raise ValueError("the shards are only reached with the key they were started with")
+        return cls([Client(address, authkey=authkey) for address in addresses])
+
+    def complete(self, prefix: str, k: int = 5) -> List[AutoCompleteData]:
+        """
+        function to get the best k completions of the prefix from all the shards.
+        :param prefix: the normalized prefix.
+        :param k: number of the completions.
+        :return: a list of AutoCompleteData objects
+        """
+        with METRICS.timer('shards.complete'):
+            words = prefix.split()
+            prefix_words = None
+            if words:
+                prefix_words = merge_prefix_words(self._round(('words', words[-1])))
+            replies = self._round(('complete', prefix, k, prefix_words))
+            ranked = []
+            for file_ids, reply in zip(self.file_ids, replies):
+                for rank, key, sentence, source in reply:
+                    ranked.append((rank, (file_ids[key >> FILE_SHIFT] << FILE_SHIFT) | (key & _LOCAL_KEY_MASK),
+                                   sentence, source))
+            return [AutoCompleteData(decode(key), sentence, rank_score(rank), source)
+                    for rank, key, sentence, source in heapq.nsmallest(k, ranked, key=lambda item: item[:2])]
+
+    def close(self) -> None:
+        for connection in self.connections:
+            try:
+                connection.send(('close',))
+            except OSError:
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self) -> 'ShardedIndex':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _round(self, message: tuple) -> List:
+        # every reply is read, even after a failed one, so none is left in a pipe for the next query
+        with self._lock:
+            for connection in self.connections:
+                connection.send(message)
+            replies, failure = [], None
+            for connection in self.connections:
+                try:
+                    replies.append(self._receive(connection))
+                except ShardError as error:
+                    failure = failure or error
+        if failure is not None:
+            raise failure
+        return replies
+
+    @staticmethod
+    def _receive(connection: Connection):
+        try:
+            status, value = connection.recv()
+        except EOFError:
+            raise ShardError("a shard closed its connection") from None
+        if status == 'error':
+            raise ShardError(f"a shard failed: {value}")
+        return value
+
+
+def shard_listener(address: Tuple[str, int], authkey: bytes) -> Listener:
+    """
+    function to listen for the coordinator of a shard. the messages are unpickled, so only a coordinator that
+    knows the key may connect.
+    :param address: the (host, port) to listen on.
+    :param authkey: the key the coordinator must know.
+    :return: the listener.
+    :raises ValueError: if the key is empty.
+    """
+    if not authkey:
+        raise ValueError("a shard is not served without an authentication key")
+    return Listener(address, authkey=authkey)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one shard of the index on a socket.")
+    parser.add_argument("path", help="directory of the text files")
+    parser.add_argument("--shard", type=int, required=True, help="the number of this shard, from 0")
+    parser.add_argument("--shards", type=int, required=True, help="the number of shards")
+    parser.add_argument("--partition", choices=PARTITIONS, default="range", help="how the files are split")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--authkey", help="key the coordinator must know to connect (default: a random key, "
+                                         "printed at start-up)")
+    parser.add_argument("--trie", choices=sorted(TRIE_BACKENDS), default="nodes")
+    parser.add_argument("--corrector", choices=["trie", "symspell"], default="trie")
+    parser.add_argument("--top-k", type=int, default=0, metavar="K")
+    parser.add_argument("--top-k-depth", type=int, default=4, metavar="D")
+    parser.add_argument("--store", choices=sorted(SENTENCE_STORES), default="tokens",
+                        help="keep the sentences as word ids, or only their byte offsets in the source files")
+    parser.add_argument("--bigrams", type=int, default=0, metavar="MIN_COUNT")
+    parser.add_argument("--compress-postings", action="store_true")
+    args = parser.parse_args()
+    authkey = args.authkey
+    if authkey is None:
+        authkey = secrets.token_hex(16)
+        print(f"Authentication key: {authkey}")
+    elif not authkey:
+        parser.error("the authentication key is empty")
+    files = partition_files(list(iter_text_files(args.path)), args.shards, args.partition)[args.shard]
+    shard = Shard(files, args.trie, args.corrector, args.top_k, args.top_k_depth, args.store, args.bigrams,
+                  args.compress_postings)
+    with shard_listener((args.host, args.port), authkey.encode()) as listener:
+        print(f"Shard {args.shard}/{args.shards} ({len(shard.positions)} files) on {args.host}:{args.port}")
+        while True:
+            with listener.accept() as connection:
+                serve_shard(connection, shard)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Union
+
+from search.data_utils import AutoCompleteData
+from search.search_completions import compute_best_k_completion
+from search.session import CompletionSession
+from trie import Trie
+
+# the index of a worker process, inherited from the parent when the worker is forked
+_worker_index = None
+# the sessions of the clients routed to this process, the most recently used last
+_sessions: 'OrderedDict[str, CompletionSession]' = OrderedDict()
+
+
+def init_worker(trie_tree: Trie, data_list: List, corrector=None) -> None:
+    """
+    function to give the index to the current process, used as the initializer of a forked pool.
+    with the fork start method the arguments are inherited, not pickled, so the workers share the pages
+    of the index with the parent until they write to them.
+    :param trie_tree: the trie tree of the database.
+    :param data_list: list of the sentences.
+    :param corrector: the engine that finds spelling corrections. default: the trie tree itself.
+    """
+    global _worker_index
+    _worker_index = (trie_tree, data_list, corrector)
+    _sessions.clear()
+
+
+def complete_prefix(prefix: str, k: int) -> List[Dict[str, Union[str, int]]]:
+    """
+    function to compute the completions of a prefix with the index of this process.
+    :param prefix: the normalized prefix.
+    :param k: number of the completions.
+    :return: the completions as JSON objects.
+    """
+    trie_tree, data_list, corrector = _worker_index
+    return [completion_to_json(data) for data in compute_best_k_completion(prefix, trie_tree, data_list, k, corrector)]
+
+
+def continue_session(session_id: str, prefix: str, k: int,
+                     max_sessions: int) -> Tuple[List[Dict[str, Union[str, int]]], int]:
+    """
+    function to compute the completions of a prefix in the session of a client, kept in this process.
+    a session changes as it answers, so all the queries of a session must go to the same process, one at a time.
+    :param session_id: the name of the session of the client.
+    :param prefix: the normalized prefix.
+    :param k: number of the completions.
+    :param max_sessions: the number of sessions this process keeps, the least recently used are dropped.
+    :return: the completions as JSON objects, and the number of sessions kept by this process.
+    """
+    session = _sessions.get(session_id)
+    if session is None:
+        session = _sessions[session_id] = CompletionSession(*_worker_index)
+        while len(_sessions) > max_sessions:
+            _sessions.popitem(last=False)
+    else:
+        _sessions.move_to_end(session_id)
+    session.set_text(prefix)
+    return [completion_to_json(data) for data in session.complete(k)], len(_sessions)
+
+
+def completion_to_json(data: AutoCompleteData) -> Dict[str, Union[str, int]]:
+    """
+    function to convert a completion to a JSON object.
+    :param data: the completion.
+    :return: the sentence, source, offset and score of the completion.
+    """
+    return {'completed_sentence': ' '.join(data.completed_sentence), 'source_text': data.source_text,
+            'offset': data.offset, 'score': data.score}
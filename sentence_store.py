@@ -0,0 +1,321 @@
+import mmap
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+from text_cleaning import clean_text
+
+# source files kept mapped at a time by an OffsetSentenceStore
+MAX_MAPPED_FILES = 256
+
+
+class Vocabulary:
+    """
+    Vocabulary interns every distinct word to a small integer id.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.words: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def intern(self, words: Iterable[str]) -> List[int]:
+        """
+        Returns the ids of the given words, giving the next free id to the words never seen before.
+        """
+        ids = self.ids
+        result = []
+        for word in words:
+            word_id = ids.get(word)
+            if word_id is None:
+                word_id = ids[word] = len(self.words)
+                self.words.append(word)
+            result.append(word_id)
+        return result
+
+    def decode(self, word_ids: Iterable[int]) -> List[str]:
+        return list(map(self.words.__getitem__, word_ids))
+
+    def memory_usage(self) -> int:
+        """
+        Estimates the memory used by the vocabulary, in bytes.
+        """
+        return sys.getsizeof(self.ids) + sys.getsizeof(self.words) + sum(map(sys.getsizeof, self.words))
+
+
+class TokenFile:
+    """
+    TokenFile holds the sentences of one file as word ids in one flat array.
+
+    The words of sentence i are tokens[offsets[i]:offsets[i + 1]]. Indexing decodes that sentence only,
+    so it is a read-only list of sentences, each a list of words, like an entry of the data list.
+    """
+
+    __slots__ = ('vocabulary', 'tokens', 'offsets')
+
+    def __init__(self, vocabulary: Vocabulary, tokens: array = None, offsets: array = None):
+        self.vocabulary = vocabulary
+        self.tokens = tokens if tokens is not None else array('I')
+        self.offsets = offsets if offsets is not None else array('I', [0])
+
+    @classmethod
+    def from_sentences(cls, vocabulary: Vocabulary, sentences: Iterable[Sequence[str]]) -> 'TokenFile':
+        """
+        Encodes sentences given as lists of words.
+
+        Args:
+            vocabulary (Vocabulary): The vocabulary the words are interned in.
+            sentences (Iterable[Sequence[str]]): The sentences of the file.
+
+        Returns:
+            TokenFile: The encoded file.
+        """
+        encoded = cls(vocabulary)
+        for words in sentences:
+            encoded.append_sentence(words)
+        return encoded
+
+    def append_sentence(self, words: Sequence[str]) -> None:
+        """
+        Adds a sentence after the last one.
+        """
+        self.tokens.extend(self.vocabulary.intern(words))
+        self.offsets.append(len(self.tokens))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, sentence_id: int) -> List[str]:
+        if not 0 <= sentence_id < len(self):
+            raise IndexError(sentence_id)
+        return self.vocabulary.decode(self.tokens[self.offsets[sentence_id]:self.offsets[sentence_id + 1]])
+
+    def __iter__(self) -> Iterator[List[str]]:
+        for sentence_id in range(len(self)):
+            yield self[sentence_id]
+
+    def memory_usage(self) -> int:
+        return sys.getsizeof(self.tokens) + sys.getsizeof(self.offsets)
+
+
+class TokenSentenceStore:
+    """
+    TokenSentenceStore keeps the sentences of every file as word ids over a shared vocabulary.
+
+    It is used like the data list filled by read_files: store[file_id][sentence_id] is the list of words of
+    a sentence, and files are appended, replaced or removed as lists of sentences. Each word of the text
+    costs 4 bytes instead of a pointer to its own string object.
+    """
+
+    def __init__(self, vocabulary: Vocabulary = None):
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.files: List[TokenFile] = []
+
+    def _encode(self, sentences: Union[TokenFile, Iterable[Sequence[str]]]) -> TokenFile:
+        if isinstance(sentences, TokenFile) and sentences.vocabulary is self.vocabulary:
+            return sentences
+        return TokenFile.from_sentences(self.vocabulary, sentences)
+
+    def append(self, sentences: Union[TokenFile, Iterable[Sequence[str]]]) -> None:
+        self.files.append(self._encode(sentences))
+
+    def pop(self) -> TokenFile:
+        return self.files.pop()
+
+    def __setitem__(self, file_id: int, sentences: Union[TokenFile, Iterable[Sequence[str]]]) -> None:
+        self.files[file_id] = self._encode(sentences)
+
+    def __getitem__(self, file_id: int) -> TokenFile:
+        return self.files[file_id]
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __iter__(self) -> Iterator[TokenFile]:
+        return iter(self.files)
+
+    def token_count(self) -> int:
+        """
+        Returns the number of words of all the sentences.
+        """
+        return sum(len(file.tokens) for file in self.files)
+
+    def memory_usage(self) -> int:
+        """
+        Estimates the memory used by the store and its vocabulary, in bytes.
+
+        Returns:
+            int: The size of the token and offset arrays of every file, the file list and the vocabulary.
+        """
+        return (sys.getsizeof(self.files) + sum(sys.getsizeof(file) + file.memory_usage() for file in self.files)
+                + self.vocabulary.memory_usage())
+
+
+class SourceChangedError(Exception):
+    """
+    Raised when a sentence is read from a source file that changed since it was indexed.
+    """
+
+
+class MappedFiles:
+    """
+    MappedFiles keeps the most recently read source files memory-mapped, closing the least recently
+    read one when more than `limit` are open.
+
+    The size and modification time of a file are taken once, when it is mapped, and a read checks them against
+    the ones it was indexed with. A file rewritten while it stays mapped is noticed once it is mapped again, but
+    its size is checked at every read (one fstat): reading the pages of a truncated file would kill the process.
+    The maps are shared by the threads of a server, so they are read and evicted under a lock.
+    """
+
+    def __init__(self, limit: int = MAX_MAPPED_FILES):
+        self.limit = limit
+        self.maps: 'OrderedDict[str, Tuple[mmap.mmap, Tuple[int, int]]]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __getstate__(self) -> int:
+        # a copy sent to another process (see read_to_trie.tokenize_files) maps the files again
+        return self.limit
+
+    def __setstate__(self, limit: int) -> None:
+        self.__init__(limit)
+
+    def read(self, path: str, fingerprint: Tuple[int, int], offset: int, length: int) -> bytes:
+        """
+        Returns a byte range of a source file, raising SourceChangedError if its (size, mtime) is not fingerprint.
+        """
+        with self.lock:
+            entry = self.maps.get(path)
+            if entry is None:
+                entry = self._map(path)
+            else:
+                self.maps.move_to_end(path)
+            mapped, mapped_fingerprint = entry
+            if mapped_fingerprint != fingerprint:
+                raise SourceChangedError(f"{path} changed since it was indexed")
+            # mmap.size is the current size of the file, not of the map
+            if isinstance(mapped, mmap.mmap) and mapped.size() != mapped_fingerprint[0]:
+                self._close(self.maps.pop(path)[0])
+                raise SourceChangedError(f"{path} changed since it was indexed")
+            return mapped[offset:offset + length]
+
+    def _map(self, path: str) -> Tuple[mmap.mmap, Tuple[int, int]]:
+        with open(path, 'rb') as file:
+            status = os.fstat(file.fileno())
+            # an empty file cannot be mapped, and has no sentences to read
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if status.st_size else b''
+        entry = self.maps[path] = (mapped, (status.st_size, status.st_mtime_ns))
+        if len(self.maps) > self.limit:
+            self._close(self.maps.popitem(last=False)[1][0])
+        return entry
+
+    @staticmethod
+    def _close(mapped) -> None:
+        if isinstance(mapped, mmap.mmap):
+            mapped.close()
+
+    def close(self) -> None:
+        with self.lock:
+            while self.maps:
+                self._close(self.maps.popitem()[1][0])
+
+
+class OffsetFile:
+    """
+    OffsetFile locates the sentences of one file by their byte range in the file itself.
+
+    Only the offset and the length of every sentence are kept (12 bytes a sentence). Indexing reads that
+    range from a memory map of the file and cleans it again, as it was cleaned when it was indexed.
+    """
+
+    __slots__ = ('path', 'size', 'mtime', 'offsets', 'lengths', 'mapped_files')
+
+    def __init__(self, path: str, mapped_files: MappedFiles = None):
+        status = os.stat(path)
+        self.path = path
+        self.size = status.st_size
+        self.mtime = status.st_mtime_ns
+        self.offsets = array('Q')
+        self.lengths = array('I')
+        self.mapped_files = mapped_files if mapped_files is not None else MappedFiles(1)
+
+    def append_line(self, offset: int, length: int) -> None:
+        """
+        Adds a sentence after the last one, by the byte range of its line.
+        """
+        self.offsets.append(offset)
+        self.lengths.append(length)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, sentence_id: int) -> List[str]:
+        if not 0 <= sentence_id < len(self):
+            raise IndexError(sentence_id)
+        line = self.mapped_files.read(self.path, (self.size, self.mtime), self.offsets[sentence_id],
+                                      self.lengths[sentence_id])
+        return clean_text(str(line, 'utf-8')).split()
+
+    def __iter__(self) -> Iterator[List[str]]:
+        for sentence_id in range(len(self)):
+            yield self[sentence_id]
+
+    def memory_usage(self) -> int:
+        return sys.getsizeof(self.offsets) + sys.getsizeof(self.lengths) + sys.getsizeof(self.path)
+
+
+class OffsetSentenceStore:
+    """
+    OffsetSentenceStore keeps no text: the sentences of every file are read back from the source file.
+
+    It is used like the data list filled by read_files, for files added by read_files. The sentences
+    cost 12 bytes each whatever their length, the text stays in the page cache, and the path of every
+    file is known, so completions report their real source. The source files must not change while
+    the store is used (a changed file raises SourceChangedError), and it cannot be updated in place.
+    """
+
+    def __init__(self, max_mapped_files: int = MAX_MAPPED_FILES):
+        self.mapped_files = MappedFiles(max_mapped_files)
+        self.files: List[OffsetFile] = []
+
+    def new_file(self, path: str) -> OffsetFile:
+        """
+        Returns an empty file of this store, to be filled with the sentences of a source file and appended.
+        """
+        return OffsetFile(path, self.mapped_files)
+
+    def append(self, sentences: OffsetFile) -> None:
+        if not isinstance(sentences, OffsetFile):
+            raise TypeError("an OffsetSentenceStore only stores the files it located (see new_file)")
+        # a file located by another process maps its source on its own until it joins the store
+        sentences.mapped_files = self.mapped_files
+        self.files.append(sentences)
+
+    def __getitem__(self, file_id: int) -> OffsetFile:
+        return self.files[file_id]
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def __iter__(self) -> Iterator[OffsetFile]:
+        return iter(self.files)
+
+    def source_path(self, file_id: int) -> str:
+        return self.files[file_id].path
+
+    def memory_usage(self) -> int:
+        """
+        Estimates the memory used by the store, in bytes (the mapped files are not counted).
+        """
+        return sys.getsizeof(self.files) + sum(sys.getsizeof(file) + file.memory_usage() for file in self.files)
+
+    def close(self) -> None:
+        self.mapped_files.close()
+
+
+SENTENCE_STORES = {'tokens': TokenSentenceStore, 'offsets': OffsetSentenceStore}
@@ -0,0 +1,379 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import re
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+import dotenv
+from cli_interface.cli import PATTERN, init
+from compact_trie import TRIE_BACKENDS
+from search.cache import CompletionCache
+from search.worker_pool import complete_prefix, continue_session, init_worker
+from sentence_store import SENTENCE_STORES, SourceChangedError
+from symspell import SymSpellIndex
+from trie import Trie
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_K = 50
+MAX_BODY_BYTES = 64 * 1024
+MAX_SESSION_ID = 128
+STATUS_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict',
+                  413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+                  504: 'Gateway Timeout'}
+
+
+class SupersededError(Exception):
+    """
+    Raised when a query of a session is dropped before it was computed, as the session sent a newer one.
+    """
+
+
+def _started(executor: ProcessPoolExecutor, workers: int) -> ProcessPoolExecutor:
+    # a pool forks its processes on its first task: fork them now, before the event loop and its threads exist,
+    # rather than in the middle of serving, when a lock held by another thread would stay locked in the child
+    for future in [executor.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return executor
+
+
+class CompletionServer:
+    """
+    CompletionServer answers completion queries over HTTP/JSON.
+
+    The index is loaded once. The lookups run in a pool of processes forked when the server is created,
+    before it serves (they share the pages of the index copy-on-write), or in one thread when the pool is
+    empty. Identical queries in flight are computed once, their results are cached, at most max_concurrent
+    lookups run at a time and at most max_pending distinct queries wait, the others are answered 503.
+
+    A client that sends a query on every keystroke can name a session: its queries continue the
+    CompletionSession of that name, kept for the max_sessions most recent sessions by one of session_workers
+    processes, chosen by a hash of the name (or by one thread when the pool is empty). A session worker computes
+    one query at a time, apart from the max_concurrent lookups of the other queries, so the sessions cannot take
+    their slots. Session queries count in max_pending, and only the newest query of a session is computed: the
+    older ones still waiting are answered 409, and those that timed out are dropped.
+    """
+
+    def __init__(self, trie_tree: Trie, data_list: List, corrector=None, workers: int = 0,
+                 max_concurrent: int = 0, max_pending: int = 1024, timeout: float = 2.0, cache_size: int = 4096,
+                 max_sessions: int = 1024, session_workers: int = None):
+        self.trie_tree = trie_tree
+        self.data_list = data_list
+        self.corrector = corrector
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.max_concurrent = max_concurrent or max(1, workers)
+        self.cache = CompletionCache(cache_size)
+        self.executor = self._make_executor(trie_tree, data_list, corrector, workers)
+        self.session_executors = self._make_session_executors(
+            trie_tree, data_list, corrector, workers if session_workers is None else session_workers)
+        self.counters = {'requests': 0, 'lookups': 0, 'session_lookups': 0, 'coalesced': 0, 'superseded': 0,
+                         'rejected': 0, 'timeouts': 0, 'errors': 0}
+        self._in_flight: Dict[Tuple[str, int], asyncio.Future] = {}
+        # the number of the newest query of every session that is waiting for its completions
+        self._session_queries: Dict[str, int] = {}
+        self._session_pending = 0
+        self._query_number = 0
+        self._semaphore = None
+        # one lock per session worker: a session query is submitted once its worker is idle
+        self._session_locks = None
+        # the number of sessions every session worker kept after its last query
+        self._session_counts = [0] * len(self.session_executors)
+
+    @property
+    def pending(self) -> int:
+        """
+        the number of queries waiting for a lookup: the distinct stateless queries and the session queries.
+        """
+        return len(self._in_flight) + self._session_pending
+
+    @staticmethod
+    def _make_executor(trie_tree: Trie, data_list: List, corrector, workers: int) -> Executor:
+        if workers > 0:
+            return _started(ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                                                initializer=init_worker, initargs=(trie_tree, data_list, corrector)),
+                            workers)
+        init_worker(trie_tree, data_list, corrector)
+        return ThreadPoolExecutor(1)
+
+    @staticmethod
+    def _make_session_executors(trie_tree: Trie, data_list: List, corrector, workers: int) -> List[Executor]:
+        # a session changes as it answers, so every session worker is a pool of its own: its sessions stay in it
+        if workers > 0:
+            context = multiprocessing.get_context('fork')
+            return [_started(ProcessPoolExecutor(1, mp_context=context, initializer=init_worker,
+                                                 initargs=(trie_tree, data_list, corrector)), 1)
+                    for _ in range(workers)]
+        # the index of this process was given by _make_executor
+        return [ThreadPoolExecutor(1)]
+
+    async def complete(self, prefix: str, k: int) -> List[Dict[str, Union[str, int]]]:
+        """
+        function to get the completions of a prefix, sharing the lookup of identical queries in flight.
+        :param prefix: string of words that user input.
+        :param k: number of the completions.
+        :return: the completions as JSON objects.
+        :raises OverflowError: if too many queries are waiting.
+        :raises asyncio.TimeoutError: if the completions took longer than the timeout.
+        """
+        key = self.cache.make_key(prefix, k)
+        cached = self.cache.get(self.trie_tree, key)
+        if cached is not None:
+            return cached
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.counters['coalesced'] += 1
+        else:
+            if self.pending >= self.max_pending:
+                self.counters['rejected'] += 1
+                raise OverflowError("too many pending queries")
+            self.counters['lookups'] += 1
+            future = asyncio.ensure_future(self._lookup(key))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        try:
+            # shielded: one client timing out must not cancel the lookup the others wait for
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            raise
+
+    async def complete_in_session(self, session_id: str, prefix: str, k: int) -> List[Dict[str, Union[str, int]]]:
+        """
+        function to get the completions of a prefix typed by one client, continuing its session.
+        :param session_id: the name of the session of the client.
+        :param prefix: string of words that user input.
+        :param k: number of the completions.
+        :return: the completions as JSON objects.
+        :raises OverflowError: if too many queries are waiting.
+        :raises SupersededError: if the session sent a newer query before this one was computed.
+        :raises asyncio.TimeoutError: if the completions took longer than the timeout.
+        """
+        key = self.cache.make_key(prefix, k)
+        cached = self.cache.get(self.trie_tree, key)
+        if cached is not None:
+            return cached
+        if self.pending >= self.max_pending:
+            self.counters['rejected'] += 1
+            raise OverflowError("too many pending queries")
+        self.counters['session_lookups'] += 1
+        self._query_number += 1
+        number = self._session_queries[session_id] = self._query_number
+        self._session_pending += 1
+        try:
+            return await asyncio.wait_for(self._session_lookup(session_id, number, key), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            raise
+        finally:
+            self._session_pending -= 1
+            # a query that timed out is not computed anymore
+            if self._session_queries.get(session_id) == number:
+                del self._session_queries[session_id]
+
+    async def _session_lookup(self, session_id: str, number: int,
+                              key: Tuple[str, int]) -> List[Dict[str, Union[str, int]]]:
+        worker = zlib.crc32(session_id.encode('utf-8')) % len(self.session_executors)
+        if self._session_locks is None:
+            self._session_locks = [asyncio.Lock() for _ in self.session_executors]
+        async with self._session_locks[worker]:
+            # the query may have been replaced or have timed out while it waited for the worker
+            if self._session_queries.get(session_id) != number:
+                self.counters['superseded'] += 1
+                raise SupersededError("the session sent a newer query")
+            version = self.trie_tree.version
+            max_sessions = -(-self.max_sessions // len(self.session_executors))
+            result, self._session_counts[worker] = await asyncio.get_running_loop().run_in_executor(
+                self.session_executors[worker], continue_session, session_id, *key, max_sessions)
+        self.cache.put(self.trie_tree, key, result, version)
+        return result
+
+    async def _lookup(self, key: Tuple[str, int]) -> List[Dict[str, Union[str, int]]]:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        async with self._semaphore:
+            version = self.trie_tree.version
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, complete_prefix, *key)
+        self.cache.put(self.trie_tree, key, result, version)
+        return result
+
+    async def handle(self, method: str, target: str, body: bytes) -> Tuple[int, Dict]:
+        """
+        function to answer one request.
+        :param method: the HTTP method.
+        :param target: the request target (path and query string).
+        :param body: the request body.
+        :return: the status code and the JSON response.
+        """
+        self.counters['requests'] += 1
+        url = urlsplit(target)
+        if url.path == '/health':
+            return 200, {'status': 'ok'}
+        if url.path == '/stats':
+            return 200, {**self.counters, 'pending': self.pending, 'sessions': sum(self._session_counts),
+                         'cache': self.cache.stats()}
+        if url.path != '/complete':
+            return 404, {'error': f"no such endpoint {url.path}"}
+        if method == 'GET':
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        elif method == 'POST':
+            try:
+                query = json.loads(body or b'{}')
+            except ValueError:
+                return 400, {'error': "the body is not JSON"}
+            if not isinstance(query, dict):
+                return 400, {'error': "the body is not a JSON object"}
+        else:
+            return 405, {'error': f"{method} is not allowed"}
+        prefix = re.sub(PATTERN, '', str(query.get('q', query.get('prefix', '')))).lower().strip()
+        try:
+            k = int(query.get('k', 5))
+        except (TypeError, ValueError):
+            return 400, {'error': "k is not a number"}
+        if not prefix:
+            return 400, {'error': "the prefix is empty"}
+        if not 0 < k <= MAX_K:
+            return 400, {'error': f"k must be between 1 and {MAX_K}"}
+        session_id = query.get('session')
+        if session_id is not None and not 0 < len(str(session_id)) <= MAX_SESSION_ID:
+            return 400, {'error': f"the session must be 1 to {MAX_SESSION_ID} characters"}
+        try:
+            if session_id is not None and self.max_sessions > 0:
+                completions = await self.complete_in_session(str(session_id), prefix, k)
+            else:
+                completions = await self.complete(prefix, k)
+        except OverflowError as error:
+            return 503, {'error': str(error)}
+        except SupersededError as error:
+            return 409, {'error': str(error)}
+        except SourceChangedError as error:
+            # a source file of --store offsets changed under the index: the sentences cannot be read back
+            return 500, {'error': str(error)}
+        except asyncio.TimeoutError:
+            return 504, {'error': f"no answer within {self.timeout} seconds"}
+        except Exception as error:
+            # a broken worker pool or a bug: the client still gets an answer, the server keeps running
+            self.counters['errors'] += 1
+            LOGGER.exception("completing %r failed", prefix)
+            return 500, {'error': f"internal error: {error!r}"}
+        return 200, {'prefix': prefix, 'completions': completions}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        function to serve the HTTP/1.1 requests of one connection, keeping it open between requests.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                parts = request_line.decode('latin-1').split()
+                length = headers.get('content-length', '0')
+                if len(parts) != 3 or not length.isdigit():
+                    await self._respond(writer, 400, {'error': "malformed request"}, False)
+                    break
+                if int(length) > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {'error': "the body is too large"}, False)
+                    break
+                body = await reader.readexactly(int(length))
+                method, target, version = parts
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status, payload = await self.handle(method, target, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, payload: Dict, keep_alive: bool) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status} {STATUS_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}"
+                     f"\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8080) -> None:
+        """
+        function to serve requests until the task is cancelled.
+        :param host: the address to listen on.
+        :param port: the port to listen on.
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Listening on http://{host}:{port}/complete?q=...")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+        for executor in self.session_executors:
+            executor.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP/JSON server for the search engine.")
+    parser.add_argument("path", nargs="?", help="directory of the text files (default: PATH_TO_DATA from .env)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--trie", choices=sorted(TRIE_BACKENDS), default="nodes",
+                        help="trie implementation used for the index")
+    parser.add_argument("--snapshot", help="index snapshot file to load, (re)built when missing or out of date")
+    parser.add_argument("--workers", type=int, default=1, metavar="N", help="number of processes reading the files")
+    parser.add_argument("--lookup-workers", type=int, default=multiprocessing.cpu_count(), metavar="N",
+                        help="number of processes computing completions (0 computes them in a thread)")
+    parser.add_argument("--max-concurrent", type=int, default=0, metavar="N",
+                        help="lookups computed at the same time (default: one per lookup worker)")
+    parser.add_argument("--max-pending", type=int, default=1024, metavar="N",
+                        help="distinct queries waiting for a lookup before new ones are answered 503")
+    parser.add_argument("--timeout", type=float, default=2.0, metavar="SECONDS",
+                        help="time to answer a query before it is answered 504")
+    parser.add_argument("--cache-size", type=int, default=4096, metavar="N",
+                        help="number of query results kept in the LRU cache (0 disables it)")
+    parser.add_argument("--max-sessions", type=int, default=1024, metavar="N",
+                        help="keystroke sessions of the clients kept (0 answers the queries of a session without it)")
+    parser.add_argument("--session-workers", type=int, metavar="N",
+                        help="number of processes keeping the sessions (default: --lookup-workers, 0 keeps them "
+                             "in a thread)")
+    parser.add_argument("--corrector", choices=["trie", "symspell"], default="trie",
+                        help="spelling correction engine: walk the trie, or look up a symmetric-delete index")
+    parser.add_argument("--top-k", type=int, default=0, metavar="K",
+                        help="precompute the best K completions of short prefixes")
+    parser.add_argument("--top-k-depth", type=int, default=4, metavar="D",
+                        help="longest prefix (in letters) whose completions are precomputed")
+    parser.add_argument("--store", choices=sorted(SENTENCE_STORES), default="tokens",
+                        help="keep the sentences as word ids in memory, or only their byte offsets in the source "
+                             "files, read back when they are shown")
+    args = parser.parse_args()
+    path = args.path or dotenv.get_key(dotenv.find_dotenv(), "PATH_TO_DATA")
+    trie_tree, data_list = init(path, args.trie, False, args.snapshot, args.workers, None, args.top_k,
+                                args.top_k_depth, args.store)
+    corrector = SymSpellIndex.from_trie(trie_tree) if args.corrector == "symspell" else None
+    server = CompletionServer(trie_tree, data_list, corrector, args.lookup_workers, args.max_concurrent,
+                              args.max_pending, args.timeout, args.cache_size, args.max_sessions, args.session_workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
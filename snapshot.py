@@ -0,0 +1,293 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, List, Tuple, Union
+
+from compact_trie import FREE, CompactTrie
+from postings import BLOCK_SIZE, CompressedKeys, PostingList
+from read_to_trie import read_files
+from sentence_store import TokenSentenceStore
+from trie import Trie
+
+MAGIC = b'ACSNAP\0\0'
+SNAPSHOT_VERSION = 2
+PREAMBLE = struct.Struct('<8sII')
+ALIGNMENT = 8
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot file is missing, corrupt, of another version or out of date.
+    """
+
+
+class MappedTrie(CompactTrie):
+    """
+    MappedTrie is a read-only CompactTrie whose buffers are memoryviews over a mapped snapshot.
+
+    The posting lists are the packed keys of every slot (posting_keys, from posting_offsets). In a
+    snapshot written with compress=True, the long lists are compressed blocks instead (posting_blocks,
+    the first block of every slot, and the first key, offset and data of every block), see
+    Trie.compress_postings.
+    """
+
+    def __init__(self, base: memoryview, check: memoryview, end: memoryview, posting_offsets: memoryview,
+                 posting_keys: memoryview, posting_blocks: memoryview = None, block_firsts: memoryview = None,
+                 block_offsets: memoryview = None, block_data: memoryview = None):
+        self.base = base
+        self.check = check
+        self.end = end
+        self.posting_offsets = posting_offsets
+        self.posting_keys = posting_keys
+        self.posting_blocks = posting_blocks
+        self.block_firsts = block_firsts
+        self.block_offsets = block_offsets
+        self.block_data = block_data
+        self.root = 0
+
+    def locations(self, node: int) -> PostingList:
+        """
+        Returns the word locations of the given slot as a zero-copy view into the snapshot.
+        """
+        if self.posting_blocks is not None:
+            first, last = self.posting_blocks[node], self.posting_blocks[node + 1]
+            if first != last:
+                return PostingList(CompressedKeys.from_blocks(self.block_firsts[first:last],
+                                                              self.block_offsets[first:last + 1], self.block_data))
+        return PostingList(self.posting_keys[self.posting_offsets[node]:self.posting_offsets[node + 1]])
+
+    def compress_postings(self, min_length: int = 0) -> int:
+        """
+        Keeps the posting lists as they are stored in the snapshot (see write_snapshot).
+        """
+        return 0
+
+    def _word_postings(self, key: str) -> PostingList:
+        raise TypeError("a MappedTrie is read-only, rebuild the index to add words")
+
+    def remove_postings(self, key: str, start: int, stop: int) -> None:
+        raise TypeError("a MappedTrie is read-only, rebuild the index to remove words")
+
+    def index_stats(self) -> Dict[str, int]:
+        """
+        Returns the counts of the mapped trie and the size of each mapped buffer, in bytes (they live in
+        the page cache, not the heap).
+        """
+        posting_sections = [self.posting_offsets, self.posting_keys, self.posting_blocks, self.block_firsts,
+                            self.block_offsets, self.block_data]
+        postings = len(self.posting_keys)
+        if self.posting_blocks is not None:
+            postings += sum(len(self.locations(slot)) for slot in range(len(self.end))
+                            if self.posting_blocks[slot] != self.posting_blocks[slot + 1])
+        return {'nodes': sum(1 for parent in self.check if parent != FREE), 'words': bytes(self.end).count(1),
+                'postings': postings, 'base_bytes': self.base.nbytes, 'check_bytes': self.check.nbytes,
+                'flag_bytes': self.end.nbytes,
+                'posting_bytes': sum(section.nbytes for section in posting_sections if section is not None)}
+
+
+class MappedSentenceStore:
+    """
+    MappedSentenceStore reads sentences from a mapped snapshot.
+
+    It is indexed like the `data_list` built by `read_files`: store[file_id][sentence_id] is the list
+    of words of the sentence, decoded on access.
+    """
+
+    def __init__(self, text: memoryview, sentence_offsets: memoryview, file_offsets: memoryview):
+        self.text = text
+        self.sentence_offsets = sentence_offsets
+        self.file_offsets = file_offsets
+
+    def __len__(self) -> int:
+        return len(self.file_offsets) - 1
+
+    def __getitem__(self, file_id: int) -> 'MappedFile':
+        if not 0 <= file_id < len(self):
+            raise IndexError(file_id)
+        return MappedFile(self, self.file_offsets[file_id], self.file_offsets[file_id + 1])
+
+
+class MappedFile:
+    """
+    The sentences of one file in a MappedSentenceStore.
+    """
+
+    def __init__(self, store: MappedSentenceStore, first: int, last: int):
+        self.store = store
+        self.first = first
+        self.last = last
+
+    def __len__(self) -> int:
+        return self.last - self.first
+
+    def __getitem__(self, sentence_id: int) -> List[str]:
+        if not 0 <= sentence_id < len(self):
+            raise IndexError(sentence_id)
+        offsets = self.store.sentence_offsets
+        index = self.first + sentence_id
+        return str(self.store.text[offsets[index]:offsets[index + 1]], 'utf-8').split(' ')
+
+
+def source_fingerprint(dir_path: str) -> str:
+    """
+    Returns a digest of the name, size and modification time of every text file under dir_path.
+    """
+    entries = []
+    for root, _, file_names in os.walk(dir_path):
+        for file_name in file_names:
+            if file_name.endswith(".txt"):
+                file_path = os.path.join(root, file_name)
+                stat = os.stat(file_path)
+                entries.append(f"{os.path.relpath(file_path, dir_path)}\0{stat.st_size}\0{stat.st_mtime_ns}")
+    return hashlib.sha1('\n'.join(sorted(entries)).encode('utf-8')).hexdigest()
+
+
+def write_snapshot(trie: Trie, data_list: List, snapshot_path: str, source_dir: str, compress: bool = False,
+                   fingerprint: Union[str, None] = None) -> None:
+    """
+    Serializes the trie, its posting lists and the sentences into a snapshot file laid out as
+    MAGIC | version (uint32) | header length (uint32) | JSON header | sections (8-byte aligned).
+    :param trie: the trie of the words (any backend, it is converted to the double-array layout).
+    :param data_list: the sentences, indexed as data_list[file_id][sentence_id] -> list of words.
+    :param snapshot_path: the file to write.
+    :param source_dir: the directory the index was built from, fingerprinted to detect changes.
+    :param compress: store the long posting lists in compressed blocks (see Trie.compress_postings), which are
+     searched in place, instead of 8 bytes a location.
+    :param fingerprint: the source_fingerprint of source_dir taken before the index was built, so a file changed
+     while it was read makes the snapshot out of date. default: the fingerprint of source_dir now.
+    """
+    if fingerprint is None:
+        fingerprint = source_fingerprint(source_dir)
+    compact = trie if isinstance(trie, CompactTrie) else CompactTrie.from_trie(trie)
+    size = len(compact.check)
+    posting_offsets = array('Q', [0])
+    posting_keys = array('Q')
+    # the blocks of the compressed lists one after the other: the block offsets are into all their data
+    posting_blocks = array('Q', [0])
+    block_firsts = array('Q')
+    block_offsets = array('Q', [0])
+    block_data = bytearray()
+    for slot in range(size):
+        if compact.end[slot]:
+            keys = compact.locations(slot).keys
+            if compress and len(keys) >= BLOCK_SIZE:
+                compressed = CompressedKeys.from_keys(keys)
+                block_firsts.extend(compressed.firsts)
+                block_offsets.extend(offset + len(block_data) for offset in compressed.offsets[1:])
+                block_data += compressed.data
+            else:
+                posting_keys.extend(keys)
+        posting_offsets.append(len(posting_keys))
+        posting_blocks.append(len(block_firsts))
+    posting_sections = [('posting_keys', posting_keys)]
+    if compress:
+        posting_sections += [('posting_blocks', posting_blocks), ('block_firsts', block_firsts),
+                             ('block_offsets', block_offsets), ('block_data', bytes(block_data))]
+
+    text = bytearray()
+    sentence_offsets = array('Q', [0])
+    file_offsets = array('Q', [0])
+    for file_lines in data_list:
+        for words in file_lines:
+            text += ' '.join(words).encode('utf-8')
+            sentence_offsets.append(len(text))
+        file_offsets.append(len(sentence_offsets) - 1)
+
+    sections = [
+        ('base', array('i', compact.base[:size])),
+        ('check', array('i', compact.check[:size])),
+        ('end', bytes(compact.end[:size])),
+        ('posting_offsets', posting_offsets),
+        *posting_sections,
+        ('text', bytes(text)),
+        ('sentence_offsets', sentence_offsets),
+        ('file_offsets', file_offsets),
+    ]
+    header = {'fingerprint': fingerprint, 'sections': {}}
+    offset = 0
+    for name, data in sections:
+        nbytes = len(memoryview(data).cast('B'))
+        header['sections'][name] = [offset, nbytes, data.typecode if isinstance(data, array) else 'B']
+        offset += _padded(nbytes)
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _padded(PREAMBLE.size + len(header_bytes))
+
+    temp_path = snapshot_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(PREAMBLE.pack(MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+        file.write(header_bytes)
+        file.write(bytes(data_start - PREAMBLE.size - len(header_bytes)))
+        for _, data in sections:
+            nbytes = len(memoryview(data).cast('B'))
+            file.write(data)
+            file.write(bytes(_padded(nbytes) - nbytes))
+    os.replace(temp_path, snapshot_path)
+
+
+def open_snapshot(snapshot_path: str, source_dir: Union[str, None] = None) -> Tuple[MappedTrie, MappedSentenceStore]:
+    """
+    Maps a snapshot file and returns the trie and the sentence store backed by it.
+    Nothing is copied out of the file: the sections are wrapped in memoryviews.
+    :param snapshot_path: the snapshot file.
+    :param source_dir: if given, the snapshot is rejected when the directory changed since it was built.
+    :return: the mapped trie and the mapped sentence store.
+    :raises SnapshotError: if the snapshot cannot be used.
+    """
+    try:
+        with open(snapshot_path, 'rb') as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as error:
+        raise SnapshotError(f"cannot open snapshot {snapshot_path}: {error}") from error
+    if len(mapped) < PREAMBLE.size:
+        raise SnapshotError(f"{snapshot_path} is not a snapshot")
+    magic, version, header_length = PREAMBLE.unpack_from(mapped)
+    if magic != MAGIC:
+        raise SnapshotError(f"{snapshot_path} is not a snapshot")
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"{snapshot_path} has version {version}, expected {SNAPSHOT_VERSION}")
+    # a truncated or corrupt header is a snapshot that cannot be used, like one of another version
+    try:
+        header = json.loads(mapped[PREAMBLE.size:PREAMBLE.size + header_length])
+        fingerprint = header['fingerprint']
+        data_start = _padded(PREAMBLE.size + header_length)
+        view = memoryview(mapped)
+        sections = {}
+        for name, (offset, nbytes, typecode) in header['sections'].items():
+            if offset < 0 or nbytes < 0 or data_start + offset + nbytes > len(mapped):
+                raise ValueError(f"section {name} is outside of the file")
+            sections[name] = view[data_start + offset:data_start + offset + nbytes].cast(typecode)
+        trie = MappedTrie(sections['base'], sections['check'], sections['end'], sections['posting_offsets'],
+                          sections['posting_keys'], sections.get('posting_blocks'), sections.get('block_firsts'),
+                          sections.get('block_offsets'), sections.get('block_data'))
+        store = MappedSentenceStore(sections['text'], sections['sentence_offsets'], sections['file_offsets'])
+    except (AttributeError, KeyError, TypeError, ValueError) as error:
+        raise SnapshotError(f"{snapshot_path} is corrupt: {error!r}") from error
+    if source_dir is not None and fingerprint != source_fingerprint(source_dir):
+        raise SnapshotError(f"{snapshot_path} is out of date with {source_dir}")
+    return trie, store
+
+
+def _padded(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a snapshot of the search index.")
+    parser.add_argument("path", help="directory of the text files")
+    parser.add_argument("snapshot", help="snapshot file to write")
+    parser.add_argument("--compress-postings", action="store_true", help="store the posting lists compressed")
+    args = parser.parse_args()
+    fingerprint = source_fingerprint(args.path)
+    trie_tree = CompactTrie()
+    data_list = TokenSentenceStore()
+    read_files(trie_tree, args.path, data_list, 0)
+    write_snapshot(trie_tree, data_list, args.snapshot, args.path, args.compress_postings, fingerprint)
+    print(f"Wrote {args.snapshot} ({os.path.getsize(args.snapshot) / 2 ** 20:.1f} MB).")
+
+
+if __name__ == "__main__":
+    main()
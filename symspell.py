@@ -0,0 +1,144 @@
+import sys
+from typing import Dict, Iterable, List, Set, Tuple
+
+from trie import ADD, CHANGE, REMOVE, Edit, Trie
+
+
+class SymSpellIndex:
+    """
+    SymSpellIndex finds spelling corrections with dictionary lookups instead of a trie walk.
+
+    Every word of the vocabulary is stored under each of its deletion variants (the word with up to
+    max_distance letters removed). Two words are within max_distance edits only if they share a
+    variant, so the corrections of a word are found by looking up its own variants and checking the
+    few words found there. It has the same correction interface as Trie (edit_candidates,
+    add_letter, change_letter, remove_letter) and returns the same results.
+    """
+
+    def __init__(self, max_distance: int = 1):
+        self.max_distance = max_distance
+        self.deletes: Dict[str, List[str]] = {}
+        self.trie = None
+        self.version = None
+
+    @classmethod
+    def from_trie(cls, trie: Trie, max_distance: int = 1) -> 'SymSpellIndex':
+        """
+        Builds the index from the words of a trie. The index rebuilds itself when the trie changes.
+
+        Args:
+            trie (Trie): The trie of the vocabulary.
+            max_distance (int): The maximum number of edits of a correction (1 or 2).
+
+        Returns:
+            SymSpellIndex: The index.
+        """
+        index = cls(max_distance)
+        index.trie = trie
+        index.rebuild()
+        return index
+
+    def rebuild(self) -> None:
+        """
+        Rebuilds the deletion variants from the current words of the trie.
+        """
+        self.deletes = {}
+        self.add_words(self.trie.words())
+        self.version = self.trie.version
+
+    def add_words(self, words: Iterable[str]) -> None:
+        """
+        Adds words to the vocabulary.
+        """
+        deletes = self.deletes
+        for word in words:
+            for variant in _deletion_variants(word, self.max_distance):
+                bucket = deletes.get(variant)
+                if bucket is None:
+                    deletes[variant] = [word]
+                else:
+                    bucket.append(word)
+
+    def edit_candidates(self, key: str, max_distance: int = 1) -> List[Tuple[str, Tuple[Edit, ...]]]:
+        """
+        Finds the words within max_distance edits of the given word.
+
+        Args:
+            key (str): The (possibly misspelled) word.
+            max_distance (int): The maximum number of edits, at most the distance the index was built for.
+
+        Returns:
+            List[Tuple[str, Tuple[Edit, ...]]]: The words found with the edits that lead to them,
+            exactly as Trie.edit_candidates returns them.
+        """
+        if max_distance > self.max_distance:
+            raise ValueError(f"the index was built for {self.max_distance} edits, not {max_distance}")
+        if self.trie is not None and self.trie.version != self.version:
+            self.rebuild()
+        words: Set[str] = set()
+        for variant in _deletion_variants(key, max_distance):
+            words.update(self.deletes.get(variant, ()))
+        found = []
+        for word in words:
+            if word != key:
+                scripts = []
+                _edit_scripts(key, word, 0, 0, max_distance, (), scripts)
+                found.extend((word, edits) for edits in set(scripts))
+        return found
+
+    def add_letter(self, key: str, index: int) -> List[str]:
+        """
+        Returns the words formed by adding a letter at the specified index, like Trie.add_letter.
+        """
+        return self._single_edit(key, Edit(ADD, index))
+
+    def change_letter(self, key: str, index: int) -> List[str]:
+        """
+        Returns the words formed by changing the letter at the specified index, like Trie.change_letter.
+        """
+        return self._single_edit(key, Edit(CHANGE, index))
+
+    def remove_letter(self, key: str, index: int) -> List[str]:
+        """
+        Returns the words formed by removing the letter at the specified index, like Trie.remove_letter.
+        """
+        return self._single_edit(key, Edit(REMOVE, index))
+
+    def memory_usage(self) -> int:
+        """
+        Estimates the memory used by the index, in bytes (the words themselves are shared with the buckets).
+        """
+        total = sys.getsizeof(self.deletes)
+        for variant, bucket in self.deletes.items():
+            total += sys.getsizeof(variant) + sys.getsizeof(bucket)
+        return total
+
+    def _single_edit(self, key: str, edit: Edit) -> List[str]:
+        if edit.position >= len(key):
+            return []
+        return sorted(word for word, edits in self.edit_candidates(key, 1) if edits == (edit,))
+
+
+def _deletion_variants(word: str, max_distance: int) -> Set[str]:
+    variants = {word}
+    layer = {word}
+    for _ in range(max_distance):
+        layer = {variant[:index] + variant[index + 1:] for variant in layer for index in range(len(variant))}
+        variants |= layer
+    return variants
+
+
+def _edit_scripts(key: str, word: str, i: int, j: int, budget: int, edits: Tuple[Edit, ...],
+                  scripts: List[Tuple[Edit, ...]]) -> None:
+    # the edit sequences that turn key into word, with the branching rules of Trie._edit_walk
+    if budget == 0 or i == len(key):
+        if key[i:] == word[j:] and edits:
+            scripts.append(edits)
+        return
+    if j < len(word) and key[i] == word[j]:
+        _edit_scripts(key, word, i + 1, j + 1, budget, edits, scripts)
+    _edit_scripts(key, word, i + 1, j, budget - 1, edits + (Edit(REMOVE, i),), scripts)
+    if j < len(word):
+        _edit_scripts(key, word, i, j + 1, budget - 1, edits + (Edit(ADD, i),), scripts)
+        if key[i] != word[j]:
+            _edit_scripts(key, word, i + 1, j + 1, budget - 1, edits + (Edit(CHANGE, i),), scripts)
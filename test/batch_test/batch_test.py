@@ -0,0 +1,30 @@
+import io
+import json
+
+import pytest
+from trie import Trie
+
+batch = pytest.importorskip('cli_interface.batch')
+
+
+@pytest.fixture
+def index():
+    trie_tree, data_list = Trie(), [[]]
+    for row, sentence in enumerate(["machine learning is fun", "machine learns fast", "hello world"]):
+        data_list[0].append(sentence.split())
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    return trie_tree, data_list
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_run_batch_keeps_the_order(index, workers):
+    queries = ["hello\n", "Machine lea\n", "\n", "machne\n"] * 50
+    output = io.StringIO()
+    assert batch.run_batch(queries, output, *index, k=2, workers=workers, chunk_size=3) == len(queries)
+    answers = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [answer['query'] for answer in answers] == [query.rstrip('\n') for query in queries]
+    assert [data['offset'] for data in answers[0]['completions']] == [2]
+    assert [data['offset'] for data in answers[1]['completions']] == [0, 1]
+    assert answers[2] == {'query': '', 'prefix': '', 'completions': []}
+    assert [data['offset'] for data in answers[3]['completions']] == [0, 1]
@@ -0,0 +1,90 @@
+import json
+import sys
+from collections import Counter
+
+import pytest
+from benchmarks import parallel_build, suite
+from benchmarks.corpus import generate_corpus
+from text_cleaning import PATTERN_RE
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    dir_path = str(tmp_path / 'corpus')
+    generate_corpus(dir_path, files=3, sentences=40, vocabulary=300)
+    return dir_path
+
+
+def _read(paths):
+    texts = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as file:
+            texts.append(file.read())
+    return texts
+
+
+def test_corpus_is_reproducible(tmp_path):
+    first = generate_corpus(str(tmp_path / 'a'), files=2, sentences=30, vocabulary=100, seed=7)
+    second = generate_corpus(str(tmp_path / 'b'), files=2, sentences=30, vocabulary=100, seed=7)
+    other = generate_corpus(str(tmp_path / 'c'), files=2, sentences=30, vocabulary=100, seed=8)
+    assert len(first) == 2
+    assert _read(first) == _read(second)
+    assert _read(first) != _read(other)
+    assert all(len(text.splitlines()) == 30 for text in _read(first))
+
+
+def test_corpus_words_follow_zipf(tmp_path):
+    paths = generate_corpus(str(tmp_path), files=1, sentences=2000, vocabulary=500, zipf=1.1)
+    counts = Counter(word for text in _read(paths) for word in PATTERN_RE.sub(' ', text.lower()).split())
+    assert len(counts) <= 500
+    frequencies = [count for _, count in counts.most_common()]
+    # the word of rank r is drawn about r ** 1.1 times less often than the first one
+    assert 5 < frequencies[0] / frequencies[9] < 25
+    assert frequencies[0] > 10 * frequencies[99]
+
+
+def test_compare_reports_the_regressions():
+    baseline = {'build': {'build_s': 1.0, 'peak_mb': 10.0}, 'search': {'mean_us': 2.0, 'p50_us': 2.0, 'ops': 10}}
+    results = {'build': {'build_s': 1.1, 'peak_mb': 13.0}, 'search': {'mean_us': 3.0, 'p50_us': 1.0, 'ops': 99},
+               'insert': {'mean_us': 5.0}}
+    regressions = suite.compare(results, baseline, tolerance=0.2)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('build.peak_mb') and regressions[1].startswith('search.mean_us')
+    assert suite.compare(results, baseline, tolerance=0.6) == []
+
+
+def test_run_times_every_benchmark(corpus):
+    results = suite.run(corpus, 'compact', queries=20, memory=False)
+    assert results['build']['files'] == 3
+    assert results['build']['sentences'] == 120
+    for name in ['insert', 'search', 'compare_indexes', 'filter_by_indexes', 'get_best_k_completion']:
+        assert results[name]['ops'] == 20
+        assert 0 < results[name]['p50_us'] <= results[name]['p99_us']
+    assert 0 < results['find_error_correction']['ops'] <= 20
+
+
+def test_compare_option_fails_on_a_regression(tmp_path, monkeypatch, capsys):
+    report_path, baseline_path = str(tmp_path / 'results.json'), str(tmp_path / 'baseline.json')
+    options = ['--files', '2', '--sentences', '20', '--vocabulary', '100', '--queries', '10', '--no-memory']
+    monkeypatch.setattr(sys, 'argv', ['suite', *options, '--json', report_path])
+    suite.main()
+    with open(report_path, 'r', encoding='utf-8') as file:
+        report = json.load(file)
+    assert report['corpus']['files'] == 2 and 'build' in report['results']
+
+    report['results']['search']['mean_us'] /= 100
+    with open(baseline_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file)
+    monkeypatch.setattr(sys, 'argv', ['suite', *options, '--compare', baseline_path])
+    with pytest.raises(SystemExit) as exit_info:
+        suite.main()
+    assert exit_info.value.code == 1
+    assert 'REGRESSION search.mean_us' in capsys.readouterr().out
+
+
+def test_parallel_build_compares_with_the_sequential_build(corpus):
+    results = parallel_build.run(corpus, workers=(1, 2))
+    assert list(results) == ['sequential', 'workers=1', 'workers=2']
+    for name in ['workers=1', 'workers=2']:
+        assert results[name]['build_s'] > 0 and results[name]['speedup'] > 0
+        assert results[name]['serial_share'] >= 0
@@ -0,0 +1,235 @@
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from compact_trie import CompactTrie
+from index_updates import IndexUpdater, IndexWatcher
+from postings import POSITION_BITS
+from read_to_trie import PartialIndex, read_files
+from search.search_completions import get_best_k_completion
+from trie import Trie
+
+
+def write(path, text):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+
+def build(trie_class, dir_path):
+    trie_tree, data_list, file_paths = trie_class(), [], []
+    read_files(trie_tree, dir_path, data_list, 0, file_paths)
+    return trie_tree, data_list, file_paths
+
+
+@pytest.mark.parametrize('trie_class', [Trie, CompactTrie])
+def test_update_matches_rebuild(tmp_path, trie_class):
+    write(tmp_path / 'a.txt', "hello world\nthe quick fox\n")
+    write(tmp_path / 'b.txt', "hello there\n")
+    write(tmp_path / 'c.txt', "unique words only here\n")
+    trie_tree, data_list, file_paths = build(trie_class, str(tmp_path))
+    updater = IndexUpdater(trie_tree, data_list, file_paths)
+
+    write(tmp_path / 'b.txt', "goodbye there\nhello again\n")
+    os.remove(tmp_path / 'c.txt')
+    write(tmp_path / 'd.txt', "a new hello\n")
+    write(tmp_path / 'e.txt', "\n\n")
+    changed = [str(tmp_path / name) for name in ('b.txt', 'c.txt', 'd.txt', 'e.txt')]
+    assert updater.update(changed) == (1, 1, 1)
+
+    file_id = {os.path.basename(path): file_id for file_id, path in enumerate(file_paths) if path}
+    assert data_list[file_id['b.txt']] == [['goodbye', 'there'], ['hello', 'again']]
+    assert data_list[file_id['d.txt']] == [['a', 'new', 'hello']]
+    assert 'c.txt' not in file_id and 'e.txt' not in file_id
+    assert trie_tree.search('unique') == []
+    assert not trie_tree.is_word(trie_tree.search_from(trie_tree.root, 'unique'))
+    assert {(index.file_id, index.sentence_id) for index in trie_tree.search('hello')} == {
+        (file_id['a.txt'], 0), (file_id['b.txt'], 1), (file_id['d.txt'], 0)}
+    for index in trie_tree.search('there'):
+        assert data_list[index.file_id][index.sentence_id][index.position] == 'there'
+
+
+def test_top_k_is_rebuilt_after_an_update(tmp_path):
+    write(tmp_path / 'a.txt', "hello world\nhelp me\n")
+    trie_tree, data_list, file_paths = build(Trie, str(tmp_path))
+    trie_tree.build_top_k(3, 2)
+    updater = IndexUpdater(trie_tree, data_list, file_paths)
+
+    write(tmp_path / 'b.txt', "hello again\n")
+    assert updater.update([str(tmp_path / 'b.txt')]) == (1, 0, 0)
+    assert [(index.file_id, index.sentence_id) for index in trie_tree.top_k('he', 3)] == [(0, 0), (0, 1), (1, 0)]
+    assert (trie_tree.top_k_size, trie_tree.top_k_depth) == (3, 2)
+    os.remove(tmp_path / 'a.txt')
+    assert updater.update([str(tmp_path / 'a.txt')]) == (0, 0, 1)
+    assert [(index.file_id, index.sentence_id) for index in trie_tree.top_k('he', 3)] == [(1, 0)]
+
+
+def test_bigrams_apply_after_an_update(tmp_path):
+    write(tmp_path / 'a.txt', "hello world\nsay hello world again\n")
+    write(tmp_path / 'b.txt', "hello world of words\n")
+    trie_tree, data_list, file_paths = build(Trie, str(tmp_path))
+    trie_tree.build_bigrams(data_list, 2)
+    plain_trie, plain_data, plain_paths = build(Trie, str(tmp_path))
+    updaters = [IndexUpdater(trie_tree, data_list, file_paths), IndexUpdater(plain_trie, plain_data, plain_paths)]
+
+    write(tmp_path / 'b.txt', "the world\nhello world\nhello there\n")
+    write(tmp_path / 'c.txt', "oh hello world\n")
+    changed = [str(tmp_path / name) for name in ('b.txt', 'c.txt')]
+    for updater in updaters:
+        assert updater.update(changed) == (1, 1, 0)
+    file_id = {os.path.basename(path): file_id for file_id, path in enumerate(file_paths) if path}
+    pair = trie_tree.bigram_postings('hello', 'world')
+    assert pair is not None and trie_tree.bigram_postings('the', 'world') is None
+    assert list(pair.keys) == sorted(pair.keys)
+    assert sorted((index.file_id, index.sentence_id, index.position) for index in pair) == sorted([
+        (file_id['a.txt'], 0, 0), (file_id['a.txt'], 1, 1), (file_id['b.txt'], 1, 0), (file_id['c.txt'], 0, 1)])
+    for prefix in ['hello wor', 'hello world', 'say hello world a', 'oh hello w']:
+        assert get_best_k_completion(prefix, trie_tree, data_list) == \
+            get_best_k_completion(prefix, plain_trie, plain_data)
+
+    os.remove(tmp_path / 'a.txt')
+    assert updaters[0].update([str(tmp_path / 'a.txt')]) == (0, 0, 1)
+    assert sorted((index.file_id, index.sentence_id) for index in trie_tree.bigram_postings('hello', 'world')) == \
+        sorted([(file_id['b.txt'], 1), (file_id['c.txt'], 0)])
+
+
+def test_bigrams_skip_positions_that_do_not_fit_in_a_key(tmp_path):
+    long_line = ' '.join(['alpha', 'beta'] * (1 << POSITION_BITS)) + '\n'
+    write(tmp_path / 'a.txt', long_line + "gamma delta epsilon\n")
+    with pytest.warns(UserWarning):
+        trie_tree, data_list, file_paths = build(Trie, str(tmp_path))
+    trie_tree.build_bigrams(data_list, 2)
+    pair = trie_tree.bigram_postings('alpha', 'beta')
+    assert pair is not None and {index.sentence_id for index in pair} == {0}
+    assert get_best_k_completion('alpha beta eps', trie_tree, data_list) == []
+
+    write(tmp_path / 'b.txt', long_line)
+    with pytest.warns(UserWarning):
+        assert IndexUpdater(trie_tree, data_list, file_paths).update([str(tmp_path / 'b.txt')]) == (1, 0, 0)
+    assert {index.file_id for index in trie_tree.bigram_postings('alpha', 'beta')} == {0, 1}
+    assert get_best_k_completion('alpha beta eps', trie_tree, data_list) == []
+
+
+def test_watcher_poll(tmp_path):
+    write(tmp_path / 'a.txt', "hello world\n")
+    trie_tree, data_list, file_paths = build(Trie, str(tmp_path))
+    watcher = IndexWatcher(IndexUpdater(trie_tree, data_list, file_paths), str(tmp_path))
+    assert watcher.poll() == (0, 0, 0)
+    write(tmp_path / 'b.txt', "hello watcher\n")
+    assert watcher.poll() == (1, 0, 0)
+    assert len(trie_tree.search('watcher')) == 1
+
+
+def test_watcher_survives_a_file_it_cannot_read(tmp_path):
+    write(tmp_path / 'a.txt', "hello world\n")
+    trie_tree, data_list, file_paths = build(Trie, str(tmp_path))
+    watcher = IndexWatcher(IndexUpdater(trie_tree, data_list, file_paths), str(tmp_path), interval=0.01)
+    (tmp_path / 'bad.txt').write_bytes(b"caf\xe9 latin-1\n")
+    with pytest.warns(UserWarning):
+        assert watcher.poll() == (0, 0, 0)
+        assert watcher.poll() == (0, 0, 0)  # tried again, still not UTF-8
+
+    watcher.start()
+    try:
+        with pytest.warns(UserWarning):
+            write(tmp_path / 'b.txt', "hello watcher\n")
+            deadline = time.monotonic() + 5
+            while not trie_tree.search('watcher') and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert len(trie_tree.search('watcher')) == 1
+            write(tmp_path / 'bad.txt', "fixed now\n")
+            while not trie_tree.search('fixed') and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert len(trie_tree.search('fixed')) == 1
+    finally:
+        watcher.stop()
+
+
+def test_files_are_read_and_top_k_built_without_the_query_lock(tmp_path):
+    write(tmp_path / 'a.txt', "hello world\n")
+    trie_tree, data_list, file_paths = build(Trie, str(tmp_path))
+    trie_tree.build_top_k(3, 2)
+    lock = threading.RLock()
+    updater = IndexUpdater(trie_tree, data_list, file_paths, lock)
+    held = []
+
+    def lock_is_free():
+        # asked from another thread, as the lock is reentrant
+        result = []
+
+        def try_lock():
+            result.append(lock.acquire(blocking=False))
+            if result[0]:
+                lock.release()
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        return result[0]
+
+    load_file, build_top_k = updater._load_file, trie_tree.build_top_k
+
+    def checked_load(path):
+        held.append(not lock_is_free())
+        return load_file(path)
+
+    def checked_build(*args):
+        held.append(not lock_is_free())
+        build_top_k(*args)
+
+    write(tmp_path / 'b.txt', "hello again\n")
+    with patch.object(updater, '_load_file', checked_load), patch.object(trie_tree, 'build_top_k', checked_build):
+        assert updater.update([str(tmp_path / 'b.txt')]) == (1, 0, 0)
+    assert held == [False, False]
+    assert [(index.file_id, index.sentence_id) for index in trie_tree.top_k('he', 3)] == [(0, 0), (1, 0)]
+
+
+def test_sentences_are_stored_while_their_locations_are_published(tmp_path):
+    write(tmp_path / 'a.txt', "hello world\n")
+    trie_tree, data_list, file_paths = build(Trie, str(tmp_path))
+    updater = IndexUpdater(trie_tree, data_list, file_paths)
+    merge_into, remove_postings = PartialIndex.merge_into, trie_tree.remove_postings
+
+    def checked_merge(partial, trie, file_id):
+        assert data_list[file_id]
+        merge_into(partial, trie, file_id)
+
+    def checked_remove(word, start, stop):
+        assert data_list[0]
+        remove_postings(word, start, stop)
+
+    write(tmp_path / 'a.txt', "hello again\nhello there\n")
+    write(tmp_path / 'b.txt', "hello new file\n")
+    with patch.object(PartialIndex, 'merge_into', checked_merge), \
+            patch.object(trie_tree, 'remove_postings', side_effect=checked_remove):
+        assert updater.update([str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')]) == (1, 1, 0)
+
+
+def test_queries_while_a_thread_updates(tmp_path):
+    write(tmp_path / 'a.txt', "hello world\n")
+    trie_tree, data_list, file_paths = build(Trie, str(tmp_path))
+    updater = IndexUpdater(trie_tree, data_list, file_paths)
+    stop = threading.Event()
+
+    def update():
+        rounds = 0
+        while not stop.is_set():
+            rounds += 1
+            write(tmp_path / 'b.txt', "hello there\n" * (rounds % 5 + 1))
+            if rounds % 2:
+                write(tmp_path / 'c.txt', "hello again\nmore hello words\n")
+            elif os.path.exists(tmp_path / 'c.txt'):
+                os.remove(tmp_path / 'c.txt')
+            updater.update([str(tmp_path / name) for name in ('b.txt', 'c.txt')])
+
+    thread = threading.Thread(target=update)
+    thread.start()
+    try:
+        for _ in range(300):
+            with updater.lock:
+                results = get_best_k_completion('hello', trie_tree, data_list, 10)
+            assert results and all('hello' in data.completed_sentence for data in results)
+    finally:
+        stop.set()
+        thread.join()
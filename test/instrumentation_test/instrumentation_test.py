@@ -0,0 +1,67 @@
+import json
+from itertools import islice
+
+import pytest
+from instrumentation import METRICS, Metrics
+from search.search_completions import compute_best_k_completion
+from trie import Trie
+
+
+@pytest.fixture
+def metrics():
+    METRICS.reset()
+    yield METRICS.enable()
+    METRICS.disable()
+    METRICS.reset()
+    METRICS.callbacks.clear()
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    metrics.inc('calls')
+    with metrics.timer('stage'):
+        pass
+    assert list(metrics.timed_iter('stage', iter([1, 2]))) == [1, 2]
+    assert metrics.snapshot() == {'counters': {}, 'summaries': {}, 'gauges': {}}
+
+
+def test_counters_summaries_and_gauges():
+    events = []
+    metrics = Metrics().enable(lambda *event: events.append(event))
+    metrics.inc('calls')
+    metrics.inc('calls', 2)
+    metrics.observe('size', 3)
+    metrics.observe('size', 5)
+    metrics.set_gauges('index', {'nodes': 7})
+    assert list(islice(metrics.timed_iter('stage', iter(range(10))), 2)) == [0, 1]
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == {'calls': 3}
+    assert snapshot['summaries']['size'] == {'count': 2, 'sum': 8, 'max': 5}
+    assert snapshot['summaries']['stage.seconds']['count'] == 1  # recorded when the consumer stopped
+    assert snapshot['gauges'] == {'index.nodes': 7}
+    assert events[:2] == [('counter', 'calls', 1), ('counter', 'calls', 2)]
+    assert json.loads(metrics.to_json()) == snapshot
+    text = metrics.to_prometheus()
+    assert 'autocomplete_calls_total 3' in text
+    assert 'autocomplete_size_count 2' in text
+    assert 'autocomplete_index_nodes 7' in text
+
+
+def test_completion_stages_are_recorded(metrics):
+    trie_tree, data_list = Trie(), [[]]
+    for row, sentence in enumerate(["machine learning is fun", "machine learns fast"]):
+        data_list[0].append(sentence.split())
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    compute_best_k_completion('machne learns', trie_tree, data_list, 5)
+    snapshot = metrics.snapshot()
+    for stage in ['completion', 'completion.lookup', 'completion.matches', 'completion.corrections',
+                  'completion.materialize']:
+        assert snapshot['summaries'][stage + '.seconds']['count'] == 1
+    # only 'machne' is not in the index, so only it is corrected
+    assert snapshot['summaries']['corrections.edit_candidates.seconds']['count'] == 1
+    assert snapshot['counters']['corrections.tried'] > 0
+    assert snapshot['summaries']['postings.keys']['count'] == 2
+    metrics.set_gauges('index', trie_tree.index_stats())
+    assert metrics.gauges['index.words'] == 6
+    assert metrics.gauges['index.postings'] == 7
@@ -0,0 +1,72 @@
+import random
+from array import array
+
+import pytest
+from postings import (FILE_BITS, POSITION_BITS, POSITION_MASK, SENTENCE_BITS, PostingList, SentenceIndex, decode,
+                      encode, intersect_at_offsets, iter_phrase_matches)
+
+
+def naive_matches(lists, offsets):
+    found = set(lists[0].keys)
+    for postings, offset in zip(lists[1:], offsets[1:]):
+        keys = set(postings.keys)
+        found = {key for key in found if key + offset in keys and (key + offset) >> POSITION_BITS == key >> POSITION_BITS}
+    return sorted(found)
+
+
+@pytest.mark.parametrize('location', [(0, 0, 0), (3, 17, 5), (1, 0, POSITION_MASK),
+                                      ((1 << FILE_BITS) - 1, (1 << SENTENCE_BITS) - 1, POSITION_MASK)])
+def test_encode_decode_round_trip(location):
+    key = encode(*location)
+    assert decode(key) == SentenceIndex(*location)
+    assert 0 <= key < 1 << 64
+
+
+def test_keys_sort_like_locations():
+    locations = [(1, 0, 5), (0, 2, 1), (0, 1, POSITION_MASK), (1, 0, 0), (0, 2, 0)]
+    assert [decode(key) for key in sorted(map(encode, *zip(*locations)))] == sorted(locations)
+
+
+@pytest.mark.parametrize('location', [(1 << FILE_BITS, 0, 0), (0, 1 << SENTENCE_BITS, 0), (0, 0, POSITION_MASK + 1)])
+def test_encode_rejects_locations_that_do_not_fit(location):
+    with pytest.raises(ValueError):
+        encode(*location)
+
+
+def test_shift_does_not_carry_into_the_next_sentence():
+    # the last word of sentence 1 followed by the first word of sentence 2 is not a phrase
+    first = PostingList(array('Q', [encode(0, 1, POSITION_MASK), encode(0, 3, 2)]))
+    second = PostingList(array('Q', [encode(0, 2, 0), encode(0, 3, 3)]))
+    assert list(intersect_at_offsets([first, second], [0, 1]).keys) == [encode(0, 3, 2)]
+    assert list(iter_phrase_matches([[first], [second]], [0, 1])) == [encode(0, 3, 2)]
+    # the same, when the candidates come from the second word
+    rare = PostingList(array('Q', [encode(0, 2, 0)]))
+    assert list(intersect_at_offsets([first, rare], [0, 1]).keys) == []
+    assert list(iter_phrase_matches([[first], [rare]], [0, 1])) == []
+
+
+def test_offsets_that_do_not_fit_in_a_sentence_are_rejected():
+    postings = PostingList(array('Q', [encode(0, 0, 0)]))
+    with pytest.raises(ValueError):
+        intersect_at_offsets([postings, postings], [0, POSITION_MASK + 1])
+    with pytest.raises(ValueError):
+        list(iter_phrase_matches([[postings], [postings]], [0, -1]))
+
+
+@pytest.mark.parametrize('compressed', [False, True])
+def test_galloping_intersection_matches_naive(compressed):
+    rng = random.Random(7)
+    common = sorted({encode(rng.randrange(3), rng.randrange(200), rng.randrange(12)) for _ in range(5000)})
+    rare = sorted({encode(rng.randrange(3), rng.randrange(200), rng.randrange(12)) for _ in range(40)})
+    middle = sorted({encode(rng.randrange(3), rng.randrange(200), rng.randrange(12)) for _ in range(600)})
+    lists = [PostingList(array('Q', keys)) for keys in (rare, common, middle)]
+    if compressed:
+        for postings in lists:
+            postings.compress()
+    for offsets in ([0, 1, 2], [0, 2, 1], [0, 3, 5]):
+        expected = naive_matches(lists, offsets)
+        assert list(intersect_at_offsets(lists, offsets).keys) == expected
+        assert list(iter_phrase_matches([[postings] for postings in lists], offsets)) == expected
+    # the rare list first, then the common one: the first word is the one probed by galloping
+    offsets = [0, 1]
+    assert list(intersect_at_offsets(lists[1::-1], offsets).keys) == naive_matches(lists[1::-1], offsets)
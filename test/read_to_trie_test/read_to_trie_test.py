@@ -0,0 +1,103 @@
+import re
+from pathlib import Path
+
+import pytest
+from compact_trie import CompactTrie
+import read_to_trie
+from read_to_trie import read_files, read_files_parallel, stream_file_data
+from sentence_store import TokenSentenceStore
+from text_cleaning import pattern
+from trie import Trie
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    for directory in range(3):
+        folder = tmp_path / f'dir{directory}'
+        folder.mkdir()
+        for number in range(7):
+            text = '\n'.join(f"Sentence {line} of file {directory}-{number}: the quick brown fox {line * number}"
+                             for line in range(number))
+            (folder / f'{number}.txt').write_text(text, encoding='utf-8')
+    (tmp_path / 'notes.md').write_text("not a text file", encoding='utf-8')
+    return str(tmp_path)
+
+
+@pytest.mark.parametrize('trie_class', [Trie, CompactTrie])
+def test_parallel_build_matches_sequential(corpus, trie_class):
+    sequential_trie, sequential_data = trie_class(), []
+    last_id = read_files(sequential_trie, corpus, sequential_data, 0)
+    parallel_trie, parallel_data = trie_class(), []
+    assert read_files_parallel(parallel_trie, corpus, parallel_data, 2, 0) == last_id
+
+    assert parallel_data == sequential_data
+    for word in ['sentence', 'the', 'fox', 'file', '0', '12', 'missing']:
+        assert parallel_trie.search(word) == sequential_trie.search(word)
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_parallel_build_into_token_store_matches_sequential(corpus, workers):
+    # files of blank lines get no id: the ids guessed for the batches after them are too high
+    for directory in range(3):
+        (Path(corpus) / f'dir{directory}' / 'blank.txt').write_text("\n  \n\n", encoding='utf-8')
+    sequential_trie, sequential_store, sequential_paths = Trie(), TokenSentenceStore(), []
+    last_id = read_files(sequential_trie, corpus, sequential_store, 0, sequential_paths)
+    parallel_trie, parallel_store, parallel_paths = Trie(), TokenSentenceStore(), []
+    assert read_files_parallel(parallel_trie, corpus, parallel_store, workers, 0, parallel_paths) == last_id
+
+    assert parallel_paths == sequential_paths
+    assert parallel_store.vocabulary.words == sequential_store.vocabulary.words
+    assert [(list(file.tokens), list(file.offsets)) for file in parallel_store] == \
+        [(list(file.tokens), list(file.offsets)) for file in sequential_store]
+    assert sorted(parallel_trie.words()) == sorted(sequential_trie.words())
+    for word in sequential_trie.words():
+        assert parallel_trie.search(word) == sequential_trie.search(word)
+
+
+def test_stream_file_data_matches_line_by_line_cleaning(tmp_path):
+    text = ("Hello, World!\r\n\n  Ünïcode café -- naïve\tTAB\x0bsep  \n...\n"
+            "the quick brown fox\rjumps over 12 lazy dogs\nlast line without newline")
+    path = tmp_path / 'text.txt'
+    path.write_bytes(text.encode('utf-8'))
+    with open(path, 'r', encoding='utf-8') as file:
+        expected = [words for words in (re.sub(pattern, '', line).lower().split() for line in file) if words]
+
+    for chunk_size, flush_tokens in [(1 << 20, 1 << 20), (3, 2), (7, 1)]:
+        trie, sentences = Trie(), []
+        tokens = stream_file_data(trie, str(path), 2, sentences, chunk_size, flush_tokens)
+        assert sentences == expected
+        assert tokens == sum(map(len, expected))
+        assert list(trie.search('the')) == [(2, 2, 0)]
+        assert list(trie.search('caf')) == [(2, 1, 1)]
+        assert list(trie.search('dogs')) == [(2, 3, 4)]
+
+
+def test_read_files_into_token_store_matches_lists(corpus):
+    list_trie, data_list = Trie(), []
+    store_trie, store = Trie(), TokenSentenceStore()
+    assert read_files(store_trie, corpus, store, 0) == read_files(list_trie, corpus, data_list, 0)
+    assert [list(file_lines) for file_lines in store] == data_list
+    assert store.token_count() == sum(len(sentence) for file_lines in data_list for sentence in file_lines)
+    for word in ['sentence', 'the', 'fox', '0', '12']:
+        assert store_trie.search(word) == list_trie.search(word)
+
+
+def test_locations_that_do_not_fit_in_a_key_are_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(read_to_trie, 'POSITION_BITS', 2)
+    monkeypatch.setattr(read_to_trie, 'SENTENCE_BITS', 1)
+    monkeypatch.setattr(read_to_trie, 'FILE_BITS', 1)
+    for number in range(3):
+        (tmp_path / f'{number}.txt').write_text("one two three four five six\nseven\neight", encoding='utf-8')
+
+    trie, data_list = Trie(), []
+    with pytest.warns(UserWarning):
+        assert read_files(trie, str(tmp_path), data_list, 0) == 2
+    # the words after the first four of a sentence and the sentences after the first two are not indexed
+    assert data_list[0] == [['one', 'two', 'three', 'four', 'five', 'six'], ['seven']]
+    assert [index.position for index in trie.search('four')] == [3, 3]
+    assert trie.search('five') == [] and trie.search('eight') == []
+
+    parallel_trie, parallel_data = Trie(), []
+    with pytest.warns(UserWarning):
+        assert read_files_parallel(parallel_trie, str(tmp_path), parallel_data, 2, 0) == 2
+    assert parallel_data == data_list
@@ -0,0 +1,55 @@
+from unittest.mock import patch
+
+from search.cache import CompletionCache
+from search.search_completions import get_best_k_completion
+from trie import Trie
+
+
+def test_lru_eviction_and_counters():
+    trie_tree = Trie()
+    cache = CompletionCache(max_size=2)
+    assert cache.get(trie_tree, cache.make_key('Hello  World', 5)) is None
+    cache.put(trie_tree, cache.make_key('hello world', 5), ['a'])
+    cache.put(trie_tree, cache.make_key('hello', 5), ['b'])
+    assert cache.get(trie_tree, cache.make_key(' HELLO world ', 5)) == ['a']
+    cache.put(trie_tree, cache.make_key('help', 5), ['c'])
+    assert cache.get(trie_tree, cache.make_key('hello', 5)) is None
+    assert cache.get(trie_tree, cache.make_key('help', 5)) == ['c']
+    assert cache.stats() == {'size': 2, 'max_size': 2, 'hits': 2, 'misses': 2, 'evictions': 1}
+
+
+def test_invalidated_by_index_changes():
+    trie_tree = Trie()
+    cache = CompletionCache()
+    key = cache.make_key('hello', 5)
+    cache.put(trie_tree, key, ['a'])
+    trie_tree.insert('hello', 0, 0, 0)
+    assert cache.get(trie_tree, key) is None
+    cache.put(trie_tree, key, ['a'])
+    assert cache.get(Trie(), key) is None
+
+
+def test_results_of_a_changed_index_are_not_stored():
+    trie_tree = Trie()
+    cache = CompletionCache()
+    key = cache.make_key('hello', 5)
+    version = trie_tree.version
+    # the index is updated while the completions are computed
+    trie_tree.insert('hello', 0, 0, 0)
+    cache.put(trie_tree, key, ['stale'], version)
+    assert cache.get(trie_tree, key) is None
+    cache.put(trie_tree, key, ['fresh'], trie_tree.version)
+    assert cache.get(trie_tree, key) == ['fresh']
+
+
+def test_completions_computed_during_an_update_are_not_cached():
+    trie_tree = Trie()
+    cache = CompletionCache()
+
+    def update_while_computing(*args):
+        trie_tree.insert('hello', 0, 0, 0)
+        return ['stale']
+
+    with patch('search.search_completions.compute_best_k_completion', side_effect=update_while_computing):
+        assert get_best_k_completion('hello', trie_tree, [[['hello']]], 5, cache) == ['stale']
+    assert cache.get(trie_tree, cache.make_key('hello', 5)) is None
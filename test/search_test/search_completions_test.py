@@ -1,8 +1,10 @@
 from unittest.mock import Mock, patch
 
 import pytest
+from compact_trie import CompactTrie
 from search.data_utils import AutoCompleteData, SentenceIndex
 from search.search_completions import *
+from trie import PREFIX_MAX_WORDS, Trie
 
 
 def test_compare_indexes():
@@ -21,6 +23,15 @@ def test_filter_by_indexes():
     assert res[0] == SentenceIndex(1, 1, 2)
 
 
+def test_filter_by_indexes_rarest_first():
+    common = [SentenceIndex(1, sentence, position) for sentence in range(50) for position in range(4)]
+    rare = [SentenceIndex(1, 7, 2), SentenceIndex(1, 30, 0)]
+    # "common rare common": the rare middle word is intersected first and the long lists are galloped
+    res = filter_by_indexes([common, rare, common])
+    assert list(res) == [SentenceIndex(1, 7, 1)]
+    assert list(filter_by_indexes([common, [SentenceIndex(2, 0, 1)]])) == []
+
+
 def test_search_word():
     trie_tree_mock = Mock()
     trie_tree_mock.search.return_value = [SentenceIndex(1, 1, 0), SentenceIndex(1, 1, 2), SentenceIndex(1, 5, 3)]
@@ -46,3 +57,100 @@ def test_search():
     res = search('hello world', trie_tree_mock)
     assert len(res) == 1
     assert res[0] == SentenceIndex(1, 1, 1)
+
+
+def test_search_with_prefix():
+    trie_tree_mock = Mock()
+    trie_tree_mock.search.return_value = [SentenceIndex(1, 1, 1), SentenceIndex(1, 5, 3)]
+    trie_tree_mock.search_prefix.return_value = [SentenceIndex(1, 1, 2), SentenceIndex(1, 5, 2)]
+    res = search_with_prefix('machine lea', trie_tree_mock)
+    trie_tree_mock.search.assert_called_once_with('machine')
+    trie_tree_mock.search_prefix.assert_called_once_with('lea')
+    assert list(res) == [SentenceIndex(1, 1, 1)]
+
+
+def test_iter_completions_is_lazy_and_unique():
+    trie_tree = Trie()
+    for row, sentence in enumerate(["machine learns machine learns", "machine learn", "machina learns"]):
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    completions = iter_completions('machine learns', trie_tree)
+    assert next(completions) == SentenceIndex(0, 0, 0)  # once, though it matches twice
+    assert next(completions) == SentenceIndex(0, 2, 0)  # 'machine' corrected to 'machina'
+    assert next(completions) == SentenceIndex(0, 1, 0)  # 'learns' corrected to 'learn'
+    assert list(completions) == []
+
+
+def test_compute_best_k_completion_reads_only_returned_sentences():
+    trie_tree = Trie()
+    for row in range(100):
+        trie_tree.insert('hello', 0, row, 0)
+    data_list = [Mock()]
+    data_list[0].__getitem__ = Mock(side_effect=lambda sentence_id: ['hello'])
+    res = compute_best_k_completion('hel', trie_tree, data_list, 3)
+    assert [data.offset for data in res] == [0, 1, 2]
+    assert data_list[0].__getitem__.call_count == 3
+
+
+def test_corrections_of_all_words_are_ranked_by_score():
+    trie_tree, data_list = Trie(), [[]]
+    for row, sentence in enumerate(["abcdef xyz", "bbcdef xyz", "abcdef xya", "zzz abcdef"]):
+        data_list[0].append(sentence.split())
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    res = compute_best_k_completion('abcdef xyz', trie_tree, data_list, 5)
+    # 'xyz' -> 'xya' changes the third letter (-3), 'abcdef' -> 'bbcdef' the first one (-5)
+    assert [(data.offset, data.score) for data in res] == [(0, 18), (2, 15), (1, 13)]
+    assert [data.offset for data in compute_best_k_completion('abcdef xyz', trie_tree, data_list, 2)] == [0, 2]
+
+
+def test_bigrams_give_the_same_completions():
+    trie_tree, data_list = Trie(), [[]]
+    sentences = [f"the quick b{row} fox" for row in range(30)] + [f"b{row} the quick" for row in range(100)]
+    sentences += ["the quick brown dog", "quick the brown", "the quik brown"]
+    # many more locations of the words starting with 'b' than locations of 'the quick' to check
+    sentences += [f"b{row % 30}" for row in range(6000)]
+    for row, sentence in enumerate(sentences):
+        data_list[0].append(sentence.split())
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    queries = ['the quick b', 'the quick brown', 'the quick b1 fox', 'the quik brown', 'quick b2', 'b3 the q']
+    expected = [list(compute_best_k_completion(query, trie_tree, data_list, 5)) for query in queries]
+    trie_tree.build_bigrams(data_list, min_count=10)
+    assert trie_tree.bigram_postings('the', 'quick') is not None
+    assert [list(compute_best_k_completion(query, trie_tree, data_list, 5)) for query in queries] == expected
+
+
+@pytest.mark.parametrize('trie_class', [Trie, CompactTrie])
+def test_top_k_gives_the_same_completions_as_a_bounded_prefix_search(trie_class):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = [f"q{first}{second}" for first in letters[:3] for second in letters][:PREFIX_MAX_WORDS + 6]
+    # the first sentence has a longer word than the ones a prefix search of 'q' collects
+    sentences = ["start qlongword here"] + [f"start {word}" for word in words]
+    trie_tree, data_list = trie_class(), [[]]
+    for row, sentence in enumerate(sentences):
+        data_list[0].append(sentence.split())
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    assert len(trie_tree.prefix_words('q')) == PREFIX_MAX_WORDS
+    queries = ['q', 'ql', 'qa', 'qc', 'start']
+    expected = [[(data.completed_sentence, data.offset) for data in compute_best_k_completion(query, trie_tree,
+                                                                                              data_list, k)]
+                for query in queries for k in (1, 5)]
+    trie_tree.build_top_k(5, 4)
+    assert trie_tree.top_k('q', 5) is not None
+    assert [[(data.completed_sentence, data.offset) for data in compute_best_k_completion(query, trie_tree,
+                                                                                           data_list, k)]
+            for query in queries for k in (1, 5)] == expected
+
+
+def test_misspelled_word_before_an_unfinished_word():
+    trie_tree, data_list = Trie(), [[]]
+    for row, sentence in enumerate(["machine learning is fun", "machine learns fast", "hello world"]):
+        data_list[0].append(sentence.split())
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    # 'lea' is not a word but the beginning of words, so only 'machne' is corrected
+    res = compute_best_k_completion('machne lea', trie_tree, data_list, 5)
+    assert [(data.offset, data.score) for data in res] == [(0, 16), (1, 16)]
+    assert compute_best_k_completion('machne lxa', trie_tree, data_list, 5) == []
@@ -0,0 +1,92 @@
+from unittest.mock import patch
+
+import pytest
+from compact_trie import CompactTrie
+from search.search_completions import get_best_k_completion, rank_matches
+from search.session import CompletionSession
+from trie import Trie
+
+SENTENCES = ["machine learning is fun", "machine learns fast", "hello world", "the world of machine learning",
+             "hello there world", "learning machines learn", "the lazy dog", "the lazy days of summer"]
+
+
+def build(trie_tree):
+    data_list = [[]]
+    for row, sentence in enumerate(SENTENCES):
+        data_list[0].append(sentence.split())
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    return trie_tree, data_list
+
+
+def completions(results):
+    return [(data.completed_sentence, data.source_text, data.offset, data.score) for data in results]
+
+
+@pytest.mark.parametrize('backend', ['nodes', 'compact'])
+def test_keystrokes_give_the_completions_of_the_whole_text(backend):
+    trie_tree, data_list = build(Trie())
+    if backend == 'compact':
+        trie_tree = CompactTrie.from_trie(trie_tree)
+    session = CompletionSession(trie_tree, data_list)
+    texts = ['machine learn', 'machine learnx', 'machine lea', 'hello wrld', 'the lazy  dog ', ' the wo', 'xyz lazy']
+    for text in texts:
+        session.set_text('')
+        typed = ''
+        for char in text:
+            session.append(char)
+            typed += char
+            for k in (1, 5):
+                assert completions(session.complete(k)) == \
+                    completions(get_best_k_completion(typed, trie_tree, data_list, k))
+        for _ in range(len(text)):
+            session.backspace()
+            typed = typed[:-1]
+            assert session.text == typed
+            assert completions(session.complete(5)) == completions(get_best_k_completion(typed, trie_tree, data_list))
+
+
+def test_precomputed_top_k_give_the_same_completions():
+    trie_tree, data_list = build(Trie())
+    trie_tree.build_top_k(5, 2)
+    session = CompletionSession(trie_tree, data_list)
+    for text in ['m', 'ma', 'mac', 'the l', 'h']:
+        session.set_text(text)
+        assert completions(session.complete(5)) == completions(get_best_k_completion(text, trie_tree, data_list))
+
+
+def test_backspace_returns_the_earlier_results():
+    trie_tree, data_list = build(Trie())
+    session = CompletionSession(trie_tree, data_list)
+    with patch('search.session.rank_matches', wraps=rank_matches) as ranked:
+        session.set_text('machine lea')
+        first = session.complete(5)
+        session.append('rns')
+        session.complete(5)
+        session.backspace(3)
+        assert session.complete(5) == first
+        session.set_text('machine lea ')
+        assert session.complete(5) == first
+    assert ranked.call_count == 2
+
+
+def test_set_text_keeps_the_common_beginning():
+    trie_tree, data_list = build(Trie())
+    session = CompletionSession(trie_tree, data_list)
+    session.set_text('the lazy days')
+    states = list(session._states)
+    session.set_text('the lazy dog')
+    assert session.text == 'the lazy dog'
+    assert session._states[:11] == states[:11]
+    assert completions(session.complete(5)) == completions(get_best_k_completion('the lazy dog', trie_tree, data_list))
+
+
+def test_session_starts_over_when_the_trie_changes():
+    trie_tree, data_list = build(Trie())
+    session = CompletionSession(trie_tree, data_list)
+    session.set_text('hello w')
+    assert [data.offset for data in session.complete(5)] == [2]
+    data_list[0].append(['hello', 'wonderful'])
+    trie_tree.insert('hello', 0, 8, 0)
+    trie_tree.insert('wonderful', 0, 8, 1)
+    assert [data.offset for data in session.complete(5)] == [2, 8]
@@ -0,0 +1,141 @@
+import multiprocessing
+import threading
+
+import pytest
+from read_to_trie import iter_text_files, read_files
+from search.search_completions import compute_best_k_completion
+from search.shards import Shard, ShardedIndex, ShardError, partition_files, serve_shard, shard_listener
+from sentence_store import OffsetSentenceStore, TokenSentenceStore
+from trie import Trie
+
+QUERIES = ['the', 'the quick', 'quick brown f', 'machine learn', 'machne', 'hello wrld', 'wrld', 'pyth', 'of the',
+           'missing words', 'lazy d', 'machne lea', 'hello wor']
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    data = tmp_path / 'data'
+    (data / 'nested').mkdir(parents=True)
+    texts = ["Hello, world!\nThe quick brown fox.\nthe lazy dog of the world\n",
+             "",
+             "Machine learning is fun\nthe world of python\nmachine learns quickly\n",
+             "The quick brown fox jumps over the lazy dog.\nhello there world\n",
+             "python the language\nthe lazy days of summer\n"]
+    for number, text in enumerate(texts):
+        folder = data / 'nested' if number % 2 else data
+        (folder / f'{number}.txt').write_text(text, encoding='utf-8')
+    return str(data)
+
+
+def completions(results):
+    return [(data.completed_sentence, data.source_text, data.offset, data.score) for data in results]
+
+
+@pytest.mark.parametrize('partition', ['range', 'hash'])
+def test_sharded_completions_match_single_index(corpus, partition):
+    trie_tree, data_list = Trie(), TokenSentenceStore()
+    read_files(trie_tree, corpus, data_list, 0)
+    with ShardedIndex.start(corpus, 3, partition) as index:
+        for query in QUERIES:
+            for k in (1, 5):
+                assert completions(index.complete(query, k)) == \
+                    completions(compute_best_k_completion(query, trie_tree, data_list, k))
+
+
+def test_sharded_offset_stores_report_the_source_files(corpus):
+    trie_tree, data_list = Trie(), OffsetSentenceStore()
+    read_files(trie_tree, corpus, data_list, 0)
+    with ShardedIndex.start(corpus, 2, sentence_store='offsets') as index:
+        for query in QUERIES:
+            assert completions(index.complete(query, 5)) == \
+                completions(compute_best_k_completion(query, trie_tree, data_list, 5))
+
+
+def test_partition_files_keeps_every_file_once(corpus):
+    file_paths = list(iter_text_files(corpus))
+    for partition in ['range', 'hash']:
+        shards = partition_files(file_paths, 3, partition)
+        assert sorted(file for files in shards for file in files) == list(enumerate(file_paths))
+    assert [len(files) for files in partition_files(file_paths, 2, 'range')] == [3, 2]
+    with pytest.raises(ValueError):
+        partition_files(file_paths, 2, 'random')
+
+
+def _serve_on_listener(listener, files):
+    with listener.accept() as connection:
+        serve_shard(connection, Shard(files))
+
+
+def test_sharded_index_over_sockets(corpus):
+    trie_tree, data_list = Trie(), TokenSentenceStore()
+    read_files(trie_tree, corpus, data_list, 0)
+    context = multiprocessing.get_context('fork')
+    listeners, processes = [], []
+    for files in partition_files(list(iter_text_files(corpus)), 2):
+        listener = shard_listener(('127.0.0.1', 0), b'test')
+        process = context.Process(target=_serve_on_listener, args=(listener, files), daemon=True)
+        process.start()
+        listeners.append(listener)
+        processes.append(process)
+    with ShardedIndex.connect([listener.address for listener in listeners], b'test') as index:
+        for query in QUERIES:
+            assert completions(index.complete(query, 5)) == \
+                completions(compute_best_k_completion(query, trie_tree, data_list, 5))
+    for listener, process in zip(listeners, processes):
+        process.join(5)
+        listener.close()
+
+
+def test_shard_is_not_served_without_a_key():
+    with pytest.raises(ValueError):
+        shard_listener(('127.0.0.1', 0), b'')
+    with pytest.raises(ValueError):
+        ShardedIndex.connect([('127.0.0.1', 1)], None)
+
+
+def test_shard_failure_is_reported(tmp_path):
+    with pytest.raises(ShardError):
+        ShardedIndex.start(str(tmp_path), 2, trie_backend='missing')
+
+
+def test_failed_query_leaves_no_reply_behind(corpus):
+    trie_tree, data_list = Trie(), TokenSentenceStore()
+    read_files(trie_tree, corpus, data_list, 0)
+    shards = [Shard(files) for files in partition_files(list(iter_text_files(corpus)), 3)]
+    complete = shards[0].complete
+
+    def failing_complete(prefix, *args):
+        if prefix == 'fail':
+            raise RuntimeError("broken shard")
+        return complete(prefix, *args)
+
+    shards[0].complete = failing_complete
+    connections, threads = [], []
+    for shard in shards:
+        connection, shard_connection = multiprocessing.Pipe()
+        threads.append(threading.Thread(target=serve_shard, args=(shard_connection, shard), daemon=True))
+        threads[-1].start()
+        connections.append(connection)
+    with ShardedIndex(connections) as index:
+        with pytest.raises(ShardError):
+            index.complete('fail', 5)
+        for query in QUERIES:
+            assert completions(index.complete(query, 5)) == \
+                completions(compute_best_k_completion(query, trie_tree, data_list, 5))
+    for thread in threads:
+        thread.join(5)
+
+
+def test_truncated_prefix_search_matches_single_index(tmp_path):
+    # more words below 'q' than a prefix search collects in the first file, one longer word in the second
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = [f"q{first}{second}" for first in letters[:3] for second in letters][:70]
+    (tmp_path / '0.txt').write_text(''.join(f"start {word}\n" for word in words), encoding='utf-8')
+    (tmp_path / '1.txt').write_text("start qlongword here\nstart qb\n", encoding='utf-8')
+    trie_tree, data_list = Trie(), TokenSentenceStore()
+    read_files(trie_tree, str(tmp_path), data_list, 0)
+    with ShardedIndex.start(str(tmp_path), 2) as index:
+        for query in ['start q', 'q', 'start qb', 'start qlo']:
+            for k in (3, 100):
+                assert completions(index.complete(query, k)) == \
+                    completions(compute_best_k_completion(query, trie_tree, data_list, k))
@@ -0,0 +1,123 @@
+import os
+import threading
+
+import pytest
+from index_updates import IndexUpdater
+from read_to_trie import read_files, read_files_parallel
+from search.data_utils import SentenceIndex
+from search.logic import find_sentence_by_indexes
+from search.search_completions import compute_best_k_completion
+from sentence_store import OffsetSentenceStore, SourceChangedError, TokenFile, TokenSentenceStore
+from trie import Trie
+
+
+def test_store_round_trip():
+    store = TokenSentenceStore()
+    store.append([['hello', 'world'], ['hello', 'again', 'world']])
+    store.append([])
+    assert len(store) == 2
+    assert len(store[0]) == 2
+    assert store[0][1] == ['hello', 'again', 'world']
+    assert list(store[0]) == [['hello', 'world'], ['hello', 'again', 'world']]
+    assert len(store.vocabulary) == 3  # every word is stored once
+    assert list(store[1]) == []
+    with pytest.raises(IndexError):
+        store[0][2]
+    store[1] = [['again']]
+    assert find_sentence_by_indexes(SentenceIndex(1, 0, 0), store) == ['again']
+    assert isinstance(store.pop(), TokenFile)
+    assert len(store) == 1
+
+
+def test_store_as_data_list(tmp_path):
+    (tmp_path / 'a.txt').write_text("Hello, world!\nThe quick brown fox.\n", encoding='utf-8')
+    (tmp_path / 'b.txt').write_text("hello again world\n", encoding='utf-8')
+    trie_tree, lists, store = Trie(), [], TokenSentenceStore()
+    read_files(Trie(), str(tmp_path), lists, 0)
+    paths = []
+    read_files(trie_tree, str(tmp_path), store, 0, paths)
+    assert [list(file_lines) for file_lines in store] == lists
+
+    (tmp_path / 'b.txt').write_text("goodbye world\n", encoding='utf-8')
+    IndexUpdater(trie_tree, store, paths).update([str(tmp_path / 'b.txt')])
+    file_id = paths.index(str(tmp_path / 'b.txt'))
+    assert list(store[file_id]) == [['goodbye', 'world']]
+    assert [index.file_id for index in trie_tree.search('hello')] == [1 - file_id]
+
+
+@pytest.fixture
+def texts(tmp_path):
+    (tmp_path / 'nested').mkdir()
+    (tmp_path / 'a.txt').write_text("Hello, world!\r\n\nThe quick brown fox.\rCafé crème, naïve\n", encoding='utf-8')
+    (tmp_path / 'nested' / 'b.txt').write_text("hello again world\n...\nlast line", encoding='utf-8')
+    (tmp_path / 'empty.txt').write_text("\n", encoding='utf-8')
+    return tmp_path
+
+
+def test_offset_store_reads_sentences_from_the_files(texts):
+    lists = []
+    read_files(Trie(), str(texts), lists, 0)
+    trie_tree, store, paths = Trie(), OffsetSentenceStore(max_mapped_files=1), []
+    read_files(trie_tree, str(texts), store, 0, paths)
+    assert [list(file_lines) for file_lines in store] == lists
+    assert [store.source_path(file_id) for file_id in range(len(store))] == paths
+
+    parallel_store = OffsetSentenceStore()
+    read_files_parallel(Trie(), str(texts), parallel_store, 2, 0)
+    assert [list(file_lines) for file_lines in parallel_store] == lists
+    with pytest.raises(TypeError):
+        store.append([['hello']])
+
+    completions = compute_best_k_completion('hello', trie_tree, store)
+    assert sorted((data.completed_sentence, data.source_text) for data in completions) == \
+        [(['hello', 'again', 'world'], str(texts / 'nested' / 'b.txt')), (['hello', 'world'], str(texts / 'a.txt'))]
+    store.close()
+
+
+def test_offset_store_detects_changed_sources(texts):
+    store = OffsetSentenceStore()
+    read_files(Trie(), str(texts), store, 0)
+    file_id = 0 if store.source_path(0).endswith('b.txt') else 1
+    path = store.source_path(file_id)
+    status = os.stat(path)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("hello again wOrld\n...\nlast line")
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns + 1))
+    with pytest.raises(SourceChangedError):
+        store[file_id][0]
+
+
+def test_offset_store_detects_a_mapped_source_truncated(texts):
+    store = OffsetSentenceStore()
+    read_files(Trie(), str(texts), store, 0)
+    file_id = 0 if store.source_path(0).endswith('a.txt') else 1
+    assert store[file_id][0] == ['hello', 'world']  # the file is mapped
+    with open(store.source_path(file_id), 'r+b') as file:
+        file.truncate(0)
+    with pytest.raises(SourceChangedError):
+        store[file_id][2]
+    store.close()
+
+
+def test_offset_store_is_read_by_threads(texts):
+    lists = []
+    read_files(Trie(), str(texts), lists, 0)
+    # one file mapped at a time: the threads keep evicting the file another one reads
+    store = OffsetSentenceStore(max_mapped_files=1)
+    read_files(Trie(), str(texts), store, 0)
+    errors = []
+
+    def read_all():
+        try:
+            for _ in range(200):
+                assert [list(file_lines) for file_lines in store] == lists
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=read_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+    assert errors == []
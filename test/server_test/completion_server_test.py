@@ -0,0 +1,172 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+
+import pytest
+from read_to_trie import read_files
+from search import worker_pool
+from search.worker_pool import complete_prefix
+from sentence_store import OffsetSentenceStore
+from trie import Trie
+
+completion_server = pytest.importorskip('server.completion_server')
+
+
+@pytest.fixture
+def server():
+    trie_tree, data_list = Trie(), [[]]
+    for row, sentence in enumerate(["machine learning is fun", "machine learns fast", "hello world"]):
+        data_list[0].append(sentence.split())
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    server = completion_server.CompletionServer(trie_tree, data_list, workers=0)
+    yield server
+    server.close()
+
+
+def test_complete_endpoint(server):
+    status, payload = asyncio.run(server.handle('GET', '/complete?q=Machine%20lea&k=1', b''))
+    assert status == 200
+    assert payload['prefix'] == 'machine lea'
+    assert [data['completed_sentence'] for data in payload['completions']] == ["machine learning is fun"]
+    status, payload = asyncio.run(server.handle('POST', '/complete', b'{"prefix": "hello", "k": 5}'))
+    assert status == 200
+    assert [data['offset'] for data in payload['completions']] == [2]
+
+
+def test_bad_requests(server):
+    assert asyncio.run(server.handle('GET', '/complete?q=!!', b''))[0] == 400
+    assert asyncio.run(server.handle('GET', '/complete?q=hello&k=0', b''))[0] == 400
+    assert asyncio.run(server.handle('POST', '/complete', b'not json'))[0] == 400
+    assert asyncio.run(server.handle('DELETE', '/complete', b''))[0] == 405
+    assert asyncio.run(server.handle('GET', '/missing', b''))[0] == 404
+
+
+def test_identical_queries_are_coalesced(server):
+    async def burst():
+        return await asyncio.gather(*(server.complete('machine', 5) for _ in range(10)))
+
+    results = asyncio.run(burst())
+    assert all(result == results[0] for result in results)
+    assert server.counters['lookups'] == 1
+    assert server.counters['coalesced'] == 9
+    asyncio.run(server.complete('machine', 5))
+    assert server.counters['lookups'] == 1  # answered from the cache
+
+
+def test_pending_limit(server):
+    server.max_pending = 0
+    status, payload = asyncio.run(server.handle('GET', '/complete?q=hello', b''))
+    assert status == 503
+    assert server.counters['rejected'] == 1
+
+
+def test_keystrokes_of_a_session(server):
+    server.max_sessions = 1
+    for text in ['m', 'ma', 'mac', 'machine l', 'machine lea', 'machine le']:
+        status, payload = asyncio.run(server.handle('GET', f'/complete?q={text}&session=a', b''))
+        assert status == 200
+        assert payload['completions'] == complete_prefix(text, 5)
+    assert worker_pool._sessions['a'].text == 'machine le'
+    assert asyncio.run(server.handle('POST', '/complete', b'{"q": "hello", "session": "b"}'))[0] == 200
+    assert list(worker_pool._sessions) == ['b']
+    assert asyncio.run(server.handle('GET', f'/complete?q=hello&session={"x" * 200}', b''))[0] == 400
+    assert asyncio.run(server.handle('GET', '/stats', b''))[1]['sessions'] == 1
+
+
+def test_only_the_newest_query_of_a_session_is_computed(server):
+    texts = ['m', 'ma', 'mac', 'mach', 'machi', 'machin', 'machine']
+
+    async def burst():
+        return await asyncio.gather(*(server.complete_in_session('a', text, 5) for text in texts),
+                                    return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert results[-1] == complete_prefix('machine', 5)
+    superseded = [result for result in results if isinstance(result, completion_server.SupersededError)]
+    assert len(superseded) >= len(texts) - 2
+    assert server.counters['superseded'] == len(superseded)
+    assert worker_pool._sessions['a'].text == 'machine'
+    assert server.pending == 0
+    assert asyncio.run(server.handle('GET', '/complete?q=machine&session=a', b''))[0] == 200
+
+
+def test_session_queries_count_as_pending(server):
+    server.max_pending = 0
+    status, payload = asyncio.run(server.handle('GET', '/complete?q=hello&session=a', b''))
+    assert status == 503
+    assert server.counters['rejected'] == 1
+
+
+def test_timed_out_session_query_is_dropped(server):
+    server.timeout = 0.05
+    release = threading.Event()
+    server.session_executors[0].submit(release.wait)  # the session thread is busy
+    status, _ = asyncio.run(server.handle('GET', '/complete?q=hello&session=b', b''))
+    assert status == 504
+    release.set()
+    server.session_executors[0].submit(lambda: None).result()
+    assert 'b' not in worker_pool._sessions
+
+
+def test_sessions_do_not_take_the_lookup_slots(server):
+    async def with_the_slots_taken():
+        server._semaphore = asyncio.Semaphore(server.max_concurrent)
+        async with server._semaphore:
+            return await server.handle('GET', '/complete?q=hello&session=a', b'')
+
+    assert asyncio.run(with_the_slots_taken())[0] == 200
+
+
+def test_session_is_kept_by_one_worker_process(server):
+    sessions = completion_server.CompletionServer(server.trie_tree, server.data_list, workers=1, cache_size=0,
+                                                  session_workers=2)
+    try:
+        for text in ['machine', 'machine le', 'machine', 'hello']:
+            for session_id in ['a', 'b', 'c']:
+                status, payload = asyncio.run(sessions.handle('GET', f'/complete?q={text}&session={session_id}', b''))
+                assert status == 200
+                assert payload['completions'] == complete_prefix(text, 5)
+        assert worker_pool._sessions == {}  # kept by the worker processes, not by this one
+        assert asyncio.run(sessions.handle('GET', '/stats', b''))[1]['sessions'] == 3
+    finally:
+        sessions.close()
+
+
+def test_unexpected_error_is_a_server_error(server, monkeypatch):
+    async def broken(prefix, k):
+        raise RuntimeError("broken pool")
+
+    monkeypatch.setattr(server, 'complete', broken)
+    status, payload = asyncio.run(server.handle('GET', '/complete?q=hello', b''))
+    assert status == 500 and 'broken pool' in payload['error']
+    assert asyncio.run(server.handle('GET', '/stats', b''))[1]['errors'] == 1
+
+
+def test_changed_source_file_is_a_server_error(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text("hello world\nhello there\n", encoding='utf-8')
+    trie_tree, store = Trie(), OffsetSentenceStore()
+    read_files(trie_tree, str(tmp_path), store, 0)
+    server = completion_server.CompletionServer(trie_tree, store, workers=0)
+    try:
+        assert asyncio.run(server.handle('GET', '/complete?q=hello%20w', b''))[0] == 200
+        status = os.stat(path)
+        path.write_text("goodbye world\n", encoding='utf-8')
+        os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns + 1))
+        store.close()  # the change is noticed when the file is mapped again
+        status, payload = asyncio.run(server.handle('GET', '/complete?q=hello%20t', b''))
+        assert status == 500
+        assert 'changed' in payload['error']
+    finally:
+        server.close()
+
+
+def test_worker_processes_are_forked_before_serving(server):
+    children = len(multiprocessing.active_children())
+    pooled = completion_server.CompletionServer(server.trie_tree, server.data_list, workers=2, session_workers=1)
+    try:
+        assert len(multiprocessing.active_children()) == children + 3
+    finally:
+        pooled.close()
@@ -0,0 +1,128 @@
+import os
+
+import pytest
+from read_to_trie import read_files
+from search.search_completions import compute_best_k_completion
+from snapshot import PREAMBLE, SnapshotError, open_snapshot, write_snapshot
+from trie import Trie
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    data = tmp_path / 'data'
+    (data / 'nested').mkdir(parents=True)
+    (data / 'a.txt').write_text("Hello, world!\nThe quick brown fox.\n\nhello again world\n", encoding='utf-8')
+    (data / 'nested' / 'b.txt').write_text("Machine learning is fun\nthe world of python\n", encoding='utf-8')
+    return str(data)
+
+
+def build(corpus):
+    trie_tree, data_list = Trie(), []
+    read_files(trie_tree, corpus, data_list, 0)
+    return trie_tree, data_list
+
+
+def completions(query, trie_tree, data_list):
+    return [(data.completed_sentence, data.offset) for data in compute_best_k_completion(query, trie_tree, data_list)]
+
+
+def test_snapshot_round_trip(corpus, tmp_path):
+    trie_tree, data_list = build(corpus)
+    snapshot_path = str(tmp_path / 'index.snap')
+    write_snapshot(trie_tree, data_list, snapshot_path, corpus)
+
+    mapped_trie, store = open_snapshot(snapshot_path, corpus)
+    for word in ['hello', 'world', 'the', 'python', 'missing', 'hel']:
+        assert mapped_trie.search(word) == trie_tree.search(word)
+    assert mapped_trie.add_letter('wrld', 1) == ['world']
+    assert len(store) == len(data_list)
+    for file_id, lines in enumerate(data_list):
+        assert [store[file_id][sentence_id] for sentence_id in range(len(store[file_id]))] == lines
+    with pytest.raises(TypeError):
+        mapped_trie.insert('new', 0, 0, 0)
+
+
+def test_snapshot_rejected_when_source_changes(corpus, tmp_path):
+    snapshot_path = str(tmp_path / 'index.snap')
+    write_snapshot(*build(corpus), snapshot_path, corpus)
+    with open(os.path.join(corpus, 'c.txt'), 'w', encoding='utf-8') as file:
+        file.write("a brand new file\n")
+    with pytest.raises(SnapshotError):
+        open_snapshot(snapshot_path, corpus)
+
+
+def test_file_changed_while_read_makes_the_snapshot_stale(corpus, tmp_path, monkeypatch):
+    cli = pytest.importorskip('cli_interface.cli')
+    snapshot_path = str(tmp_path / 'index.snap')
+    read = cli.read_files
+
+    def read_then_change(*args):
+        result = read(*args)
+        path = os.path.join(corpus, 'a.txt')
+        status = os.stat(path)
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write("written while it was read\n")
+        os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns + 1))
+        return result
+
+    monkeypatch.setattr(cli, 'read_files', read_then_change)
+    cli.init_db(corpus, snapshot_path=snapshot_path)
+    with pytest.raises(SnapshotError):
+        open_snapshot(snapshot_path, corpus)
+
+
+def test_corrupt_header_is_rejected(corpus, tmp_path):
+    snapshot_path = tmp_path / 'index.snap'
+    write_snapshot(*build(corpus), str(snapshot_path), corpus)
+    content = snapshot_path.read_bytes()
+    header_length = PREAMBLE.unpack_from(content)[2]
+    header_end = PREAMBLE.size + header_length
+    headers = [b'{"sections": {}}', b'{"fingerprint": "", "sections": []}',
+               b'{"fingerprint": "", "sections": {"base": 5}}', b'{"fingerprint": "", "sections": {"base": [0, 8]}}']
+    corrupt = [content[:header_end - 10],
+               content[:PREAMBLE.size] + b'\xff' + content[PREAMBLE.size + 1:],
+               content[:header_end + 8]]
+    corrupt += [content[:PREAMBLE.size] + header.ljust(header_length) + content[header_end:] for header in headers]
+    for data in corrupt:
+        snapshot_path.write_bytes(data)
+        with pytest.raises(SnapshotError):
+            open_snapshot(str(snapshot_path))
+
+
+def test_init_db_rebuilds_stale_snapshot(corpus, tmp_path):
+    init_db = pytest.importorskip('cli_interface.cli').init_db
+    snapshot_path = str(tmp_path / 'index.snap')
+    trie_tree, _ = init_db(corpus, snapshot_path=snapshot_path)
+    assert isinstance(trie_tree, Trie)
+    mapped_trie, store = init_db(corpus, snapshot_path=snapshot_path)
+    assert mapped_trie.search('fox') == trie_tree.search('fox')
+    with open(os.path.join(corpus, 'c.txt'), 'w', encoding='utf-8') as file:
+        file.write("a brand new fox\n")
+    trie_tree, data_list = init_db(corpus, snapshot_path=snapshot_path)
+    assert len(trie_tree.search('fox')) == 2
+    assert len(data_list) == 3
+    with open(snapshot_path, 'r+b') as file:
+        file.seek(PREAMBLE.size)
+        file.write(b'not json')
+    trie_tree, _ = init_db(corpus, snapshot_path=snapshot_path)
+    assert len(trie_tree.search('fox')) == 2
+    assert open_snapshot(snapshot_path, corpus)[0].search('fox') == trie_tree.search('fox')
+
+
+def test_compressed_snapshot_round_trip(tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    (data / 'a.txt').write_text(''.join(f"the quick fox {row}\n" if row % 3 else "the lazy dog of the fox\n"
+                                        for row in range(1000)), encoding='utf-8')
+    trie_tree, data_list = build(str(data))
+    plain_path, compressed_path = str(tmp_path / 'plain.snap'), str(tmp_path / 'compressed.snap')
+    write_snapshot(trie_tree, data_list, plain_path, str(data))
+    write_snapshot(trie_tree, data_list, compressed_path, str(data), compress=True)
+    assert os.path.getsize(compressed_path) < os.path.getsize(plain_path)
+
+    mapped_trie, store = open_snapshot(compressed_path, str(data))
+    for word in ['the', 'fox', 'quick', 'lazy', '7', 'missing']:
+        assert mapped_trie.search(word) == trie_tree.search(word)
+    assert mapped_trie.index_stats()['postings'] == trie_tree.index_stats()['postings']
+    for query in ['the quick f', 'the lazy dog', 'fox 99', 'dog of th']:
+        assert completions(query, mapped_trie, store) == completions(query, trie_tree, data_list)
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+from compact_trie import CompactTrie
+from search.search_completions import correction_candidates
+from symspell import SymSpellIndex
+from trie import ADD, Edit, Trie
+
+
+@pytest.fixture
+def trie_tree():
+    random.seed(11)
+    trie_tree = CompactTrie()
+    for row in range(1500):
+        trie_tree.insert(''.join(random.choice('abcde1') for _ in range(random.randint(1, 8))), 0, row, 0)
+    return trie_tree
+
+
+@pytest.mark.parametrize('max_distance', [1, 2])
+def test_same_candidates_as_trie_walk(trie_tree, max_distance):
+    symspell = SymSpellIndex.from_trie(trie_tree, max_distance)
+    queries = list(trie_tree.words())[:150] + ['abcdeab', 'e', 'zzz', '1a1a1a']
+    for word in queries:
+        assert set(symspell.edit_candidates(word, max_distance)) == set(trie_tree.edit_candidates(word, max_distance))
+        assert correction_candidates(word, symspell, max_distance) == correction_candidates(word, trie_tree, max_distance)
+
+
+def test_edit_helpers(trie_tree):
+    symspell = SymSpellIndex.from_trie(trie_tree)
+    for word in list(trie_tree.words())[:100]:
+        for index in range(len(word) + 1):
+            assert symspell.add_letter(word, index) == sorted(trie_tree.add_letter(word, index))
+            assert symspell.change_letter(word, index) == sorted(trie_tree.change_letter(word, index))
+            assert symspell.remove_letter(word, index) == trie_tree.remove_letter(word, index)
+
+
+def test_rebuilds_after_trie_changes():
+    trie_tree = Trie()
+    trie_tree.insert('hello', 0, 0, 0)
+    symspell = SymSpellIndex.from_trie(trie_tree)
+    assert set(symspell.edit_candidates('helo')) == {('hello', (Edit(ADD, 2),)), ('hello', (Edit(ADD, 3),))}
+    trie_tree.insert('halo', 0, 1, 0)
+    assert {word for word, _ in symspell.edit_candidates('helo')} == {'hello', 'halo'}
+    with pytest.raises(ValueError):
+        symspell.edit_candidates('helo', 2)
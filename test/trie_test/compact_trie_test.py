@@ -0,0 +1,47 @@
+import random
+
+import pytest
+from compact_trie import CompactTrie
+from trie import Trie
+
+WORDS = ['hello', 'help', 'helm', 'world', 'word', 'python', 'pyhon', 'ython', 'a', 'ab', 'b2b', '42']
+
+
+@pytest.fixture
+def tries():
+    random.seed(7)
+    vocabulary = WORDS + [''.join(random.choice('abcdefgh0123') for _ in range(random.randint(1, 7)))
+                          for _ in range(2000)]
+    trie_tree, compact_trie = Trie(), CompactTrie(initial_size=8)
+    for row, word in enumerate(vocabulary):
+        trie_tree.insert(word, 1, row, 0)
+        compact_trie.insert(word, 1, row, 0)
+    return vocabulary, trie_tree, compact_trie
+
+
+def test_search_matches_trie(tries):
+    vocabulary, trie_tree, compact_trie = tries
+    for word in vocabulary + ['missing', 'hel', 'zz']:
+        assert compact_trie.search(word) == trie_tree.search(word)
+
+
+def test_edit_helpers_match_trie(tries):
+    vocabulary, trie_tree, compact_trie = tries
+    for word in vocabulary[:300]:
+        for index in range(len(word)):
+            assert sorted(compact_trie.add_letter(word, index)) == sorted(trie_tree.add_letter(word, index))
+            assert sorted(compact_trie.change_letter(word, index)) == sorted(trie_tree.change_letter(word, index))
+            assert compact_trie.remove_letter(word, index) == trie_tree.remove_letter(word, index)
+
+
+def test_search_from(tries):
+    _, _, compact_trie = tries
+    node = compact_trie.search_from(compact_trie.root, 'hel')
+    assert node is not None
+    assert compact_trie.is_word(compact_trie.search_from(node, 'lo'))
+    assert compact_trie.search_from(node, 'x') is None
+
+
+def test_memory_usage_is_smaller(tries):
+    _, trie_tree, compact_trie = tries
+    assert compact_trie.memory_usage() < trie_tree.memory_usage()
@@ -0,0 +1,90 @@
+import pytest
+from compact_trie import CompactTrie
+from postings import CompressedKeys
+from trie import ADD, CHANGE, REMOVE, Edit, Trie
+
+
+@pytest.fixture(params=[Trie, CompactTrie])
+def trie_tree(request):
+    trie_tree = request.param()
+    for row, sentence in enumerate(["machine learning", "machine learns", "leap year", "lean", "learned", "le"]):
+        for position, word in enumerate(sentence.split()):
+            trie_tree.insert(word, 0, row, position)
+    return trie_tree
+
+
+def test_search_prefix(trie_tree):
+    assert [index.sentence_id for index in trie_tree.search_prefix('lea')] == [0, 1, 2, 3, 4]
+    assert [index.sentence_id for index in trie_tree.search_prefix('learn')] == [0, 1, 4]
+    assert [index.sentence_id for index in trie_tree.search_prefix('le')] == [0, 1, 2, 3, 4, 5]
+    assert trie_tree.search_prefix('x') == []
+
+
+def test_search_prefix_is_bounded(trie_tree):
+    # breadth first: the shortest completions are kept
+    assert [index.sentence_id for index in trie_tree.search_prefix('le', max_words=2)] == [3, 5]
+    assert trie_tree.search_prefix('le', max_nodes=1) == trie_tree.search('le')
+
+
+def test_build_top_k(trie_tree):
+    trie_tree.build_top_k(k=3, max_depth=2)
+    assert trie_tree.top_k('le', 3) == trie_tree.search_prefix('le')[:3]
+    assert trie_tree.top_k('l', 2) == trie_tree.search_prefix('l')[:2]
+    assert trie_tree.top_k('m', 3) == trie_tree.search_prefix('m')
+    assert trie_tree.top_k('lea', 3) is None  # deeper than max_depth
+    assert trie_tree.top_k('le', 4) is None  # more than k
+    assert trie_tree.top_k('x', 3) == []
+    trie_tree.insert('lazy', 0, 0, 5)
+    assert trie_tree.top_k('l', 2) is None
+
+
+def test_build_top_k_one_location_per_sentence(trie_tree):
+    trie_tree.insert('lean', 0, 3, 1)
+    trie_tree.insert('lean', 0, 3, 2)
+    trie_tree.build_top_k(k=3)
+    assert [index.sentence_id for index in trie_tree.top_k('lean', 3)] == [3]
+    assert [index.sentence_id for index in trie_tree.top_k('lea', 3)] == [0, 1, 2]
+
+
+def test_build_bigrams(trie_tree):
+    data_list = [[["machine", "learning"], ["machine", "learns"], ["leap", "year"], ["lean"], ["learned"], ["le"]]]
+    trie_tree.build_bigrams(data_list, min_count=2)
+    assert trie_tree.bigram_postings('machine', 'learning') is None  # seen once
+    trie_tree.build_bigrams(data_list, min_count=1)
+    assert trie_tree.bigram_postings('machine', 'learning') == trie_tree.search('machine')[:1]
+    assert trie_tree.bigram_postings('learning', 'machine') is None
+    assert trie_tree.bigram_stats()['bigrams'] == 3
+    trie_tree.insert('machine', 0, 6, 0)
+    assert trie_tree.bigram_postings('machine', 'learns') is None  # out of date
+
+
+def test_compress_postings(trie_tree):
+    for row in range(300):
+        trie_tree.insert('lean', row // 100, row, row % 7)
+    expected, expected_prefix = list(trie_tree.search('lean')), trie_tree.search_prefix('lea')
+    assert trie_tree.compress_postings() == 1  # the other lists are short
+    assert isinstance(trie_tree.search('lean').keys, CompressedKeys)
+    assert list(trie_tree.search('lean')) == expected
+    assert trie_tree.search('lean')[150:155] == expected[150:155]
+    assert trie_tree.search_prefix('lea') == expected_prefix
+    trie_tree.insert('lean', 0, 1000, 0)
+    assert len(trie_tree.search('lean')) == 302
+
+
+def test_edit_candidates_match_edit_helpers(trie_tree):
+    for word in ['machne', 'lerning', 'lean', 'leap', 'yeer', 'lx', 'achine', 'e']:
+        expected = set()
+        for index in range(len(word)):
+            expected.update((candidate, (Edit(CHANGE, index),)) for candidate in trie_tree.change_letter(word, index))
+            expected.update((candidate, (Edit(ADD, index),)) for candidate in trie_tree.add_letter(word, index))
+            expected.update((candidate, (Edit(REMOVE, index),)) for candidate in trie_tree.remove_letter(word, index))
+        assert set(trie_tree.edit_candidates(word)) == expected
+
+
+def test_edit_candidates_distance_two(trie_tree):
+    candidates = trie_tree.edit_candidates('lerns', max_distance=2)
+    assert ('learns', (Edit(ADD, 2),)) in candidates
+    assert ('lean', (Edit(CHANGE, 2), Edit(REMOVE, 4))) in candidates
+    assert ('lean', (Edit(ADD, 2), Edit(REMOVE, 2), Edit(REMOVE, 4))) not in candidates
+    assert all(len(edits) <= 2 and word != 'lerns' for word, edits in candidates)
+    assert {word for word, _ in trie_tree.edit_candidates('lerns')} == {'learns'}
@@ -0,0 +1,19 @@
+import re
+
+pattern = r'[^a-zA-Z0-9\s]'
+PATTERN_RE = re.compile(pattern)
+
+# str.translate table doing re.sub(pattern, '', text).lower() on ASCII text: letters are lowered, digits and
+# whitespace kept, everything else deleted
+ASCII_CLEAN_TABLE = {code: (chr(code).lower() if chr(code).isalnum() or chr(code).isspace() else None)
+                     for code in range(128)}
+
+
+def clean_text(text: str) -> str:
+    """
+    Removes the characters that are not letters, digits or whitespace and lowers the letters, like
+    re.sub(pattern, '', text).lower(), with a translation table when the text is ASCII.
+    """
+    if text.isascii():
+        return text.translate(ASCII_CLEAN_TABLE)
+    return PATTERN_RE.sub('', text).lower()
@@ -1,9 +1,25 @@
-from collections import namedtuple
-from typing import List, Union
+import sys
+from array import array
+from collections import deque, namedtuple
+from heapq import merge
+from itertools import chain, islice
+from typing import Dict, Iterator, List, Sequence, Tuple, Union
+
+from instrumentation import METRICS
+from postings import BLOCK_SIZE, POSITION_BITS, PostingList, encode, file_key_range, first_per_sentence
 
 NUM_OF_CHARS = 36
 
-SentenceIndex = namedtuple('SentenceIndex', ['file_id', 'sentence_id', 'position'])
+# an edit of a misspelled word: 'change' replaces the letter at position, 'add' inserts a letter
+# before it and 'remove' deletes it (positions are in the misspelled word)
+Edit = namedtuple('Edit', ['kind', 'position'])
+CHANGE = 'change'
+ADD = 'add'
+REMOVE = 'remove'
+
+# bounds of a prefix search, so a one-letter prefix does not walk the whole trie
+PREFIX_MAX_WORDS = 64
+PREFIX_MAX_NODES = 4096
 
 
 class TrieNode:
@@ -13,7 +29,7 @@ class TrieNode:
 
     def __init__(self):
         self.children: List[Union[TrieNode, None]] = [None] * NUM_OF_CHARS
-        self.word_location: List[SentenceIndex] = []
+        self.word_location: PostingList = PostingList()
         self.isEndOfWord = False
 
 
@@ -22,6 +38,18 @@ class Trie:
     Trie is a data structure for efficient word insertion and searching.
     """
 
+    # bumped whenever a word is inserted or removed, so derived data (top_k, query caches) can tell it is stale
+    version = 0
+    # best locations precomputed by build_top_k, valid while the version is unchanged
+    top_k_size = 0
+    top_k_depth = 0
+    top_k_min_fanout = 0
+    top_k_table = None
+    top_k_version = -1
+    # locations of adjacent word pairs built by build_bigrams, valid while the version is unchanged
+    bigram_table = None
+    bigram_version = -1
+
     def __init__(self):
         self.root = self.get_node()
 
@@ -53,6 +81,32 @@ class Trie:
         else:
             return chr((ord('0') + index - 26))
 
+    def child(self, node: TrieNode, index: int) -> Union[TrieNode, None]:
+        """
+        Returns the child of the given node at the given letter index, or None if there is no such child.
+        """
+        return node.children[index]
+
+    def children(self, node: TrieNode) -> Iterator[Tuple[int, TrieNode]]:
+        """
+        Iterates over the existing children of the given node as (letter index, child) pairs.
+        """
+        for index, child in enumerate(node.children):
+            if child:
+                yield index, child
+
+    def is_word(self, node: TrieNode) -> bool:
+        """
+        Returns True if the given node marks the end of a word.
+        """
+        return node.isEndOfWord
+
+    def locations(self, node: TrieNode) -> PostingList:
+        """
+        Returns the word locations stored on the given node.
+        """
+        return node.word_location
+
     def insert(self, key: str, file_id: int, row_number: int, word_index: int) -> None:
         """
         Inserts a word into the Trie.
@@ -66,6 +120,54 @@ class Trie:
         Returns:
             None
         """
+        self.version += 1
+        self._word_postings(key).add(encode(file_id, row_number, word_index))
+
+    def insert_postings(self, key: str, keys: Sequence[int]) -> PostingList:
+        """
+        Inserts a word into the Trie with many locations at once.
+
+        Args:
+            key (str): The word to be inserted.
+            keys (Sequence[int]): Sorted packed location keys (see postings.encode).
+
+        Returns:
+            PostingList: The locations of the word, which a build can extend later without walking the Trie.
+        """
+        self.version += 1
+        locations = self._word_postings(key)
+        locations.extend(keys)
+        return locations
+
+    def remove_postings(self, key: str, start: int, stop: int) -> None:
+        """
+        Removes the locations of a word whose packed keys are in [start, stop).
+        The word stops being a word when it has no locations left.
+
+        Args:
+            key (str): The word.
+            start (int): The first packed key to remove.
+            stop (int): The packed key after the last one to remove.
+
+        Returns:
+            None
+        """
+        p_crawl = self.search_from(self.root, key)
+        if p_crawl is None or not self.is_word(p_crawl):
+            return
+        locations = self.locations(p_crawl)
+        self.version += 1
+        locations.remove_range(start, stop)
+        if not locations:
+            self._unmark_word(p_crawl)
+
+    def _unmark_word(self, node: TrieNode) -> None:
+        node.isEndOfWord = False
+
+    def _word_postings(self, key: str) -> PostingList:
+        """
+        Returns the posting list of the given word, creating its nodes and marking its end if needed.
+        """
         p_crawl = self.root
         for level in key:
             index = self.char_to_index(level)
@@ -74,10 +176,10 @@ class Trie:
             p_crawl = p_crawl.children[index]
 
         # Mark the last node as the end of the word
-        p_crawl.word_location.append(SentenceIndex(file_id, row_number, word_index))
         p_crawl.isEndOfWord = True
+        return p_crawl.word_location
 
-    def search(self, key: str) -> List[SentenceIndex]:
+    def search(self, key: str) -> PostingList:
         """
         Searches for a word in the Trie.
 
@@ -85,16 +187,331 @@ class Trie:
             key (str): The word to be searched.
 
         Returns:
-            List[SentenceIndex]: A list of SentenceIndex named-tuples representing
+            PostingList: A sorted list of SentenceIndex named-tuples representing
             the locations where the word is found.
         """
-        p_crawl = self.root
-        for level in key:
-            index = self.char_to_index(level)
-            if not p_crawl.children[index]:
-                return []
-            p_crawl = p_crawl.children[index]
-        return p_crawl.word_location
+        p_crawl = self.search_from(self.root, key)
+        if p_crawl is None:
+            return PostingList()
+        return self.locations(p_crawl)
+
+    def words(self) -> Iterator[str]:
+        """
+        Iterates over all the words in the Trie, in alphabetical order (letters before digits).
+        """
+        stack = [(self.root, '')]
+        while stack:
+            node, word = stack.pop()
+            if self.is_word(node):
+                yield word
+            stack.extend((child, word + self.index_to_char(index))
+                         for index, child in reversed(list(self.children(node))))
+
+    def search_prefix(self, prefix: str, max_words: int = PREFIX_MAX_WORDS,
+                      max_nodes: int = PREFIX_MAX_NODES) -> PostingList:
+        """
+        Searches for all the words that start with a prefix in the Trie.
+
+        The words are visited breadth first, so the shortest completions (the prefix itself first) are
+        collected before the search stops at max_words words or max_nodes visited nodes.
+
+        Args:
+            prefix (str): The beginning of the words to be searched.
+            max_words (int): The maximum number of words whose locations are collected.
+            max_nodes (int): The maximum number of nodes visited.
+
+        Returns:
+            PostingList: The sorted locations of all the collected words.
+        """
+        found = self.prefix_postings(prefix, max_words, max_nodes)
+        if not found:
+            return PostingList()
+        if len(found) == 1:
+            return found[0]
+        return PostingList(array('Q', sorted(chain.from_iterable(locations.keys for locations in found))))
+
+    def prefix_postings(self, prefix: str, max_words: int = PREFIX_MAX_WORDS,
+                        max_nodes: int = PREFIX_MAX_NODES) -> List[PostingList]:
+        """
+        Returns the posting list of every word that starts with a prefix, without merging them.
+
+        The words are collected like in search_prefix.
+
+        Args:
+            prefix (str): The beginning of the words to be searched.
+            max_words (int): The maximum number of words whose locations are collected.
+            max_nodes (int): The maximum number of nodes visited.
+
+        Returns:
+            List[PostingList]: The locations of each collected word.
+        """
+        p_crawl = self.search_from(self.root, prefix)
+        if p_crawl is None:
+            return []
+        return self.postings_below(p_crawl, max_words, max_nodes)[0]
+
+    def prefix_words(self, prefix: str, max_words: int = PREFIX_MAX_WORDS,
+                     max_nodes: int = PREFIX_MAX_NODES) -> List[str]:
+        """
+        Returns the words that start with a prefix, collected like in prefix_postings.
+
+        Args:
+            prefix (str): The beginning of the words to be searched.
+            max_words (int): The maximum number of words collected.
+            max_nodes (int): The maximum number of nodes visited.
+
+        Returns:
+            List[str]: The collected words, in breadth first order (see breadth_first_key).
+        """
+        p_crawl = self.search_from(self.root, prefix)
+        if p_crawl is None:
+            return []
+        found = []
+        queue = deque([(p_crawl, prefix)])
+        visited = 0
+        while queue and len(found) < max_words and visited < max_nodes:
+            p_crawl, word = queue.popleft()
+            visited += 1
+            if self.is_word(p_crawl):
+                found.append(word)
+            queue.extend((child, word + self.index_to_char(index)) for index, child in self.children(p_crawl))
+        return found
+
+    @classmethod
+    def breadth_first_key(cls, word: str) -> Tuple[int, List[int]]:
+        """
+        Returns the order in which a prefix search visits a word: the shorter words first, then by letter index.
+        """
+        return len(word), [cls.char_to_index(ch) for ch in word]
+
+    def postings_below(self, node: TrieNode, max_words: int = PREFIX_MAX_WORDS,
+                       max_nodes: int = PREFIX_MAX_NODES) -> Tuple[List[PostingList], bool]:
+        """
+        Returns the posting list of every word below a node (the node itself first), breadth first.
+
+        Args:
+            node (TrieNode): The node of the beginning of the words.
+            max_words (int): The maximum number of words whose locations are collected.
+            max_nodes (int): The maximum number of nodes visited.
+
+        Returns:
+            Tuple[List[PostingList], bool]: The locations of each collected word, and whether every word
+            below the node was collected.
+        """
+        found = []
+        queue = deque([node])
+        visited = 0
+        while queue and len(found) < max_words and visited < max_nodes:
+            node = queue.popleft()
+            visited += 1
+            if self.is_word(node):
+                found.append(self.locations(node))
+            queue.extend(child for _, child in self.children(node))
+        return found, not queue
+
+    def build_top_k(self, k: int = 5, max_depth: int = 4, min_fanout: int = 0) -> None:
+        """
+        Precomputes the best k locations of the words below every node near the root.
+
+        Completions with the same prefix all get the same score, so the best ones are the first
+        locations in (file_id, sentence_id, position) order, one per sentence. They are merged
+        bottom-up in one pass: a node keeps the first k sentences of its own locations and of the
+        best k of each child. A node with more words below it than search_prefix collects keeps the best
+        of the words search_prefix collects instead, so a query gets the same completions with the table.
+
+        Args:
+            k (int): The number of locations kept per node.
+            max_depth (int): Only nodes up to this prefix length keep their locations.
+            min_fanout (int): Only nodes with at least this many children keep their locations.
+
+        Returns:
+            None
+        """
+        with METRICS.timer('trie.build_top_k'):
+            table = self._top_k_table(k, max_depth, min_fanout)
+        METRICS.set_gauge('trie.top_k_nodes', len(table))
+        self.top_k_size = k
+        self.top_k_depth = max_depth
+        self.top_k_min_fanout = min_fanout
+        self.top_k_table = table
+        self.top_k_version = self.version
+
+    def _top_k_table(self, k: int, max_depth: int, min_fanout: int) -> Dict:
+        table = {}
+        pending = {}
+        # the number of words and of nodes below every node, to tell the prefixes a search_prefix does not cover
+        sizes = {}
+        stack = [(self.root, 0, False)]
+        while stack:
+            node, depth, merged = stack.pop()
+            children = [child for _, child in self.children(node)]
+            if not merged:
+                stack.append((node, depth, True))
+                stack.extend((child, depth + 1, False) for child in children)
+                continue
+            own = first_per_sentence(self.locations(node).keys) if self.is_word(node) else ()
+            best = list(islice(first_per_sentence(merge(own, *(pending.pop(child) for child in children))), k))
+            pending[node] = best
+            words, nodes = int(self.is_word(node)), 1
+            for child in children:
+                child_words, child_nodes = sizes.pop(child)
+                words += child_words
+                nodes += child_nodes
+            sizes[node] = (words, nodes)
+            if depth <= max_depth and len(children) >= min_fanout:
+                if words > PREFIX_MAX_WORDS or nodes > PREFIX_MAX_NODES:
+                    # like a query without the table: only the words a bounded prefix search collects are ranked
+                    found, _ = self.postings_below(node)
+                    best = list(islice(first_per_sentence(merge(*(locations.keys for locations in found))), k))
+                table[node] = array('Q', best)
+        return table
+
+    def top_k(self, prefix: str, k: int) -> Union[PostingList, None]:
+        """
+        Returns the precomputed best k locations of the words that start with a prefix.
+
+        Args:
+            prefix (str): The beginning of the words.
+            k (int): The number of locations wanted.
+
+        Returns:
+            PostingList: The best locations (fewer than k if there are no more), or None if they
+            were not precomputed for this prefix.
+        """
+        if not self.top_k_table or k > self.top_k_size or self.top_k_version != self.version:
+            return None
+        p_crawl = self.search_from(self.root, prefix)
+        if p_crawl is None:
+            return PostingList()
+        best = self.top_k_table.get(p_crawl)
+        return PostingList(best[:k]) if best is not None else None
+
+    def compress_postings(self, min_length: int = BLOCK_SIZE) -> int:
+        """
+        Stores the long posting lists in compressed blocks (see postings.CompressedKeys).
+
+        The lists of the common words hold most of the locations; they are kept in about half the
+        memory and searched by decoding only the blocks a query reaches. A short list is left as it is,
+        as its blocks would cost more than they save. A list that changes is decompressed, so this is
+        best called once the index is built.
+
+        Args:
+            min_length (int): The fewest locations of a compressed list.
+
+        Returns:
+            int: The number of lists compressed.
+        """
+        compressed = 0
+        with METRICS.timer('trie.compress_postings'):
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                if self.is_word(node):
+                    locations = self.locations(node)
+                    if len(locations) >= min_length:
+                        locations.compress()
+                        compressed += 1
+                stack.extend(child for _, child in self.children(node))
+        METRICS.set_gauge('trie.compressed_lists', compressed)
+        return compressed
+
+    def build_bigrams(self, data_list: Sequence[Sequence[Sequence[str]]], min_count: int = 1000) -> None:
+        """
+        Indexes the locations of the frequent pairs of adjacent words.
+
+        A phrase of two common words is then found in the (short) list of the locations of the pair
+        instead of intersecting the (long) lists of the two words. A pair is indexed when it occurs at
+        least min_count times; its words then occur at least min_count times too, so only the pairs of
+        such words are counted. A larger min_count keeps fewer pairs, in less memory.
+
+        Args:
+            data_list: The sentences the Trie was built from, as data_list[file_id][sentence_id] -> words.
+            min_count (int): The fewest occurrences of an indexed pair.
+
+        Returns:
+            None
+        """
+        with METRICS.timer('trie.build_bigrams'):
+            frequent = {word for word in self.words() if len(self.search(word)) >= min_count}
+            table = {}
+            for file_id, sentences in enumerate(data_list):
+                for sentence_id, words in enumerate(sentences):
+                    # like read_to_trie.indexed_words, only the words whose position fits in a key are indexed
+                    words = words[:1 << POSITION_BITS]
+                    key = None
+                    for position, pair in enumerate(zip(words, words[1:])):
+                        if pair[0] in frequent and pair[1] in frequent:
+                            if key is None:
+                                key = encode(file_id, sentence_id, 0)
+                            keys = table.get(pair)
+                            if keys is None:
+                                keys = table[pair] = array('Q')
+                            keys.append(key + position)
+            table = {pair: PostingList(keys) for pair, keys in table.items() if len(keys) >= min_count}
+        METRICS.set_gauge('trie.bigrams', len(table))
+        self.bigram_table = table
+        self.bigram_version = self.version
+
+    def bigram_postings(self, first: str, second: str) -> Union[PostingList, None]:
+        """
+        Returns the locations of the first word of a pair of adjacent words.
+
+        Args:
+            first (str): The first word.
+            second (str): The word right after it.
+
+        Returns:
+            PostingList: The locations, or None if the pair is not indexed (see build_bigrams).
+        """
+        if not self.bigram_table or self.bigram_version != self.version:
+            return None
+        return self.bigram_table.get((first, second))
+
+    def update_bigrams(self, changes: Sequence[Tuple[int, Sequence[Sequence[str]], Sequence[Sequence[str]]]]) -> None:
+        """
+        Brings the indexed pairs of words up to date with changed files, once their words were updated.
+
+        The locations of the indexed pairs in the old sentences of a file are replaced by their locations in
+        its new sentences. Only the pairs already indexed are kept up to date: a pair that became frequent is
+        indexed by the next build_bigrams, and a pair that became rare keeps its (exact) locations.
+
+        Args:
+            changes: The file id, the old sentences and the new sentences of every changed file.
+
+        Returns:
+            None
+        """
+        table = self.bigram_table
+        if table is None:
+            return
+        with METRICS.timer('trie.update_bigrams'):
+            for file_id, old_sentences, new_sentences in changes:
+                start, stop = file_key_range(file_id)
+                for pair in set(pair for words in old_sentences for pair in zip(words, words[1:])):
+                    postings = table.get(pair)
+                    if postings is not None:
+                        postings.remove_range(start, stop)
+                added = {}
+                for sentence_id, words in enumerate(new_sentences):
+                    words = words[:1 << POSITION_BITS]
+                    for position, pair in enumerate(zip(words, words[1:])):
+                        if pair in table:
+                            keys = added.get(pair)
+                            if keys is None:
+                                keys = added[pair] = array('Q')
+                            keys.append(encode(file_id, sentence_id, position))
+                for pair, keys in added.items():
+                    table[pair].extend(keys)
+        self.bigram_version = self.version
+
+    def bigram_stats(self) -> Dict[str, int]:
+        """
+        Counts the indexed pairs of words and their locations, and estimates their bytes.
+        """
+        table = self.bigram_table or {}
+        return {'bigrams': len(table), 'bigram_postings': sum(map(len, table.values())),
+                'bigram_bytes': sys.getsizeof(table) + sum(sys.getsizeof(pair) + sys.getsizeof(postings.keys)
+                                                           for pair, postings in table.items())}
 
     def search_from(self, node: TrieNode, word: str) -> Union[TrieNode, None]:
         """
@@ -108,12 +525,55 @@ class Trie:
             TrieNode: The TrieNode corresponding to the end of the given word, or None if not found.
         """
         for level in word:
-            index = self.char_to_index(level)
-            if not node.children[index]:
+            node = self.child(node, self.char_to_index(level))
+            if node is None:
                 return None
-            node = node.children[index]
         return node
 
+    def edit_candidates(self, key: str, max_distance: int = 1) -> List[Tuple[str, Tuple[Edit, ...]]]:
+        """
+        Finds the words within max_distance edits of the given word in a single walk of the Trie.
+
+        The walk follows the letters of the word and, while edits are left, also branches into the
+        letter changes, added letters and removed letters at the current position. Like add_letter,
+        a letter is never added after the last letter of the word.
+
+        Args:
+            key (str): The (possibly misspelled) word.
+            max_distance (int): The maximum number of edits.
+
+        Returns:
+            List[Tuple[str, Tuple[Edit, ...]]]: The words found with the edits that lead to them.
+            A word reached by different edits is listed once per distinct edit sequence.
+        """
+        found = []
+        self._edit_walk(key, self.root, 0, max_distance, '', (), found)
+        return found
+
+    def _edit_walk(self, key: str, node, position: int, budget: int, prefix: str,
+                   edits: Tuple[Edit, ...], found: List) -> None:
+        if budget == 0:
+            # no edits left: the rest of the word must follow exactly
+            node = self.search_from(node, key[position:])
+            if node is not None and self.is_word(node) and prefix + key[position:] != key:
+                found.append((prefix + key[position:], edits))
+            return
+        if position == len(key):
+            if edits and prefix != key and self.is_word(node):
+                found.append((prefix, edits))
+            return
+        letter_index = self.char_to_index(key[position])
+        child = self.child(node, letter_index)
+        if child is not None:
+            self._edit_walk(key, child, position + 1, budget, prefix + key[position], edits, found)
+        self._edit_walk(key, node, position + 1, budget - 1, prefix, edits + (Edit(REMOVE, position),), found)
+        for index, child in self.children(node):
+            letter = self.index_to_char(index)
+            self._edit_walk(key, child, position, budget - 1, prefix + letter, edits + (Edit(ADD, position),), found)
+            if index != letter_index:
+                self._edit_walk(key, child, position + 1, budget - 1, prefix + letter,
+                                edits + (Edit(CHANGE, position),), found)
+
     def add_letter(self, key: str, index: int) -> List[str]:
         """
         Adds a letter at a specific index in the given word and returns a list of valid words.
@@ -129,12 +589,12 @@ class Trie:
             return []
         words = []
         p_crawl = self.search_from(self.root, key[:index])
-        for letter_index in range(NUM_OF_CHARS):
-            if p_crawl and p_crawl.children[letter_index]:
-                p_crawl_temp = p_crawl.children[letter_index]
-                p_crawl_temp = self.search_from(p_crawl_temp, key[index:])
-                if p_crawl_temp and p_crawl_temp.isEndOfWord:
-                    words.append(key[:index] + self.index_to_char(letter_index) + key[index:])
+        if p_crawl is None:
+            return []
+        for letter_index, p_crawl_temp in self.children(p_crawl):
+            p_crawl_temp = self.search_from(p_crawl_temp, key[index:])
+            if p_crawl_temp is not None and self.is_word(p_crawl_temp):
+                words.append(key[:index] + self.index_to_char(letter_index) + key[index:])
         return words
 
     def change_letter(self, key: str, index: int) -> List[str]:
@@ -152,14 +612,14 @@ class Trie:
             return []
         words = []
         p_crawl = self.search_from(self.root, key[:index])
-        for letter_index in range(NUM_OF_CHARS):
+        if p_crawl is None:
+            return []
+        for letter_index, p_crawl_temp in self.children(p_crawl):
             if letter_index == self.char_to_index(key[index]):
                 continue
-            if p_crawl and p_crawl.children[letter_index]:
-                p_crawl_temp = p_crawl.children[letter_index]
-                p_crawl_temp = self.search_from(p_crawl_temp, key[index + 1:])
-                if p_crawl_temp and p_crawl_temp.isEndOfWord:
-                    words.append(key[:index] + self.index_to_char(letter_index) + key[index + 1:])
+            p_crawl_temp = self.search_from(p_crawl_temp, key[index + 1:])
+            if p_crawl_temp is not None and self.is_word(p_crawl_temp):
+                words.append(key[:index] + self.index_to_char(letter_index) + key[index + 1:])
         return words
 
     def remove_letter(self, key: str, index: int) -> List[str]:
@@ -178,3 +638,34 @@ class Trie:
         if self.search(key[:index] + key[index + 1:]):
             return [key[:index] + key[index + 1:]]
         return []
+
+    def memory_usage(self) -> int:
+        """
+        Estimates the memory used by the Trie, in bytes.
+
+        Returns:
+            int: The sum of the `*_bytes` entries of index_stats.
+        """
+        return sum(value for name, value in self.index_stats().items() if name.endswith('_bytes'))
+
+    def index_stats(self) -> Dict[str, int]:
+        """
+        Counts the nodes, words and stored locations of the Trie and estimates the bytes of each structure.
+
+        Returns:
+            Dict[str, int]: nodes, words and postings, node_bytes (the nodes and their children lists)
+            and posting_bytes (the posting lists).
+        """
+        nodes = words = postings = node_bytes = posting_bytes = 0
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            node_bytes += sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node.children)
+            posting_bytes += sys.getsizeof(node.word_location) + sys.getsizeof(node.word_location.keys)
+            if node.isEndOfWord:
+                words += 1
+                postings += len(node.word_location)
+            stack.extend(child for child in node.children if child)
+        return {'nodes': nodes, 'words': words, 'postings': postings, 'node_bytes': node_bytes,
+                'posting_bytes': posting_bytes}